@@ -5,7 +5,10 @@ from sqlalchemy import engine_from_config, pool
 
 from app.core.config import settings
 from app.db.base import Base
+from app.db.urls import sync_database_url
 from app.models.user import User
+from app.models.avatar import AvatarObject
+from app.models.refresh_session import RefreshSession
 from app.models.userspace import UserSpace
 
 config = context.config
@@ -13,7 +16,7 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
-config.set_main_option("sqlalchemy.url", settings.database_url)
+config.set_main_option("sqlalchemy.url", sync_database_url(settings.database_url))
 
 target_metadata = Base.metadata
 
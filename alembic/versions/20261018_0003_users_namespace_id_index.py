@@ -0,0 +1,24 @@
+"""Add composite (namespace, id) index for keyset export
+
+Revision ID: 20261018_0003
+Revises: 20260207_0002
+Create Date: 2026-10-18
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "20261018_0003"
+down_revision: Union[str, Sequence[str], None] = "20260207_0002"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_namespace_id", "users", ["namespace", "id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_namespace_id", table_name="users")
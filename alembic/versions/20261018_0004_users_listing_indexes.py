@@ -0,0 +1,24 @@
+"""Add composite (namespace, is_active, id) index for user listing
+
+Revision ID: 20261018_0004
+Revises: 20261018_0003
+Create Date: 2026-10-18
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+
+revision: str = "20261018_0004"
+down_revision: Union[str, Sequence[str], None] = "20261018_0003"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index("ix_users_namespace_is_active_id", "users", ["namespace", "is_active", "id"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index("ix_users_namespace_is_active_id", table_name="users")
@@ -0,0 +1,35 @@
+"""Add avatar_objects table for content-addressed avatar reference counts
+
+Revision ID: 20261018_0005
+Revises: 20261018_0004
+Create Date: 2026-10-18
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20261018_0005"
+down_revision: Union[str, Sequence[str], None] = "20261018_0004"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "avatar_objects",
+        sa.Column("digest", sa.String(length=64), nullable=False),
+        sa.Column("extension", sa.String(length=8), nullable=False),
+        sa.Column("size_bytes", sa.Integer(), nullable=False),
+        sa.Column("refcount", sa.Integer(), nullable=False, server_default="0"),
+        sa.Column("created_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now()),
+        sa.PrimaryKeyConstraint("digest"),
+    )
+    op.create_index(op.f("ix_avatar_objects_refcount"), "avatar_objects", ["refcount"], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f("ix_avatar_objects_refcount"), table_name="avatar_objects")
+    op.drop_table("avatar_objects")
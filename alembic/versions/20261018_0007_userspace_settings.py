@@ -0,0 +1,40 @@
+"""Add namespace-scoped settings and updated_at to userspaces
+
+Revision ID: 20261018_0007
+Revises: 20261018_0006
+Create Date: 2026-10-18
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20261018_0007"
+down_revision: Union[str, Sequence[str], None] = "20261018_0006"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Batch mode, because SQLite cannot add a column with a non-constant default in place.
+    with op.batch_alter_table("userspaces") as batch_op:
+        batch_op.add_column(sa.Column("registration_open", sa.Boolean(), nullable=False, server_default=sa.true()))
+        batch_op.add_column(sa.Column("access_token_expire_minutes", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("refresh_token_expire_days", sa.Integer(), nullable=True))
+        batch_op.add_column(sa.Column("avatar_max_bytes", sa.Integer(), nullable=True))
+        batch_op.add_column(
+            sa.Column("updated_at", sa.DateTime(timezone=True), nullable=False, server_default=sa.func.now())
+        )
+        batch_op.create_index(batch_op.f("ix_userspaces_updated_at"), ["updated_at"], unique=False)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("userspaces") as batch_op:
+        batch_op.drop_index(batch_op.f("ix_userspaces_updated_at"))
+        batch_op.drop_column("updated_at")
+        batch_op.drop_column("avatar_max_bytes")
+        batch_op.drop_column("refresh_token_expire_days")
+        batch_op.drop_column("access_token_expire_minutes")
+        batch_op.drop_column("registration_open")
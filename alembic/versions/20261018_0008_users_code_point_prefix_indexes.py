@@ -0,0 +1,32 @@
+"""Add (namespace, username/email COLLATE "C") indexes for prefix listing on PostgreSQL
+
+Revision ID: 20261018_0008
+Revises: 20261018_0007
+Create Date: 2026-10-18
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20261018_0008"
+down_revision: Union[str, Sequence[str], None] = "20261018_0007"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # SQLite compares text in code point order already, so the unique indexes serve it.
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.create_index("ix_users_namespace_username_c", "users", ["namespace", sa.text('username COLLATE "C"')], unique=False)
+    op.create_index("ix_users_namespace_email_c", "users", ["namespace", sa.text('email COLLATE "C"')], unique=False)
+
+
+def downgrade() -> None:
+    if op.get_bind().dialect.name != "postgresql":
+        return
+    op.drop_index("ix_users_namespace_email_c", table_name="users")
+    op.drop_index("ix_users_namespace_username_c", table_name="users")
@@ -0,0 +1,27 @@
+"""Mark refresh sessions started from a pre-session refresh token
+
+Revision ID: 20261018_0009
+Revises: 20261018_0008
+Create Date: 2026-10-18
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = "20261018_0009"
+down_revision: Union[str, Sequence[str], None] = "20261018_0008"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table("refresh_sessions") as batch_op:
+        batch_op.add_column(sa.Column("legacy", sa.Boolean(), nullable=False, server_default=sa.false()))
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("refresh_sessions") as batch_op:
+        batch_op.drop_column("legacy")
@@ -1,18 +1,42 @@
-from fastapi import Depends, HTTPException, status
-from fastapi.security import OAuth2PasswordBearer
-from sqlalchemy.orm import Session
+import hmac
 
+from fastapi import Depends, HTTPException, Request, status
+from fastapi.security import APIKeyHeader, OAuth2PasswordBearer
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
 from app.db.session import get_db
 from app.models.user import User
 from app.services.security import decode_token
+from app.services.user_cache import UserSnapshot, user_cache
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/auth/login")
+admin_key_scheme = APIKeyHeader(name="X-Admin-Key", auto_error=False)
 
 
-async def get_current_user(
-    token: str = Depends(oauth2_scheme),
-    db: Session = Depends(get_db),
-) -> User:
+async def require_admin(admin_key: str | None = Depends(admin_key_scheme)) -> None:
+    if not settings.admin_api_key:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Admin API is disabled")
+    if not admin_key or not hmac.compare_digest(admin_key, settings.admin_api_key):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid admin key")
+
+
+def client_ip(request: Request) -> str:
+    """Caller address. Behind `TRUSTED_PROXY_HOPS` proxies, it is read from `X-Forwarded-For`.
+
+    Only the entry added by the outermost trusted proxy is used; entries further left are
+    client-controlled.
+    """
+    hops = settings.trusted_proxy_hops
+    forwarded_for = request.headers.get("x-forwarded-for")
+    if hops > 0 and forwarded_for:
+        addresses = [address.strip() for address in forwarded_for.split(",") if address.strip()]
+        if addresses:
+            return addresses[-min(hops, len(addresses))]
+    return request.client.host if request.client else "unknown"
+
+
+def _decode_access_payload(token: str) -> dict:
     try:
         payload = decode_token(token)
     except ValueError as exc:
@@ -20,12 +44,55 @@ async def get_current_user(
 
     if payload.get("type") != "access":
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token type")
+    return payload
+
+
+async def _decode_access_token(token: str) -> tuple[str | None, int | None]:
+    """Return `(user id, token version)`; tokens of a signed-out session are rejected here."""
+    payload = _decode_access_payload(token)
+    session_id = payload.get("sid")
+    if session_id and await user_cache.is_session_revoked(session_id, payload.get("iat", 0)):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token is no longer valid")
+    return payload.get("sub"), payload.get("ver")
 
-    user_id = payload.get("sub")
-    token_version = payload.get("ver")
-    user = db.query(User).filter(User.id == user_id).first()
+
+def _ensure_token_valid_for(user: User | UserSnapshot | None, token_version: int | None) -> None:
     if not user or not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
     if token_version != user.token_version:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Token is no longer valid")
+
+
+def get_current_session_id(token: str = Depends(oauth2_scheme)) -> str | None:
+    """Refresh session the caller's access token was issued for; use after an auth dependency."""
+    return _decode_access_payload(token).get("sid")
+
+
+async def get_current_user(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+) -> User:
+    """Load the caller's row from the database; use this for routes that modify the user."""
+    user_id, token_version = await _decode_access_token(token)
+    user = await db.get(User, user_id)
+    _ensure_token_valid_for(user, token_version)
     return user
+
+
+async def get_current_user_snapshot(
+    token: str = Depends(oauth2_scheme),
+    db: AsyncSession = Depends(get_db),
+) -> UserSnapshot:
+    """Authorize the caller from the user cache, falling back to the database on a miss.
+
+    Revocation (logout, password change) invalidates the entry on every worker through
+    the cache backend; `USER_CACHE_TTL_SECONDS` bounds how stale an entry can be otherwise.
+    """
+    user_id, token_version = await _decode_access_token(token)
+    snapshot = await user_cache.get(user_id) if user_id else None
+    if snapshot is None:
+        generation = await user_cache.generation(user_id)
+        user = await db.get(User, user_id)
+        snapshot = await user_cache.set(user, generation) if user else None
+    _ensure_token_valid_for(snapshot, token_version)
+    return snapshot
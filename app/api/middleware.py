@@ -0,0 +1,102 @@
+import logging
+import time
+
+from starlette.datastructures import MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.core.config import settings
+from app.core.metrics import (
+    DB_QUERIES_PER_REQUEST,
+    DB_TIME_PER_REQUEST,
+    HTTP_REQUEST_DURATION,
+    HTTP_REQUESTS,
+    HTTP_REQUESTS_IN_FLIGHT,
+)
+from app.db.instrumentation import QueryStats, current_query_stats
+
+logger = logging.getLogger("app.requests")
+
+
+def route_label(scope: Scope) -> str:
+    """The matched route template (`/users/me`, `/userspaces/{namespace}/users`), never the raw path.
+
+    Mounted apps such as `/uploads` set no route; Starlette appends the mount path to
+    `root_path`, so that prefix labels them instead.
+    """
+    route = scope.get("route")
+    if path := getattr(route, "path", None):
+        return path
+    mount_path = scope.get("root_path", "").removeprefix(scope.get("app_root_path", ""))
+    return mount_path or "unmatched"
+
+
+def server_timing(app_seconds: float, query_stats: QueryStats) -> str:
+    return f'app;dur={app_seconds * 1000:.2f}, db;dur={query_stats.seconds * 1000:.2f};desc="{query_stats.count} queries"'
+
+
+class InstrumentationMiddleware:
+    """Measures every HTTP request: Prometheus metrics, `Server-Timing`, and one log line.
+
+    SQL statements are attributed to the request through `current_query_stats`. The
+    `Server-Timing` header reports the work done before the response started; metrics
+    and the log line cover the whole request, including streamed bodies. Pure ASGI, so
+    streaming responses are not buffered.
+    """
+
+    def __init__(self, app: ASGIApp) -> None:
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        status_code = 500
+        query_stats = QueryStats()
+        started = time.perf_counter()
+
+        async def send_wrapper(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                if settings.server_timing_enabled:
+                    headers = MutableHeaders(scope=message)
+                    headers.append("Server-Timing", server_timing(time.perf_counter() - started, query_stats))
+            await send(message)
+
+        token = current_query_stats.set(query_stats)
+        in_flight = HTTP_REQUESTS_IN_FLIGHT.labels(method)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_flight.dec()
+            current_query_stats.reset(token)
+            route = route_label(scope)
+            HTTP_REQUESTS.labels(method, route, str(status_code)).inc()
+            HTTP_REQUEST_DURATION.labels(method, route, str(status_code)).observe(elapsed)
+            DB_QUERIES_PER_REQUEST.labels(route).observe(query_stats.count)
+            DB_TIME_PER_REQUEST.labels(route).observe(query_stats.seconds)
+            self._log(method, route, status_code, elapsed, query_stats)
+
+    @staticmethod
+    def _log(method: str, route: str, status_code: int, elapsed: float, query_stats: QueryStats) -> None:
+        fields = {
+            "method": method,
+            "route": route,
+            "status": status_code,
+            "duration_ms": round(elapsed * 1000, 3),
+            "db_queries": query_stats.count,
+            "db_ms": round(query_stats.seconds * 1000, 3),
+        }
+        logger.info(" ".join(f"{key}={value}" for key, value in fields.items()), extra=fields)
+        for statement, count in query_stats.repeated(settings.db_repeated_query_threshold):
+            logger.warning(
+                "repeated query route=%s count=%d statement=%r",
+                route,
+                count,
+                statement,
+                extra={"route": route, "count": count, "statement": statement},
+            )
@@ -1,69 +1,71 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_current_user
+from app.api.deps import client_ip, get_current_session_id, get_current_user, get_current_user_snapshot
 from app.db.session import get_db
 from app.models.user import User
-from app.models.userspace import UserSpace
-from app.schemas.auth import ChangePasswordRequest, LoginRequest, RefreshTokenRequest, TokenPair
+from app.schemas.auth import ChangePasswordRequest, LoginRequest, RefreshTokenRequest, SessionOut, TokenPair
 from app.schemas.user import UserCreate
-from app.services.auth import authenticate_user, create_user
-from app.services.security import (
-    create_access_token,
-    create_refresh_token,
-    decode_token,
-    hash_password,
-    verify_password,
+from app.services.auth import DuplicateUserError, authenticate_user, create_user
+from app.services.hasher import password_hasher
+from app.services.login_throttle import login_throttle
+from app.services.namespaces import namespace_registry
+from app.services.refresh_sessions import (
+    RefreshTokenError,
+    exchange_legacy_token,
+    legacy_tokens_accepted,
+    list_sessions,
+    revoke_all_sessions,
+    revoke_session,
+    rotate_session,
+    start_session,
 )
+from app.services.security import decode_token
+from app.services.user_cache import UserSnapshot, user_cache
 
 router = APIRouter(prefix="/auth", tags=["auth"])
 
 
-@router.post("/register", response_model=TokenPair)
-async def register(payload: UserCreate, db: Session = Depends(get_db)):
-    userspace = db.query(UserSpace).filter(UserSpace.namespace == payload.namespace).first()
-    if not userspace:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Namespace not found")
+def _device_name(request: Request, device_name: str | None = None) -> str | None:
+    return device_name or request.headers.get("user-agent")
 
-    existing_user = db.query(User).filter(
-        User.namespace == payload.namespace,
-        User.username == payload.username,
-    ).first()
-    if existing_user:
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Username already exists in namespace")
 
-    if payload.email:
-        existing_email = db.query(User).filter(
-            User.namespace == payload.namespace,
-            User.email == payload.email,
-        ).first()
-        if existing_email:
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already exists in namespace")
+@router.post("/register", response_model=TokenPair)
+async def register(payload: UserCreate, request: Request, db: AsyncSession = Depends(get_db)):
+    namespace = await namespace_registry.get(db, payload.namespace)
+    if namespace is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Namespace not found")
+    if not namespace.registration_open:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Registration is closed for this namespace")
 
-    user = create_user(db, payload)
-    return TokenPair(
-        access_token=create_access_token(user.id, user.token_version),
-        refresh_token=create_refresh_token(user.id, user.token_version),
-    )
+    try:
+        user = await create_user(db, payload)
+    except DuplicateUserError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    return await start_session(db, user, _device_name(request), trim=False)
 
 
 @router.post("/login", response_model=TokenPair)
-async def login(payload: LoginRequest, db: Session = Depends(get_db)):
-    user = authenticate_user(db, payload.namespace, payload.username, payload.password)
+async def login(payload: LoginRequest, request: Request, db: AsyncSession = Depends(get_db)):
+    reservation = await login_throttle.check(client_ip(request), payload.namespace, payload.username)
+    try:
+        user = await authenticate_user(db, payload.namespace, payload.username, payload.password)
+    except BaseException:
+        await login_throttle.release(reservation)
+        raise
     if not user:
+        # The failure reserved by `check` stays counted.
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid namespace, username, or password",
         )
 
-    return TokenPair(
-        access_token=create_access_token(user.id, user.token_version),
-        refresh_token=create_refresh_token(user.id, user.token_version),
-    )
+    await login_throttle.release(reservation)
+    return await start_session(db, user, _device_name(request, payload.device_name))
 
 
 @router.post("/refresh", response_model=TokenPair)
-async def refresh(payload: RefreshTokenRequest, db: Session = Depends(get_db)):
+async def refresh(payload: RefreshTokenRequest, request: Request, db: AsyncSession = Depends(get_db)):
     try:
         token_payload = decode_token(payload.refresh_token)
     except ValueError as exc:
@@ -73,24 +75,85 @@ async def refresh(payload: RefreshTokenRequest, db: Session = Depends(get_db)):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token type")
 
     subject = token_payload.get("sub")
+    session_id = token_payload.get("sid")
+    token_id = token_payload.get("jti")
+    if subject and session_id and token_id:
+        try:
+            return await rotate_session(db, subject, session_id, token_id)
+        except RefreshTokenError as exc:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(exc)) from exc
+
+    # Tokens issued before refresh sessions existed: validate them the old way and move the
+    # device onto a session. Each token can be exchanged once, and only until the cutoff.
+    if not legacy_tokens_accepted():
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token is no longer valid")
     token_version = token_payload.get("ver")
-    user = db.query(User).filter(User.id == subject).first()
+    user = await db.get(User, subject)
     if not user or not user.is_active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="User not found or inactive")
     if token_version != user.token_version:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Refresh token is no longer valid")
-
-    return TokenPair(
-        access_token=create_access_token(user.id, user.token_version),
-        refresh_token=create_refresh_token(user.id, user.token_version),
-    )
+    try:
+        return await exchange_legacy_token(db, user, payload.refresh_token, _device_name(request))
+    except RefreshTokenError as exc:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=str(exc)) from exc
 
 
 @router.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
-async def logout(current_user: User = Depends(get_current_user), db: Session = Depends(get_db)):
+async def logout(
+    current_user: User = Depends(get_current_user),
+    session_id: str | None = Depends(get_current_session_id),
+    db: AsyncSession = Depends(get_db),
+):
+    """Sign this device out; other devices stay signed in."""
+    if session_id:
+        await revoke_session(db, current_user, session_id)
+        return None
+    # Access tokens from before sessions carry no `sid`; only a version bump revokes them.
+    current_user.token_version += 1
+    db.add(current_user)
+    await db.commit()
+    await user_cache.invalidate(current_user.id)
+    return None
+
+
+@router.post("/logout-all", status_code=status.HTTP_204_NO_CONTENT)
+async def logout_all(current_user: User = Depends(get_current_user), db: AsyncSession = Depends(get_db)):
+    await revoke_all_sessions(db, current_user.id)
     current_user.token_version += 1
     db.add(current_user)
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(current_user.id)
+    return None
+
+
+@router.get("/sessions", response_model=list[SessionOut])
+async def get_sessions(
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    session_id: str | None = Depends(get_current_session_id),
+    db: AsyncSession = Depends(get_db),
+):
+    return [
+        SessionOut(
+            id=session.id,
+            device=session.device,
+            created_at=session.created_at,
+            last_used_at=session.last_used_at,
+            expires_at=session.expires_at,
+            current=session.id == session_id,
+        )
+        for session in await list_sessions(db, current_user.id)
+    ]
+
+
+@router.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(
+    session_id: str,
+    current_user: UserSnapshot = Depends(get_current_user_snapshot),
+    db: AsyncSession = Depends(get_db),
+):
+    if not await revoke_session(db, current_user, session_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Session not found")
     return None
 
 
@@ -98,13 +161,15 @@ async def logout(current_user: User = Depends(get_current_user), db: Session = D
 async def change_password(
     payload: ChangePasswordRequest,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    if not verify_password(payload.current_password, current_user.password_hash):
+    if not await password_hasher.verify(payload.current_password, current_user.password_hash):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Current password is incorrect")
 
-    current_user.password_hash = hash_password(payload.new_password)
+    current_user.password_hash = await password_hasher.hash(payload.new_password)
     current_user.token_version += 1
+    await revoke_all_sessions(db, current_user.id)
     db.add(current_user)
-    db.commit()
+    await db.commit()
+    await user_cache.invalidate(current_user.id)
     return None
@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import get_db
+from app.services.hasher import password_hasher
+from app.services.health import readiness_probe
+
+router = APIRouter(prefix="/health", tags=["health"])
+
+
+@router.get("")
+async def healthcheck():
+    return {"status": "ok"}
+
+
+@router.get("/live")
+async def liveness():
+    """The process is up and its event loop is answering; no dependencies are touched."""
+    return {"status": "ok"}
+
+
+@router.get("/ready")
+async def readiness(response: Response, db: AsyncSession = Depends(get_db)):
+    """Whether this worker should receive traffic: database, pool, storage and hasher headroom."""
+    report, cached = await readiness_probe.check(db, password_hasher)
+    response.headers["Cache-Control"] = "no-store"
+    if report["status"] != "ok":
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {**report, "cached": cached}
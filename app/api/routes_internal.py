@@ -0,0 +1,30 @@
+from fastapi import APIRouter, Depends
+
+import app.services.avatar as avatar_service
+from app.api.deps import require_admin
+from app.db.pool import pool_stats
+from app.db.session import async_engine
+from app.services.avatar import avatar_pool
+from app.services.hasher import password_hasher
+from app.services.login_policy import login_failure_policy
+from app.services.login_throttle import login_throttle
+from app.services.namespaces import namespace_registry
+from app.services.security import token_cache
+from app.services.user_cache import user_cache
+
+router = APIRouter(prefix="/internal", tags=["internal"], dependencies=[Depends(require_admin)])
+
+
+@router.get("/stats")
+async def get_stats():
+    return {
+        "db_pool": pool_stats(async_engine.sync_engine.pool),
+        "password_hasher": password_hasher.stats(),
+        "avatar_processor": avatar_pool.stats(),
+        "avatar_storage": avatar_service.avatar_storage.stats(),
+        "user_cache": user_cache.stats(),
+        "token_cache": token_cache.stats(),
+        "login_throttle": login_throttle.stats(),
+        "login_failure_policy": login_failure_policy.stats(),
+        "namespace_registry": namespace_registry.stats(),
+    }
@@ -1,18 +1,26 @@
-from fastapi import APIRouter, Depends, File, HTTPException, UploadFile, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from app.api.deps import get_current_user
+from app.api.deps import get_current_user, get_current_user_snapshot
 from app.core.config import settings
 from app.db.session import get_db
 from app.models.user import User
 from app.schemas.user import UserOut, UserUpdate
-from app.services.avatar import delete_avatar_file, save_avatar_file
+from app.services.avatar import (
+    add_avatar_reference,
+    drop_avatar_reference,
+    ensure_avatar_stored,
+    save_avatar_file,
+)
+from app.services.namespaces import namespace_registry
+from app.services.user_cache import UserSnapshot, user_cache
 
 router = APIRouter(prefix="/users", tags=["users"])
 
 
 @router.get("/me", response_model=UserOut)
-async def get_me(current_user: User = Depends(get_current_user)):
+async def get_me(current_user: UserSnapshot = Depends(get_current_user_snapshot)):
     return current_user
 
 
@@ -20,13 +28,15 @@ async def get_me(current_user: User = Depends(get_current_user)):
 async def update_me(
     payload: UserUpdate,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
     if payload.email and payload.email != current_user.email:
-        existing_email = db.query(User).filter(
-            User.namespace == current_user.namespace,
-            User.email == payload.email,
-        ).first()
+        existing_email = await db.scalar(
+            select(User).where(
+                User.namespace == current_user.namespace,
+                User.email == payload.email,
+            )
+        )
         if existing_email:
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already exists in namespace")
 
@@ -35,48 +45,67 @@ async def update_me(
         setattr(current_user, key, value)
 
     db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
+    await db.commit()
+    await db.refresh(current_user)
+    await user_cache.invalidate(current_user.id)
     return current_user
 
 
-@router.post("/me/avatar", response_model=UserOut)
+# The body is read by hand rather than through `UploadFile`, so the caller is authenticated
+# and the namespace limit is known before any of it is received.
+@router.post(
+    "/me/avatar",
+    response_model=UserOut,
+    openapi_extra={
+        "requestBody": {
+            "required": True,
+            "content": {
+                "multipart/form-data": {
+                    "schema": {
+                        "type": "object",
+                        "required": ["file"],
+                        "properties": {"file": {"type": "string", "format": "binary"}},
+                    }
+                }
+            },
+        }
+    },
+)
 async def upload_me_avatar(
-    file: UploadFile = File(...),
+    request: Request,
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
+    namespace = await namespace_registry.get(db, current_user.namespace)
     try:
-        avatar_url = await save_avatar_file(
-            upload=file,
-            user_id=current_user.id,
-            uploads_dir=settings.uploads_dir,
-            max_bytes=settings.avatar_max_bytes,
+        processed = await save_avatar_file(
+            headers=request.headers,
+            body=request.stream(),
+            max_bytes=namespace.effective_avatar_max_bytes if namespace else settings.avatar_max_bytes,
         )
     except ValueError as exc:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
-    finally:
-        await file.close()
 
-    old_avatar_url = current_user.avatar_url
-    current_user.avatar_url = avatar_url
+    # The old avatar's files are removed by the release sweep once no user references them.
+    await add_avatar_reference(db, processed.avatar)
+    await drop_avatar_reference(db, current_user.avatar_url)
+    current_user.avatar_url = processed.avatar.url
     db.add(current_user)
-    db.commit()
-    db.refresh(current_user)
-
-    delete_avatar_file(old_avatar_url, settings.uploads_dir)
+    await db.commit()
+    await db.refresh(current_user)
+    await user_cache.invalidate(current_user.id)
+    await ensure_avatar_stored(processed)
     return current_user
 
 
 @router.delete("/me/avatar", status_code=status.HTTP_204_NO_CONTENT)
 async def delete_me_avatar(
     current_user: User = Depends(get_current_user),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_db),
 ):
-    old_avatar_url = current_user.avatar_url
+    await drop_avatar_reference(db, current_user.avatar_url)
     current_user.avatar_url = None
     db.add(current_user)
-    db.commit()
-
-    delete_avatar_file(old_avatar_url, settings.uploads_dir)
+    await db.commit()
+    await user_cache.invalidate(current_user.id)
     return None
@@ -1,21 +1,140 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+import json
+import tempfile
 
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.api.deps import require_admin
 from app.db.session import get_db
 from app.models.userspace import UserSpace
-from app.schemas.userspace import UserSpaceCreate, UserSpaceOut
+from app.schemas.user import UserPage
+from app.schemas.userspace import UserSpaceCreate, UserSpaceOut, UserSpaceUpdate
+from app.services.bulk_export import ExportFormat, iter_namespace_users, render_export
+from app.services.bulk_import import ImportFormat, import_users, parse_import_stream
+from app.services.hasher import password_hasher
+from app.services.namespaces import namespace_exists, namespace_registry
+from app.services.user_listing import InvalidListingQuery, UserListingFilters, list_namespace_users, parse_fields
 
 router = APIRouter(prefix="/userspaces", tags=["userspaces"])
 
+IMPORT_SPOOL_MAX_MEMORY_BYTES = 8 * 1024 * 1024
+
 
 @router.post("", response_model=UserSpaceOut, status_code=status.HTTP_201_CREATED)
-async def create_userspace(payload: UserSpaceCreate, db: Session = Depends(get_db)):
-    existing = db.query(UserSpace).filter(UserSpace.namespace == payload.namespace).first()
+async def create_userspace(payload: UserSpaceCreate, db: AsyncSession = Depends(get_db)):
+    existing = await db.scalar(select(UserSpace).where(UserSpace.namespace == payload.namespace))
     if existing:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Namespace already exists")
 
-    userspace = UserSpace(namespace=payload.namespace, name=payload.name, description=payload.description)
+    userspace = UserSpace(**payload.model_dump())
     db.add(userspace)
-    db.commit()
-    db.refresh(userspace)
+    await db.commit()
+    await db.refresh(userspace)
+    namespace_registry.put(userspace)
+    return userspace
+
+
+@router.get("/{namespace}", response_model=UserSpaceOut)
+async def get_userspace(namespace: str, db: AsyncSession = Depends(get_db)):
+    """Served from the namespace registry; only a namespace this worker has not seen reads the database."""
+    config = await namespace_registry.get(db, namespace)
+    if config is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Namespace not found")
+    return config
+
+
+@router.patch("/{namespace}", response_model=UserSpaceOut, dependencies=[Depends(require_admin)])
+async def update_userspace(namespace: str, payload: UserSpaceUpdate, db: AsyncSession = Depends(get_db)):
+    userspace = await db.get(UserSpace, namespace)
+    if userspace is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Namespace not found")
+
+    for key, value in payload.model_dump(exclude_unset=True).items():
+        setattr(userspace, key, value)
+    await db.commit()
+    await db.refresh(userspace)
+    namespace_registry.put(userspace)
     return userspace
+
+
+@router.get("/{namespace}/users", response_model=UserPage, dependencies=[Depends(require_admin)])
+async def list_userspace_users(
+    namespace: str,
+    username_prefix: str | None = Query(default=None, max_length=50),
+    email_prefix: str | None = Query(default=None, max_length=255),
+    is_active: bool | None = None,
+    fields: str | None = Query(default=None, description="Comma-separated UserOut fields to return"),
+    cursor: str | None = None,
+    limit: int = Query(default=50, ge=1, le=500),
+    db: AsyncSession = Depends(get_db),
+):
+    if not await namespace_exists(db, namespace):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Namespace not found")
+
+    filters = UserListingFilters(username_prefix=username_prefix, email_prefix=email_prefix, is_active=is_active)
+    try:
+        items, next_cursor = await list_namespace_users(
+            db,
+            namespace,
+            filters=filters,
+            fields=parse_fields(fields),
+            limit=limit,
+            cursor=cursor,
+        )
+    except InvalidListingQuery as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc)) from exc
+    return UserPage(items=items, next_cursor=next_cursor)
+
+
+@router.post("/{namespace}/users/import", dependencies=[Depends(require_admin)])
+async def import_namespace_users(
+    namespace: str,
+    request: Request,
+    import_format: ImportFormat | None = Query(default=None, alias="format"),
+    batch_size: int = Query(default=1000, ge=1, le=5000),
+    db: AsyncSession = Depends(get_db),
+):
+    """Stream NDJSON or CSV user rows in; stream one NDJSON result per row back, then a summary line."""
+    if not await namespace_exists(db, namespace):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Namespace not found")
+
+    if import_format is None:
+        content_type = request.headers.get("content-type", "")
+        import_format = "csv" if content_type.startswith("text/csv") else "ndjson"
+
+    # Spool the upload so the body is fully received before results start streaming back.
+    spool = tempfile.SpooledTemporaryFile(max_size=IMPORT_SPOOL_MAX_MEMORY_BYTES)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    async def results():
+        counts = {"created": 0, "error": 0}
+        try:
+            records = parse_import_stream(spool, import_format)
+            async for result in import_users(db, namespace, records, password_hasher, batch_size):
+                counts[result.status] += 1
+                yield result.model_dump_json(exclude_none=True) + "\n"
+        finally:
+            spool.close()
+        yield json.dumps({"summary": counts}) + "\n"
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@router.get("/{namespace}/users/export", dependencies=[Depends(require_admin)])
+async def export_namespace_users(
+    namespace: str,
+    export_format: ExportFormat = Query(default="ndjson", alias="format"),
+    after: str | None = Query(default=None, description="Resume after this user id"),
+    db: AsyncSession = Depends(get_db),
+):
+    """Stream every user in the namespace, ordered by id, as NDJSON or CSV."""
+    if not await namespace_exists(db, namespace):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Namespace not found")
+
+    rows = iter_namespace_users(db, namespace, after=after)
+    media_type = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    return StreamingResponse(render_export(rows, export_format), media_type=media_type)
@@ -0,0 +1,31 @@
+import json
+
+from fastapi import APIRouter, Request, Response, status
+
+from app.core.config import settings
+from app.services.security import get_keyring
+
+router = APIRouter(prefix="/.well-known", tags=["well-known"])
+
+# Rendered JWKS body and ETag, keyed by keyring fingerprint.
+_jwks_cache: tuple[str, bytes] | None = None
+
+
+def _render_jwks() -> tuple[str, bytes]:
+    global _jwks_cache
+    keyring = get_keyring()
+    if _jwks_cache is None or _jwks_cache[0] != keyring.fingerprint:
+        _jwks_cache = (keyring.fingerprint, json.dumps(keyring.jwks(), separators=(",", ":")).encode())
+    return _jwks_cache
+
+
+@router.get("/jwks.json")
+async def get_jwks(request: Request):
+    fingerprint, body = _render_jwks()
+    headers = {
+        "Cache-Control": f"public, max-age={settings.jwks_max_age_seconds}",
+        "ETag": f'"{fingerprint[:32]}"',
+    }
+    if request.headers.get("if-none-match") == headers["ETag"]:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=body, media_type="application/json", headers=headers)
@@ -0,0 +1,128 @@
+import asyncio
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from collections.abc import AsyncIterator
+from typing import TYPE_CHECKING
+
+from app.core.cache import TTLCache
+
+if TYPE_CHECKING:
+    from redis.asyncio import Redis
+
+
+class CacheBackend(ABC):
+    """Key/value store with TTLs plus a pub/sub channel, shared by every worker that points at it."""
+
+    @abstractmethod
+    async def get(self, key: str) -> bytes | None: ...
+
+    @abstractmethod
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None: ...
+
+    @abstractmethod
+    async def delete(self, key: str) -> None: ...
+
+    @abstractmethod
+    async def incr(self, key: str, ttl_seconds: float, amount: int = 1) -> int:
+        """Atomically add `amount` to the counter at `key`, (re)setting its TTL; return the new value."""
+
+    @abstractmethod
+    async def publish(self, channel: str, message: str) -> None: ...
+
+    @abstractmethod
+    def subscribe(self, channel: str) -> AsyncIterator[str]: ...
+
+    async def close(self) -> None:
+        return None
+
+
+class MemoryCacheBackend(CacheBackend):
+    """Process-local backend. Suitable for a single worker and for tests."""
+
+    def __init__(self, max_entries: int = 100_000) -> None:
+        self._store: TTLCache[str, bytes] = TTLCache(max_entries=max_entries, ttl_seconds=None)
+        self._subscribers: dict[str, set[asyncio.Queue[str]]] = defaultdict(set)
+
+    async def get(self, key: str) -> bytes | None:
+        return self._store.get(key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        self._store.set(key, value, ttl_seconds)
+
+    async def delete(self, key: str) -> None:
+        self._store.delete(key)
+
+    async def incr(self, key: str, ttl_seconds: float, amount: int = 1) -> int:
+        # No await between the read and the write, so this is atomic on the event loop.
+        value = int(self._store.get(key) or 0) + amount
+        self._store.set(key, str(value).encode(), ttl_seconds)
+        return value
+
+    async def publish(self, channel: str, message: str) -> None:
+        for queue in self._subscribers[channel]:
+            queue.put_nowait(message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        queue: asyncio.Queue[str] = asyncio.Queue()
+        self._subscribers[channel].add(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            self._subscribers[channel].discard(queue)
+
+
+class RedisCacheBackend(CacheBackend):
+    """Backend for any server speaking the Redis protocol (Redis, Valkey, KeyDB, fakeredis)."""
+
+    def __init__(self, client: "Redis") -> None:
+        self._client = client
+
+    @classmethod
+    def from_url(cls, url: str) -> "RedisCacheBackend":
+        try:
+            from redis.asyncio import Redis
+        except ImportError as exc:
+            raise RuntimeError("CACHE_BACKEND=redis requires the 'redis' extra: pip install -e .[redis]") from exc
+        return cls(Redis.from_url(url))
+
+    async def get(self, key: str) -> bytes | None:
+        return await self._client.get(key)
+
+    async def set(self, key: str, value: bytes, ttl_seconds: float) -> None:
+        await self._client.set(key, value, px=max(1, int(ttl_seconds * 1000)))
+
+    async def delete(self, key: str) -> None:
+        await self._client.delete(key)
+
+    async def incr(self, key: str, ttl_seconds: float, amount: int = 1) -> int:
+        async with self._client.pipeline(transaction=True) as pipeline:
+            pipeline.incrby(key, amount)
+            pipeline.pexpire(key, max(1, int(ttl_seconds * 1000)))
+            value, _ = await pipeline.execute()
+        return int(value)
+
+    async def publish(self, channel: str, message: str) -> None:
+        await self._client.publish(channel, message)
+
+    async def subscribe(self, channel: str) -> AsyncIterator[str]:
+        pubsub = self._client.pubsub(ignore_subscribe_messages=True)
+        await pubsub.subscribe(channel)
+        try:
+            async for message in pubsub.listen():
+                if message.get("type") != "message":
+                    continue
+                data = message["data"]
+                yield data.decode() if isinstance(data, bytes) else str(data)
+        finally:
+            await pubsub.unsubscribe(channel)
+            await pubsub.aclose()
+
+    async def close(self) -> None:
+        await self._client.aclose()
+
+
+def create_cache_backend(kind: str, redis_url: str, max_entries: int = 100_000) -> CacheBackend:
+    if kind == "redis":
+        return RedisCacheBackend.from_url(redis_url)
+    return MemoryCacheBackend(max_entries=max_entries)
@@ -1,15 +1,85 @@
+from datetime import datetime
+from typing import Literal
+
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
 
 class Settings(BaseSettings):
     app_name: str = "user-service"
     database_url: str = "sqlite:///./user_service.db"
+    db_pool_size: int = 5
+    db_max_overflow: int = 10
+    db_pool_timeout_seconds: float = 30.0
+    db_pool_recycle_seconds: int = 1800
+    db_pool_pre_ping: bool = True
+    admin_api_key: str | None = None
+    metrics_enabled: bool = True
+    health_cache_seconds: float = 2.0
+    health_db_timeout_seconds: float = 1.0
+    health_db_pool_max_utilization: float = 0.9
+    health_hasher_max_queue_ratio: float = 0.8
+    health_uploads_min_free_bytes: int = 100 * 1024 * 1024
+    server_timing_enabled: bool = True
+    db_slow_query_ms: float = 200.0
+    db_repeated_query_threshold: int = 10
     jwt_secret_key: str = "change-me"
     jwt_algorithm: str = "HS256"
+    jwt_private_keys_dir: str | None = None
+    jwt_active_kid: str | None = None
+    jwt_keys_reload_seconds: int = 300
+    jwks_max_age_seconds: int = 300
     access_token_expire_minutes: int = 30
     refresh_token_expire_days: int = 14
+    refresh_session_sweep_interval_seconds: float = 3600.0
+    refresh_session_sweep_batch_size: int = 1000
+    refresh_session_max_per_user: int = 20
+    legacy_refresh_tokens_until: datetime | None = None
+    token_cache_max_entries: int = 10_000
+    cache_backend: Literal["memory", "redis"] = "memory"
+    redis_url: str = "redis://localhost:6379/0"
+    cache_key_prefix: str = "user-service:"
+    user_cache_ttl_seconds: float = 30.0
+    user_cache_max_entries: int = 10_000
+    namespace_registry_refresh_seconds: float = 30.0
+    namespace_registry_max_entries: int = 100_000
+    trusted_proxy_hops: int = 0
+    rate_limit_backend: Literal["memory", "redis"] = "memory"
+    rate_limit_max_keys: int = 100_000
+    login_rate_limit_enabled: bool = True
+    login_unknown_user_policy: Literal["dummy_hash", "skip"] = "dummy_hash"
+    login_dummy_verify_max_per_namespace: int = 2
+    login_rate_limit_ip_attempts: int = 100
+    login_rate_limit_ip_window_seconds: float = 60.0
+    login_rate_limit_account_failures: int = 10
+    login_rate_limit_account_window_seconds: float = 900.0
     uploads_dir: str = "./uploads"
     avatar_max_bytes: int = 1 * 1024 * 1024
+    avatar_max_pixels: int = 4096 * 4096
+    avatar_upload_chunk_bytes: int = 64 * 1024
+    avatar_spool_dir: str | None = None
+    avatar_variant_sizes: list[int] = [64, 128, 256]
+    avatar_pool_kind: Literal["thread", "process"] = "thread"
+    avatar_pool_workers: int = 2
+    avatar_pool_max_queue: int = 16
+    avatar_pool_retry_after_seconds: int = 2
+    avatar_release_interval_seconds: float = 60.0
+    avatar_storage_backend: Literal["filesystem", "s3"] = "filesystem"
+    avatar_s3_bucket: str | None = None
+    avatar_s3_endpoint_url: str | None = None
+    avatar_s3_region: str | None = None
+    avatar_s3_key_prefix: str = ""
+    avatar_s3_presign_expiry_seconds: int = 3600
+    uploads_cache_max_age_seconds: int = 300
+    avatar_memory_cache_max_bytes: int = 16 * 1024 * 1024
+    avatar_memory_cache_max_file_bytes: int = 64 * 1024
+    password_hash_schemes: list[Literal["bcrypt", "argon2"]] = ["bcrypt"]
+    password_bcrypt_rounds: int = 12
+    password_argon2_time_cost: int = 3
+    password_argon2_memory_kib: int = 64 * 1024
+    password_hash_pool_kind: Literal["thread", "process"] = "thread"
+    password_hash_workers: int = 4
+    password_hash_max_queue: int = 64
+    password_hash_retry_after_seconds: int = 1
 
     model_config = SettingsConfigDict(env_file=".env", env_file_encoding="utf-8")
 
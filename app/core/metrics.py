@@ -0,0 +1,178 @@
+import os
+import threading
+from bisect import bisect_left
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, generate_latest, multiprocess
+
+DEFAULT_LATENCY_BUCKETS: tuple[float, ...] = (
+    0.001,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+
+class LatencyHistogram:
+    """Cumulative latency histogram with Prometheus-style `le` buckets."""
+
+    def __init__(self, buckets: tuple[float, ...] = DEFAULT_LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self._counts = [0] * (len(self.buckets) + 1)
+        self._count = 0
+        self._sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        index = bisect_left(self.buckets, seconds)
+        with self._lock:
+            self._counts[index] += 1
+            self._count += 1
+            self._sum += seconds
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            counts = list(self._counts)
+            total = self._count
+            total_sum = self._sum
+
+        cumulative = 0
+        buckets: dict[str, int] = {}
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = total
+        return {"count": total, "sum": round(total_sum, 6), "buckets": buckets}
+
+
+# Prometheus metrics. With PROMETHEUS_MULTIPROC_DIR set, prometheus_client stores values in
+# per-process files there and `render_latest` aggregates them across uvicorn workers.
+METRIC_PREFIX = "user_service"
+
+HTTP_REQUESTS = Counter(
+    f"{METRIC_PREFIX}_http_requests_total",
+    "HTTP requests by method, route template and status code.",
+    ["method", "route", "status"],
+)
+HTTP_REQUEST_DURATION = Histogram(
+    f"{METRIC_PREFIX}_http_request_duration_seconds",
+    "HTTP request latency by method, route template and status code.",
+    ["method", "route", "status"],
+    buckets=DEFAULT_LATENCY_BUCKETS,
+)
+HTTP_REQUESTS_IN_FLIGHT = Gauge(
+    f"{METRIC_PREFIX}_http_requests_in_flight",
+    "HTTP requests currently being served.",
+    ["method"],
+    multiprocess_mode="livesum",
+)
+DB_QUERY_DURATION = Histogram(
+    f"{METRIC_PREFIX}_db_query_duration_seconds",
+    "Duration of individual SQL statements.",
+    buckets=DEFAULT_LATENCY_BUCKETS,
+)
+DB_QUERIES_PER_REQUEST = Histogram(
+    f"{METRIC_PREFIX}_db_queries_per_request",
+    "SQL statements executed while serving one HTTP request.",
+    ["route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+DB_TIME_PER_REQUEST = Histogram(
+    f"{METRIC_PREFIX}_db_time_per_request_seconds",
+    "Total SQL time spent while serving one HTTP request.",
+    ["route"],
+    buckets=DEFAULT_LATENCY_BUCKETS,
+)
+WORKER_POOL_QUEUE_WAIT = Histogram(
+    f"{METRIC_PREFIX}_worker_pool_queue_wait_seconds",
+    "Time jobs spend waiting for a free worker.",
+    ["pool"],
+    buckets=DEFAULT_LATENCY_BUCKETS,
+)
+WORKER_POOL_RUN = Histogram(
+    f"{METRIC_PREFIX}_worker_pool_run_seconds",
+    "Time jobs spend running on a worker.",
+    ["pool"],
+    buckets=DEFAULT_LATENCY_BUCKETS,
+)
+WORKER_POOL_IN_FLIGHT = Gauge(
+    f"{METRIC_PREFIX}_worker_pool_in_flight",
+    "Jobs admitted to a worker pool (running or queued).",
+    ["pool"],
+    multiprocess_mode="livesum",
+)
+WORKER_POOL_REJECTED = Counter(
+    f"{METRIC_PREFIX}_worker_pool_rejected_total",
+    "Jobs rejected because the worker pool was saturated.",
+    ["pool"],
+)
+PASSWORD_HASH_DURATION = Histogram(
+    f"{METRIC_PREFIX}_password_hash_duration_seconds",
+    "End-to-end bcrypt hash/verify time, including the wait for a worker.",
+    ["operation"],
+    buckets=DEFAULT_LATENCY_BUCKETS,
+)
+PASSWORD_REHASHES = Counter(
+    f"{METRIC_PREFIX}_password_rehashes_total",
+    "Password hashes upgraded on login, by the scheme they were upgraded from.",
+    ["scheme"],
+)
+JWT_DECODE_DURATION = Histogram(
+    f"{METRIC_PREFIX}_jwt_decode_duration_seconds",
+    "Access/refresh token decode time, split by verification cache result.",
+    ["cache"],
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01),
+)
+AVATAR_PROCESSING_DURATION = Histogram(
+    f"{METRIC_PREFIX}_avatar_processing_duration_seconds",
+    "Avatar upload time per stage: spooling the upload, image processing, and storage writes.",
+    ["stage"],
+    buckets=DEFAULT_LATENCY_BUCKETS,
+)
+LOGIN_DURATION = Histogram(
+    f"{METRIC_PREFIX}_login_duration_seconds",
+    "Credential check time by outcome: success, wrong_password, unknown_user (dummy verify), "
+    "unknown_user_delayed (over the per-namespace budget), unknown_user_skipped, or error.",
+    ["outcome"],
+    buckets=DEFAULT_LATENCY_BUCKETS,
+)
+REFRESH_TOKEN_EVENTS = Counter(
+    f"{METRIC_PREFIX}_refresh_token_events_total",
+    "Refresh session events: issued, rotated, reuse_detected, rejected, revoked, expired (swept).",
+    ["event"],
+)
+RATE_LIMIT_DECISIONS = Counter(
+    f"{METRIC_PREFIX}_rate_limit_decisions_total",
+    "Rate limiter decisions by limiter and outcome (allowed or throttled).",
+    ["limiter", "outcome"],
+)
+RATE_LIMIT_BACKEND_ERRORS = Counter(
+    f"{METRIC_PREFIX}_rate_limit_backend_errors_total",
+    "Rate limiter checks that failed open because the counter backend was unavailable.",
+    ["limiter"],
+)
+
+
+def multiprocess_enabled() -> bool:
+    return bool(os.environ.get("PROMETHEUS_MULTIPROC_DIR"))
+
+
+def render_latest() -> bytes:
+    """Metrics in Prometheus text format, aggregated across workers in multiprocess mode."""
+    if multiprocess_enabled():
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+def mark_process_dead() -> None:
+    if multiprocess_enabled():
+        multiprocess.mark_process_dead(os.getpid())
@@ -0,0 +1,33 @@
+import asyncio
+import logging
+from collections.abc import Awaitable, Callable
+from typing import TypeVar
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.db.session import AsyncSessionLocal
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+SessionJob = Callable[[AsyncSession], Awaitable[T]]
+
+
+async def run_in_session(job: SessionJob[T], description: str) -> T | None:
+    """Run `job` in a fresh session. On failure, log and return None so background work keeps going."""
+    try:
+        async with AsyncSessionLocal() as db:
+            return await job(db)
+    except asyncio.CancelledError:
+        raise
+    except Exception:
+        logger.warning("%s failed", description, exc_info=True)
+        return None
+
+
+async def run_periodically(interval_seconds: float, job: SessionJob[object], description: str) -> None:
+    """Run `job` every `interval_seconds` until cancelled; a failed run is logged and retried next interval."""
+    while True:
+        await asyncio.sleep(interval_seconds)
+        await run_in_session(job, description)
@@ -0,0 +1,131 @@
+import logging
+import math
+import time
+from collections.abc import Callable
+
+from app.core.cache_backend import CacheBackend
+from app.core.metrics import RATE_LIMIT_BACKEND_ERRORS, RATE_LIMIT_DECISIONS
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimitedError(RuntimeError):
+    def __init__(self, limiter: str, retry_after_seconds: int) -> None:
+        super().__init__(f"Rate limit '{limiter}' exceeded")
+        self.limiter = limiter
+        self.retry_after_seconds = retry_after_seconds
+
+
+class SlidingWindowLimiter:
+    """Allows `limit` events per key in any `window_seconds` span (sliding-window counter).
+
+    Each key has one counter per fixed window in the `CacheBackend`. The rate is the
+    current window's count plus the previous window's count, weighted by how much of that
+    window the sliding window still covers. A key therefore costs at most two short-lived
+    entries. With the memory backend, memory is bounded by its LRU size; with Redis, every
+    worker sees the same counts.
+
+    Backend errors fail open, so an unavailable store does not lock every caller out.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        backend: CacheBackend,
+        limit: int,
+        window_seconds: float,
+        key_prefix: str = "",
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.name = name
+        self.backend = backend
+        self.limit = limit
+        self.window_seconds = window_seconds
+        self.key_prefix = key_prefix
+        self.clock = clock
+        self.allowed = 0
+        self.throttled = 0
+        self.backend_errors = 0
+
+    def _window(self, key: str) -> tuple[str, str, float]:
+        now = self.clock()
+        window = int(now // self.window_seconds)
+        elapsed = (now % self.window_seconds) / self.window_seconds
+        base = f"{self.key_prefix}ratelimit:{self.name}:{key}"
+        return f"{base}:{window}", f"{base}:{window - 1}", elapsed
+
+    def _retry_after(self, previous: int, current: int, elapsed: float, target: int) -> int:
+        """Seconds until the estimated rate drops to `target`, assuming no further events."""
+        if current <= target:
+            fraction = 1 - (target - current) / previous if previous else 0.0
+            wait = max(0.0, fraction - elapsed)
+        else:
+            wait = (1 - elapsed) + (1 - target / current)
+        return max(1, math.ceil(wait * self.window_seconds))
+
+    def _decide(self, previous: int, current: int, elapsed: float, target: int) -> None:
+        if previous * (1 - elapsed) + current <= target:
+            self.allowed += 1
+            RATE_LIMIT_DECISIONS.labels(self.name, "allowed").inc()
+            return
+        self.throttled += 1
+        RATE_LIMIT_DECISIONS.labels(self.name, "throttled").inc()
+        raise RateLimitedError(self.name, self._retry_after(previous, current, elapsed, target))
+
+    def _backend_failed(self) -> None:
+        self.backend_errors += 1
+        RATE_LIMIT_BACKEND_ERRORS.labels(self.name).inc()
+        logger.warning("rate limiter %s backend failed; allowing the request", self.name, exc_info=True)
+
+    async def hit(self, key: str) -> None:
+        """Count one event for `key`; raise `RateLimitedError` if that puts it over the limit.
+
+        Rejected events are counted too, so a client that keeps retrying stays blocked.
+        """
+        current_key, previous_key, elapsed = self._window(key)
+        try:
+            current = await self.backend.incr(current_key, 2 * self.window_seconds)
+            previous = int(await self.backend.get(previous_key) or 0)
+        except Exception:
+            self._backend_failed()
+            return
+        self._decide(previous, current, elapsed, self.limit)
+
+    async def acquire(self, key: str) -> str | None:
+        """Reserve one event for `key`, or raise `RateLimitedError` without counting it.
+
+        The reservation is an atomic increment, so concurrent callers cannot all pass on the
+        same count, as they would with a read followed by a later write. Returns the counter
+        to hand to `release` if the event turns out not to count, or None if the backend failed.
+        """
+        current_key, previous_key, elapsed = self._window(key)
+        try:
+            current = await self.backend.incr(current_key, 2 * self.window_seconds)
+            previous = int(await self.backend.get(previous_key) or 0)
+        except Exception:
+            self._backend_failed()
+            return None
+        try:
+            self._decide(previous, current, elapsed, self.limit)
+        except RateLimitedError:
+            await self.release(current_key)
+            raise
+        return current_key
+
+    async def release(self, counter_key: str | None) -> None:
+        """Take back an event reserved by `acquire`."""
+        if counter_key is None:
+            return
+        try:
+            await self.backend.incr(counter_key, 2 * self.window_seconds, amount=-1)
+        except Exception:
+            self._backend_failed()
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "window_seconds": self.window_seconds,
+            "allowed": self.allowed,
+            "throttled": self.throttled,
+            "backend_errors": self.backend_errors,
+        }
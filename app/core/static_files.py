@@ -0,0 +1,79 @@
+import os
+import re
+from pathlib import Path
+
+import anyio
+from starlette.datastructures import Headers
+from starlette.responses import FileResponse, Response
+from starlette.staticfiles import NotModifiedResponse, StaticFiles
+from starlette.types import Scope
+
+from app.core.cache import ByteLRUCache
+
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Relative paths whose name is the sha256 of their content (see app.services.avatar).
+_CONTENT_ADDRESSED = re.compile(r"^avatars/([0-9a-f]{2})/(\1[0-9a-f]{62}(?:_\d+)?)\.(?:jpg|png|webp)$")
+
+
+class UploadsStaticFiles(StaticFiles):
+    """StaticFiles for `/uploads` with cache headers suited to content-addressed avatars.
+
+    Content-addressed files get a strong ETag derived from their name and an immutable
+    `Cache-Control`; other files keep Starlette's stat-based ETag with a short max-age.
+    Files are sent through `FileResponse`, which supports `Range` requests and hands the
+    file to the server via `http.response.pathsend` when the server offers it. Small
+    content-addressed files can also be kept in `memory_cache` to skip the disk read.
+    """
+
+    def __init__(self, *, max_age_seconds: int, memory_cache: ByteLRUCache[str], **kwargs) -> None:
+        super().__init__(**kwargs)
+        self.max_age_seconds = max_age_seconds
+        self.memory_cache = memory_cache
+
+    def _headers(self, full_path: str | os.PathLike) -> dict[str, str]:
+        root = os.path.realpath(self.all_directories[0])
+        relative = Path(os.path.relpath(full_path, root)).as_posix()
+        match = _CONTENT_ADDRESSED.match(relative)
+        if match is None:
+            return {"cache-control": f"public, max-age={self.max_age_seconds}"}
+        return {"cache-control": IMMUTABLE_CACHE_CONTROL, "etag": f'"{match.group(2)}"'}
+
+    def file_response(
+        self,
+        full_path: str | os.PathLike,
+        stat_result: os.stat_result,
+        scope: Scope,
+        status_code: int = 200,
+    ) -> Response:
+        request_headers = Headers(scope=scope)
+        headers = self._headers(full_path)
+
+        response = FileResponse(full_path, status_code=status_code, stat_result=stat_result, headers=headers)
+        if self.is_not_modified(response.headers, request_headers):
+            return NotModifiedResponse(response.headers)
+
+        if "etag" in headers and "range" not in request_headers:
+            cached = self.memory_cache.get(str(full_path)) if self.memory_cache.enabled else None
+            if cached is not None and len(cached) == stat_result.st_size:
+                return Response(
+                    cached,
+                    status_code=status_code,
+                    headers={**response.headers},
+                    media_type=response.media_type,
+                )
+        return response
+
+    async def get_response(self, path: str, scope: Scope) -> Response:
+        response = await super().get_response(path, scope)
+        if (
+            isinstance(response, FileResponse)
+            and response.status_code == 200
+            and "etag" in self._headers(response.path)
+            and response.stat_result is not None
+            and self.memory_cache.accepts(response.stat_result.st_size)
+            and "range" not in Headers(scope=scope)
+        ):
+            content = await anyio.to_thread.run_sync(Path(response.path).read_bytes)
+            self.memory_cache.set(str(response.path), content)
+        return response
@@ -0,0 +1,119 @@
+import asyncio
+import time
+from collections.abc import Callable
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Literal, TypeVar
+
+from app.core.metrics import (
+    WORKER_POOL_IN_FLIGHT,
+    WORKER_POOL_QUEUE_WAIT,
+    WORKER_POOL_REJECTED,
+    WORKER_POOL_RUN,
+    LatencyHistogram,
+)
+
+T = TypeVar("T")
+
+PoolKind = Literal["thread", "process"]
+
+
+def _timed_call(func: Callable[..., T], *args: Any) -> tuple[T, float]:
+    """Run `func` on the worker and report how long it ran, excluding the queue wait."""
+    started = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - started
+
+
+class PoolSaturatedError(RuntimeError):
+    def __init__(self, pool_name: str, retry_after_seconds: int) -> None:
+        super().__init__(f"Worker pool '{pool_name}' is saturated")
+        self.pool_name = pool_name
+        self.retry_after_seconds = retry_after_seconds
+
+
+class WorkerPool:
+    """Bounded executor for CPU-bound work that must stay off the event loop.
+
+    At most `max_workers + max_queue` jobs are admitted at once; anything beyond
+    that is rejected with `PoolSaturatedError` instead of piling up behind the
+    executor's unbounded internal queue.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        max_workers: int,
+        max_queue: int,
+        kind: PoolKind = "thread",
+        retry_after_seconds: int = 1,
+    ) -> None:
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.kind = kind
+        self.retry_after_seconds = retry_after_seconds
+        self.latency = LatencyHistogram()
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+        self._in_flight = 0
+        self._executor: Executor | None = None
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    @property
+    def queue_depth(self) -> int:
+        return max(0, self._in_flight - self.max_workers)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name)
+        return self._executor
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        if self._in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            WORKER_POOL_REJECTED.labels(self.name).inc()
+            raise PoolSaturatedError(self.name, self.retry_after_seconds)
+
+        self._in_flight += 1
+        WORKER_POOL_IN_FLIGHT.labels(self.name).inc()
+        started = time.perf_counter()
+        try:
+            result, run_seconds = await asyncio.get_running_loop().run_in_executor(
+                self._get_executor(), _timed_call, func, *args
+            )
+        except BaseException:
+            self.failed += 1
+            raise
+        finally:
+            self._in_flight -= 1
+            WORKER_POOL_IN_FLIGHT.labels(self.name).dec()
+            self.latency.observe(time.perf_counter() - started)
+        WORKER_POOL_RUN.labels(self.name).observe(run_seconds)
+        WORKER_POOL_QUEUE_WAIT.labels(self.name).observe(max(0.0, time.perf_counter() - started - run_seconds))
+        self.completed += 1
+        return result
+
+    def stats(self) -> dict:
+        return {
+            "kind": self.kind,
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "in_flight": self._in_flight,
+            "queue_depth": self.queue_depth,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "latency_seconds": self.latency.snapshot(),
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
@@ -0,0 +1,73 @@
+import logging
+import time
+from collections import Counter
+from collections.abc import Mapping, Sequence
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from app.core.config import settings
+from app.core.metrics import DB_QUERY_DURATION
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryStats:
+    """SQL statements executed and time spent in them during one unit of work (a request)."""
+
+    count: int = 0
+    seconds: float = 0.0
+    statements: Counter[str] = field(default_factory=Counter)
+
+    def repeated(self, threshold: int) -> list[tuple[str, int]]:
+        """Statements executed at least `threshold` times, the usual sign of an N+1 loop."""
+        return [(statement, count) for statement, count in self.statements.most_common() if count >= threshold]
+
+
+# Set per request by the HTTP middleware; statements outside a request are timed but not attributed.
+current_query_stats: ContextVar[QueryStats | None] = ContextVar("current_query_stats", default=None)
+
+
+def redact_parameters(parameters, executemany: bool = False):
+    """Describe bound parameters by type only, so values (passwords, emails) never reach logs."""
+    if executemany and isinstance(parameters, Sequence) and not isinstance(parameters, str | bytes):
+        return f"<{len(parameters)} parameter sets>"
+    if isinstance(parameters, Mapping):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, Sequence) and not isinstance(parameters, str | bytes):
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    context._query_started = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany) -> None:
+    elapsed = time.perf_counter() - context._query_started
+    DB_QUERY_DURATION.observe(elapsed)
+    stats = current_query_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+        stats.statements[statement] += 1
+
+    elapsed_ms = elapsed * 1000
+    if elapsed_ms >= settings.db_slow_query_ms:
+        logger.warning(
+            "slow query duration_ms=%.1f statement=%r parameters=%r",
+            elapsed_ms,
+            statement,
+            redact_parameters(parameters, executemany),
+            extra={"duration_ms": round(elapsed_ms, 3), "statement": statement},
+        )
+
+
+def install_query_instrumentation() -> None:
+    """Time every statement on every engine (async engines run through a sync Engine)."""
+    if not event.contains(Engine, "before_cursor_execute", _before_cursor_execute):
+        event.listen(Engine, "before_cursor_execute", _before_cursor_execute)
+        event.listen(Engine, "after_cursor_execute", _after_cursor_execute)
@@ -0,0 +1,60 @@
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, Pool, QueuePool
+
+from app.core.metrics import LatencyHistogram
+
+
+class PoolMetrics:
+    """Process-wide counters for connection checkouts from the request engine's pool."""
+
+    def __init__(self) -> None:
+        self.wait = LatencyHistogram()
+        self.checkouts = 0
+        self.timeouts = 0
+
+    def reset(self) -> None:
+        self.__init__()
+
+
+pool_metrics = PoolMetrics()
+
+
+class InstrumentedAsyncQueuePool(AsyncAdaptedQueuePool):
+    """AsyncAdaptedQueuePool that records how long callers wait for a connection slot."""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            connection = super().connect()
+        except exc.TimeoutError:
+            pool_metrics.timeouts += 1
+            raise
+        finally:
+            pool_metrics.wait.observe(time.perf_counter() - started)
+        pool_metrics.checkouts += 1
+        return connection
+
+
+def pool_stats(pool: Pool) -> dict:
+    stats: dict = {"pool_class": type(pool).__name__}
+    if isinstance(pool, QueuePool):
+        stats.update(
+            {
+                "size": pool.size(),
+                "checked_in": pool.checkedin(),
+                "checked_out": pool.checkedout(),
+                "overflow": max(0, pool.overflow()),
+                "max_overflow": pool._max_overflow,
+                "timeout_seconds": pool.timeout(),
+            }
+        )
+    stats.update(
+        {
+            "checkouts": pool_metrics.checkouts,
+            "timeouts": pool_metrics.timeouts,
+            "wait_seconds": pool_metrics.wait.snapshot(),
+        }
+    )
+    return stats
@@ -0,0 +1,27 @@
+from sqlalchemy.engine import make_url
+
+ASYNC_DRIVERS: dict[str, str] = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+}
+
+
+def async_database_url(database_url: str) -> str:
+    """Return `database_url` with the async driver for its backend (e.g. `sqlite+aiosqlite`)."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver is None:
+        raise ValueError(f"No async driver configured for database backend '{backend}'")
+    if url.get_driver_name() == driver:
+        return database_url
+    return url.set(drivername=f"{backend}+{driver}").render_as_string(hide_password=False)
+
+
+def sync_database_url(database_url: str) -> str:
+    """Return `database_url` with the backend's default sync driver, for Alembic and scripts."""
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    if url.get_driver_name() != ASYNC_DRIVERS.get(backend):
+        return database_url
+    return url.set(drivername=backend).render_as_string(hide_password=False)
@@ -1,27 +1,102 @@
+import asyncio
+import contextlib
 from pathlib import Path
 
-from fastapi import FastAPI
-from fastapi.staticfiles import StaticFiles
+from fastapi import FastAPI, Request, status
+from fastapi.responses import JSONResponse
 
+from app.api.middleware import InstrumentationMiddleware
 from app.api.routes_auth import router as auth_router
+from app.api.routes_health import router as health_router
+from app.api.routes_internal import router as internal_router
+from app.api.routes_metrics import router as metrics_router
 from app.api.routes_users import router as users_router
 from app.api.routes_userspaces import router as userspaces_router
+from app.api.routes_wellknown import router as wellknown_router
 from app.core.config import settings
+from app.core.metrics import mark_process_dead
+from app.core.rate_limit import RateLimitedError
+from app.core.workers import PoolSaturatedError
+from app.services.avatar import avatar_pool, release_avatars_periodically, serve_uploads
+from app.services.hasher import password_hasher
+from app.services.login_throttle import login_throttle
+from app.services.namespaces import namespace_registry
+from app.services.refresh_sessions import sweep_sessions_periodically
+from app.services.user_cache import user_cache
 
 app = FastAPI(title=settings.app_name)
-app.mount("/uploads", StaticFiles(directory=settings.uploads_dir, check_dir=False), name="uploads")
+app.add_middleware(InstrumentationMiddleware)
+app.mount("/uploads", serve_uploads, name="uploads")
 
 
 @app.on_event("startup")
 async def startup() -> None:
     Path(settings.uploads_dir).mkdir(parents=True, exist_ok=True)
+    await namespace_registry.load()
+    app.state.avatar_releaser = None
+    if settings.avatar_release_interval_seconds > 0:
+        app.state.avatar_releaser = asyncio.create_task(
+            release_avatars_periodically(settings.avatar_release_interval_seconds)
+        )
+    app.state.namespace_refresher = None
+    if settings.namespace_registry_refresh_seconds > 0:
+        app.state.namespace_refresher = asyncio.create_task(
+            namespace_registry.refresh_periodically(settings.namespace_registry_refresh_seconds)
+        )
+    app.state.user_cache_listener = asyncio.create_task(user_cache.listen_for_invalidations())
+    app.state.session_sweeper = None
+    if settings.refresh_session_sweep_interval_seconds > 0:
+        app.state.session_sweeper = asyncio.create_task(
+            sweep_sessions_periodically(
+                settings.refresh_session_sweep_interval_seconds,
+                settings.refresh_session_sweep_batch_size,
+            )
+        )
 
 
-@app.get("/health", tags=["health"])
-async def healthcheck():
-    return {"status": "ok"}
+@app.on_event("shutdown")
+async def shutdown() -> None:
+    for task in (
+        app.state.user_cache_listener,
+        app.state.session_sweeper,
+        app.state.avatar_releaser,
+        app.state.namespace_refresher,
+    ):
+        if task is None:
+            continue
+        task.cancel()
+        with contextlib.suppress(asyncio.CancelledError):
+            await task
+    await user_cache.backend.close()
+    await login_throttle.backend.close()
+    password_hasher.shutdown()
+    avatar_pool.shutdown()
+    mark_process_dead()
 
 
+@app.exception_handler(PoolSaturatedError)
+async def pool_saturated_handler(request: Request, exc: PoolSaturatedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={"detail": "Service is busy, retry later"},
+        headers={"Retry-After": str(exc.retry_after_seconds)},
+    )
+
+
+@app.exception_handler(RateLimitedError)
+async def rate_limited_handler(request: Request, exc: RateLimitedError) -> JSONResponse:
+    return JSONResponse(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        content={"detail": "Too many attempts, retry later"},
+        headers={"Retry-After": str(exc.retry_after_seconds)},
+    )
+
+
+app.include_router(health_router)
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(userspaces_router)
+app.include_router(internal_router)
+app.include_router(wellknown_router)
+if settings.metrics_enabled:
+    app.include_router(metrics_router)
@@ -1,6 +1,6 @@
 import uuid
 
-from sqlalchemy import JSON, Boolean, DateTime, String, UniqueConstraint, func
+from sqlalchemy import JSON, Boolean, DateTime, Index, String, UniqueConstraint, func, text
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.base import Base
@@ -11,6 +11,11 @@ class User(Base):
     __table_args__ = (
         UniqueConstraint("namespace", "username", name="uq_users_namespace_username"),
         UniqueConstraint("namespace", "email", name="uq_users_namespace_email"),
+        Index("ix_users_namespace_id", "namespace", "id"),
+        Index("ix_users_namespace_is_active_id", "namespace", "is_active", "id"),
+        # Prefix listing compares under COLLATE "C" on PostgreSQL; SQLite text is already binary.
+        Index("ix_users_namespace_username_c", "namespace", text('username COLLATE "C"')).ddl_if(dialect="postgresql"),
+        Index("ix_users_namespace_email_c", "namespace", text('email COLLATE "C"')).ddl_if(dialect="postgresql"),
     )
 
     id: Mapped[str] = mapped_column(String(36), primary_key=True, default=lambda: str(uuid.uuid4()))
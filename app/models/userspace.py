@@ -1,4 +1,4 @@
-from sqlalchemy import DateTime, String, func
+from sqlalchemy import Boolean, DateTime, Integer, String, func, true
 from sqlalchemy.orm import Mapped, mapped_column
 
 from app.db.base import Base
@@ -10,4 +10,16 @@ class UserSpace(Base):
     namespace: Mapped[str] = mapped_column(String(100), primary_key=True)
     name: Mapped[str] = mapped_column(String(120), nullable=False)
     description: Mapped[str | None] = mapped_column(String(255), nullable=True)
+    # Namespace-scoped settings; NULL means the service-wide default applies.
+    registration_open: Mapped[bool] = mapped_column(Boolean, default=True, server_default=true(), nullable=False)
+    access_token_expire_minutes: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    refresh_token_expire_days: Mapped[int | None] = mapped_column(Integer, nullable=True)
+    avatar_max_bytes: Mapped[int | None] = mapped_column(Integer, nullable=True)
     created_at: Mapped[DateTime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    updated_at: Mapped[DateTime] = mapped_column(
+        DateTime(timezone=True),
+        server_default=func.now(),
+        onupdate=func.now(),
+        nullable=False,
+        index=True,
+    )
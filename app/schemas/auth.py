@@ -1,4 +1,6 @@
-from pydantic import BaseModel
+from datetime import datetime
+
+from pydantic import BaseModel, Field
 
 
 class TokenPair(BaseModel):
@@ -11,6 +13,7 @@ class LoginRequest(BaseModel):
     namespace: str
     username: str
     password: str
+    device_name: str | None = Field(default=None, max_length=120)
 
 
 class ChangePasswordRequest(BaseModel):
@@ -20,3 +23,12 @@ class ChangePasswordRequest(BaseModel):
 
 class RefreshTokenRequest(BaseModel):
     refresh_token: str
+
+
+class SessionOut(BaseModel):
+    id: str
+    device: str | None
+    created_at: datetime
+    last_used_at: datetime
+    expires_at: datetime
+    current: bool
@@ -1,4 +1,8 @@
-from pydantic import BaseModel, ConfigDict, Field
+from typing import Any, Literal
+
+from pydantic import BaseModel, ConfigDict, Field, computed_field, model_validator
+
+from app.services.avatar_urls import avatar_variant_urls
 
 
 class UserCreate(BaseModel):
@@ -7,14 +11,37 @@ class UserCreate(BaseModel):
     password: str = Field(min_length=8, max_length=128)
     email: str | None = None
     full_name: str | None = None
-    avatar_url: str | None = None
     extra: dict[str, str] | None = None
 
 
+class UserImportRow(BaseModel):
+    username: str = Field(min_length=3, max_length=50)
+    password: str | None = Field(default=None, min_length=8, max_length=128)
+    password_hash: str | None = Field(default=None, max_length=255)
+    email: str | None = None
+    full_name: str | None = None
+    extra: dict[str, str] | None = None
+
+    @model_validator(mode="after")
+    def require_one_password_field(self) -> "UserImportRow":
+        if (self.password is None) == (self.password_hash is None):
+            raise ValueError("Provide exactly one of password or password_hash")
+        return self
+
+
+class UserImportResult(BaseModel):
+    line: int
+    username: str | None = None
+    status: Literal["created", "error"]
+    id: str | None = None
+    error: str | None = None
+
+
 class UserUpdate(BaseModel):
+    """`avatar_url` is not settable here; only `POST /users/me/avatar` changes it."""
+
     email: str | None = None
     full_name: str | None = None
-    avatar_url: str | None = None
     extra: dict[str, str] | None = None
 
 
@@ -30,3 +57,14 @@ class UserOut(BaseModel):
     is_active: bool
 
     model_config = ConfigDict(from_attributes=True)
+
+    @computed_field
+    @property
+    def avatar_variants(self) -> dict[str, str] | None:
+        """Square WebP renditions of the uploaded avatar, keyed by edge size in pixels."""
+        return avatar_variant_urls(self.avatar_url)
+
+
+class UserPage(BaseModel):
+    items: list[dict[str, Any]]
+    next_cursor: str | None
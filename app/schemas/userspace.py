@@ -1,15 +1,40 @@
-from pydantic import BaseModel, ConfigDict, Field
+from pydantic import BaseModel, ConfigDict, Field, field_validator
 
 
 class UserSpaceCreate(BaseModel):
+    """Settings overrides are not accepted here, since creating a namespace needs no admin key; set them with `PATCH`."""
+
     namespace: str = Field(min_length=2, max_length=100)
     name: str = Field(min_length=2, max_length=120)
     description: str | None = Field(default=None, max_length=255)
 
 
+class UserSpaceUpdate(BaseModel):
+    """Fields left out are unchanged. A `None` override means the service-wide setting applies,
+    so an explicit `null` resets it."""
+
+    name: str | None = Field(default=None, min_length=2, max_length=120)
+    description: str | None = Field(default=None, max_length=255)
+    registration_open: bool | None = None
+    access_token_expire_minutes: int | None = Field(default=None, ge=1, le=24 * 60)
+    refresh_token_expire_days: int | None = Field(default=None, ge=1, le=365)
+    avatar_max_bytes: int | None = Field(default=None, ge=1024, le=20 * 1024 * 1024)
+
+    @field_validator("name", "registration_open")
+    @classmethod
+    def _not_null(cls, value):
+        if value is None:
+            raise ValueError("may not be null")
+        return value
+
+
 class UserSpaceOut(BaseModel):
     namespace: str
     name: str
     description: str | None
+    registration_open: bool
+    access_token_expire_minutes: int | None
+    refresh_token_expire_days: int | None
+    avatar_max_bytes: int | None
 
     model_config = ConfigDict(from_attributes=True)
@@ -1,30 +1,108 @@
-from sqlalchemy.orm import Session
+import logging
+import time
 
+from sqlalchemy import insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.metrics import LOGIN_DURATION, PASSWORD_REHASHES
+from app.core.workers import PoolSaturatedError
 from app.models.user import User
 from app.schemas.user import UserCreate
-from app.services.security import hash_password, verify_password
-
-
-def create_user(db: Session, payload: UserCreate) -> User:
-    user = User(
-        namespace=payload.namespace,
-        username=payload.username,
-        password_hash=hash_password(payload.password),
-        email=payload.email,
-        full_name=payload.full_name,
-        avatar_url=payload.avatar_url,
-        extra=payload.extra,
+from app.services import security
+from app.services.hasher import password_hasher
+from app.services.login_policy import login_failure_policy
+
+logger = logging.getLogger(__name__)
+
+
+class DuplicateUserError(ValueError):
+    def __init__(self, field: str) -> None:
+        super().__init__(f"{field.capitalize()} already exists in namespace")
+        self.field = field
+
+
+def _duplicate_field(exc: IntegrityError) -> str:
+    message = str(exc.orig)
+    if "uq_users_namespace_email" in message or "users.email" in message:
+        return "email"
+    return "username"
+
+
+async def create_user(db: AsyncSession, payload: UserCreate) -> User:
+    """Insert the user in a single `INSERT ... RETURNING`.
+
+    Uniqueness is enforced by `uq_users_namespace_username` / `uq_users_namespace_email`;
+    a violation is reported as `DuplicateUserError` naming the conflicting field.
+    """
+    password_hash = await password_hasher.hash(payload.password)
+    statement = (
+        insert(User)
+        .values(
+            namespace=payload.namespace,
+            username=payload.username,
+            password_hash=password_hash,
+            email=payload.email,
+            full_name=payload.full_name,
+            extra=payload.extra,
+        )
+        .returning(User)
     )
-    db.add(user)
-    db.commit()
-    db.refresh(user)
+    try:
+        user = await db.scalar(statement)
+        await db.commit()
+    except IntegrityError as exc:
+        await db.rollback()
+        raise DuplicateUserError(_duplicate_field(exc)) from exc
     return user
 
 
-def authenticate_user(db: Session, namespace: str, username: str, password: str) -> User | None:
-    user = db.query(User).filter(User.namespace == namespace, User.username == username).first()
-    if not user:
-        return None
-    if not verify_password(password, user.password_hash):
-        return None
-    return user
+async def _upgrade_password_hash(db: AsyncSession, user: User, password: str) -> None:
+    """Re-hash a verified password with the current scheme and cost.
+
+    The update only applies if the stored hash is unchanged, so a concurrent password
+    change wins. A saturated hasher pool skips the upgrade; the next login retries it.
+    """
+    try:
+        new_hash = await password_hasher.hash(password)
+    except PoolSaturatedError:
+        return
+    old_hash = user.password_hash
+    await db.execute(
+        update(User)
+        .where(User.id == user.id, User.password_hash == old_hash)
+        .values(password_hash=new_hash)
+        .execution_options(synchronize_session=False)
+    )
+    await db.commit()
+    scheme = security.pwd_context.identify(old_hash, required=False) or "unknown"
+    PASSWORD_REHASHES.labels(scheme).inc()
+    logger.info("upgraded password hash for user %s from %s", user.id, scheme)
+
+
+async def authenticate_user(db: AsyncSession, namespace: str, username: str, password: str) -> User | None:
+    """Return the user if the password matches.
+
+    Unknown usernames go through `login_failure_policy`, so they are not distinguishable
+    by response time. A correct password stored under a deprecated scheme or cost is
+    re-hashed. Each call is recorded in `LOGIN_DURATION` under its outcome.
+    """
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        user = await db.scalar(select(User).where(User.namespace == namespace, User.username == username))
+        if not user:
+            outcome = await login_failure_policy.unknown_user(namespace, password)
+            return None
+        verify_started = time.perf_counter()
+        verified = await password_hasher.verify(password, user.password_hash)
+        login_failure_policy.observe_verify(time.perf_counter() - verify_started)
+        if not verified:
+            outcome = "wrong_password"
+            return None
+        if security.password_needs_rehash(user.password_hash):
+            await _upgrade_password_hash(db, user, password)
+        outcome = "success"
+        return user
+    finally:
+        LOGIN_DURATION.labels(outcome).observe(time.perf_counter() - started)
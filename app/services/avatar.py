@@ -1,9 +1,40 @@
-import uuid
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import time
+from collections import Counter
+from collections.abc import AsyncIterator, Mapping
+from dataclasses import dataclass
+from functools import partial
 from io import BytesIO
-from pathlib import Path
 
-from fastapi import UploadFile
-from PIL import Image, UnidentifiedImageError
+import anyio
+from PIL import Image, ImageOps, UnidentifiedImageError
+from python_multipart.exceptions import MultipartParseError
+from python_multipart.multipart import MultipartParser, parse_options_header
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import ByteLRUCache
+from app.core.config import settings
+from app.core.metrics import AVATAR_PROCESSING_DURATION
+from app.core.periodic import run_periodically
+from app.core.workers import WorkerPool
+from app.models.avatar import AvatarObject
+from app.models.user import User
+from app.services.avatar_storage import AvatarStorage, create_avatar_storage
+from app.services.avatar_urls import (
+    AVATAR_URL_PREFIX,
+    VARIANT_EXTENSION,
+    avatar_variant_urls,
+    parse_stored_avatar_url,
+    variant_url,
+)
+
+logger = logging.getLogger(__name__)
 
 ALLOWED_IMAGE_FORMATS: dict[str, str] = {
     "JPEG": ".jpg",
@@ -11,47 +42,469 @@ ALLOWED_IMAGE_FORMATS: dict[str, str] = {
     "WEBP": ".webp",
 }
 ALLOWED_MIME_TYPES = {"image/jpeg", "image/png", "image/webp"}
+# Sniffing needs the first 12 bytes (WebP: "RIFF", 4-byte size, "WEBP").
+SNIFF_BYTES = 12
+# Room for the multipart boundaries and part headers around the file itself.
+MULTIPART_OVERHEAD_BYTES = 16 * 1024
+CONTENT_TYPES = {".jpg": "image/jpeg", ".png": "image/png", ".webp": "image/webp"}
+VARIANT_FORMAT = "WEBP"
 
+# Stored files: <sha256><ext> plus variants <sha256>_<size>.webp (see `app.services.avatar_urls`).
+_STORED_FILE = re.compile(r"^([0-9a-f]{64})(?:_\d+)?\.(?:jpg|png|webp)$")
+_VARIANT_SUFFIX = re.compile(r"_\d+\.webp$")
 
-async def save_avatar_file(upload: UploadFile, user_id: str, uploads_dir: str, max_bytes: int) -> str:
-    if upload.content_type not in ALLOWED_MIME_TYPES:
-        raise ValueError("Unsupported file type. Use JPEG, PNG, or WEBP")
+avatar_pool = WorkerPool(
+    name="avatar_processor",
+    max_workers=settings.avatar_pool_workers,
+    max_queue=settings.avatar_pool_max_queue,
+    kind=settings.avatar_pool_kind,
+    retry_after_seconds=settings.avatar_pool_retry_after_seconds,
+)
+
+avatar_storage: AvatarStorage = create_avatar_storage(
+    settings.avatar_storage_backend,
+    uploads_dir=settings.uploads_dir,
+    max_age_seconds=settings.uploads_cache_max_age_seconds,
+    memory_cache=ByteLRUCache(
+        max_bytes=settings.avatar_memory_cache_max_bytes,
+        max_item_bytes=settings.avatar_memory_cache_max_file_bytes,
+    ),
+    s3_bucket=settings.avatar_s3_bucket,
+    s3_endpoint_url=settings.avatar_s3_endpoint_url,
+    s3_region=settings.avatar_s3_region,
+    s3_key_prefix=settings.avatar_s3_key_prefix,
+    s3_presign_expiry_seconds=settings.avatar_s3_presign_expiry_seconds,
+)
+
+
+async def serve_uploads(scope, receive, send) -> None:
+    """ASGI app for `/uploads`, delegating to the configured storage backend."""
+    await avatar_storage.asgi_app(scope, receive, send)
+
+
+@dataclass(frozen=True)
+class StoredAvatar:
+    digest: str
+    extension: str
+    size_bytes: int
+
+    @property
+    def url(self) -> str:
+        return f"{AVATAR_URL_PREFIX}{self.digest[:2]}/{self.digest}{self.extension}"
+
+
+@dataclass(frozen=True)
+class ProcessedAvatar:
+    avatar: StoredAvatar
+    # (storage key, body, content type), full-size image last.
+    objects: list[tuple[str, bytes, str]]
+
+
+@dataclass
+class AvatarGCReport:
+    recounted: int = 0
+    objects_removed: int = 0
+    files_removed: int = 0
+    bytes_freed: int = 0
+
+
+def storage_key(avatar_url: str) -> str:
+    return avatar_url.removeprefix("/uploads/")
+
+
+def _encode(image: Image.Image, image_format: str, **options) -> bytes:
+    buffer = BytesIO()
+    image.save(buffer, format=image_format, **options)
+    return buffer.getvalue()
 
-    payload = await upload.read(max_bytes + 1)
-    if not payload:
-        raise ValueError("Empty file")
-    if len(payload) > max_bytes:
-        raise ValueError(f"File too large. Max size is {max_bytes} bytes")
 
+def sniff_image_format(head: bytes) -> str | None:
+    """Identify JPEG, PNG or WebP from the leading bytes of a file."""
+    if head.startswith(b"\xff\xd8\xff"):
+        return "JPEG"
+    if head.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "PNG"
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "WEBP"
+    return None
+
+
+def _without_metadata(image: Image.Image) -> Image.Image:
+    """Apply EXIF orientation, then copy pixels only, dropping EXIF/ICC/text chunks."""
+    oriented = ImageOps.exif_transpose(image)
+    if oriented.mode not in ("RGB", "RGBA", "L", "LA"):
+        has_alpha = oriented.mode in ("P", "PA") or "transparency" in oriented.info
+        oriented = oriented.convert("RGBA" if has_alpha else "RGB")
+    clean = Image.new(oriented.mode, oriented.size)
+    clean.paste(oriented)
+    return clean
+
+
+def process_avatar(source_path: str, variant_sizes: tuple[int, ...], max_pixels: int) -> ProcessedAvatar:
+    """Decode, strip metadata, and encode the avatar plus square WebP variants.
+
+    Runs on the avatar worker pool. Dimensions are checked from the header before any
+    pixel data is decoded. The digest is taken over the normalized full-size encoding, so
+    re-uploads of the same image map to the same storage keys.
+    """
+    too_large = f"Image dimensions too large. Max is {max_pixels} pixels"
     try:
-        image = Image.open(BytesIO(payload))
-        image.verify()
-        file_format = image.format
-    except UnidentifiedImageError as exc:
+        with Image.open(source_path) as probe:
+            if probe.width * probe.height > max_pixels:
+                raise ValueError(too_large)
+            probe.verify()
+        with Image.open(source_path) as image:
+            image_format = image.format
+            image.load()
+    except Image.DecompressionBombError as exc:
+        raise ValueError(too_large) from exc
+    except (UnidentifiedImageError, OSError, SyntaxError) as exc:
         raise ValueError("Invalid image payload") from exc
 
-    extension = ALLOWED_IMAGE_FORMATS.get(file_format or "")
+    extension = ALLOWED_IMAGE_FORMATS.get(image_format or "")
     if not extension:
         raise ValueError("Unsupported file type. Use JPEG, PNG, or WEBP")
 
-    user_dir = Path(uploads_dir) / "avatars" / user_id
-    user_dir.mkdir(parents=True, exist_ok=True)
-    filename = f"{uuid.uuid4().hex}{extension}"
-    destination = user_dir / filename
-    destination.write_bytes(payload)
+    clean = _without_metadata(image)
+    full_size = clean.convert("RGB") if image_format == "JPEG" and clean.mode != "RGB" else clean
+    encoded = _encode(full_size, image_format, quality=90)
+    stored = StoredAvatar(hashlib.sha256(encoded).hexdigest(), extension, len(encoded))
 
-    return f"/uploads/avatars/{user_id}/{filename}"
+    objects = []
+    for size in variant_sizes:
+        variant = ImageOps.fit(clean, (size, size), method=Image.Resampling.LANCZOS)
+        variant = variant.convert("RGBA" if "A" in variant.mode else "RGB")
+        key = storage_key(variant_url(stored.url, size))
+        objects.append((key, _encode(variant, VARIANT_FORMAT, quality=85), CONTENT_TYPES[VARIANT_EXTENSION]))
+    objects.append((storage_key(stored.url), encoded, CONTENT_TYPES[extension]))
+    return ProcessedAvatar(stored, objects)
 
 
-def delete_avatar_file(avatar_url: str | None, uploads_dir: str) -> None:
-    if not avatar_url or not avatar_url.startswith("/uploads/"):
+def _store_objects(storage: AvatarStorage, objects: list[tuple[str, bytes, str]]) -> None:
+    # The full-size object is written last, so its presence means the variants are in
+    # place too and a re-upload of the same image writes nothing.
+    if storage.exists(objects[-1][0]):
         return
+    for key, data, content_type in objects:
+        storage.put(key, data, content_type)
+
+
+class _MultipartFileReader:
+    """Incremental multipart/form-data parser that keeps only the bytes of the `file` part.
+
+    Parser callbacks are synchronous, so each `feed` returns the file bytes found in that
+    chunk and the caller writes them out. Other parts are parsed and discarded.
+    """
+
+    def __init__(self, boundary: bytes) -> None:
+        self.found = False
+        self.content_type: str | None = None
+        self._in_file = False
+        self._headers: dict[bytes, bytes] = {}
+        self._header_field = b""
+        self._header_value = b""
+        self._data: list[bytes] = []
+        self._parser = MultipartParser(
+            boundary,
+            callbacks={
+                "on_part_begin": self._on_part_begin,
+                "on_header_field": self._on_header_field,
+                "on_header_value": self._on_header_value,
+                "on_header_end": self._on_header_end,
+                "on_headers_finished": self._on_headers_finished,
+                "on_part_data": self._on_part_data,
+                "on_part_end": self._on_part_end,
+            },
+        )
+
+    def _on_part_begin(self) -> None:
+        self._headers = {}
+
+    def _on_header_field(self, data: bytes, start: int, end: int) -> None:
+        self._header_field += data[start:end]
+
+    def _on_header_value(self, data: bytes, start: int, end: int) -> None:
+        self._header_value += data[start:end]
+
+    def _on_header_end(self) -> None:
+        self._headers[self._header_field.lower()] = self._header_value
+        self._header_field = self._header_value = b""
+
+    def _on_headers_finished(self) -> None:
+        _, options = parse_options_header(self._headers.get(b"content-disposition", b""))
+        self._in_file = not self.found and options.get(b"name") == b"file" and b"filename" in options
+        if self._in_file:
+            self.found = True
+            self.content_type = self._headers.get(b"content-type", b"").decode("latin-1").strip() or None
+
+    def _on_part_data(self, data: bytes, start: int, end: int) -> None:
+        if self._in_file:
+            self._data.append(data[start:end])
+
+    def _on_part_end(self) -> None:
+        self._in_file = False
+
+    def feed(self, chunk: bytes) -> bytes:
+        try:
+            self._parser.write(chunk)
+        except MultipartParseError as exc:
+            raise ValueError("Invalid multipart body") from exc
+        data = b"".join(self._data)
+        self._data.clear()
+        return data
 
-    relative_path = avatar_url.removeprefix("/uploads/")
-    base_dir = Path(uploads_dir).resolve()
-    avatar_path = (base_dir / relative_path).resolve()
+    def finalize(self) -> None:
+        try:
+            self._parser.finalize()
+        except MultipartParseError as exc:
+            raise ValueError("Invalid multipart body") from exc
 
-    if base_dir not in avatar_path.parents:
+
+async def _spool_upload(headers: Mapping[str, str], body: AsyncIterator[bytes], max_bytes: int) -> str:
+    """Stream the `file` part of a multipart request body into a temporary file; return its path.
+
+    Nothing has been read from the client when this starts. A `Content-Length` too large
+    for `max_bytes` plus `MULTIPART_OVERHEAD_BYTES` is rejected without reading the body,
+    and the body is cut off once it passes that bound. The part's content type, size and
+    magic bytes are checked as data arrives. File bytes are written in
+    `AVATAR_UPLOAD_CHUNK_BYTES` batches from a worker thread, so at most about one batch
+    is held in memory and the event loop never blocks on disk.
+    """
+    media_type, options = parse_options_header(headers.get("content-type", ""))
+    if media_type != b"multipart/form-data" or not options.get(b"boundary"):
+        raise ValueError("Expected a multipart/form-data upload with a file field")
+    too_large = f"File too large. Max size is {max_bytes} bytes"
+    body_limit = max_bytes + MULTIPART_OVERHEAD_BYTES
+    declared = headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > body_limit:
+        raise ValueError(too_large)
+
+    reader = _MultipartFileReader(options[b"boundary"])
+    spool = await anyio.to_thread.run_sync(
+        partial(tempfile.NamedTemporaryFile, prefix="avatar-", suffix=".upload", dir=settings.avatar_spool_dir, delete=False)
+    )
+    try:
+        body_bytes = received = 0
+        head = b""
+        pending: list[bytes] = []
+        pending_bytes = 0
+        async for chunk in body:
+            body_bytes += len(chunk)
+            if body_bytes > body_limit:
+                raise ValueError(too_large)
+            data = reader.feed(chunk)
+            if reader.found and reader.content_type not in ALLOWED_MIME_TYPES:
+                raise ValueError("Unsupported file type. Use JPEG, PNG, or WEBP")
+            if not data:
+                continue
+            received += len(data)
+            if received > max_bytes:
+                raise ValueError(too_large)
+            if len(head) < SNIFF_BYTES:
+                head += data[: SNIFF_BYTES - len(head)]
+                if len(head) == SNIFF_BYTES and sniff_image_format(head) is None:
+                    raise ValueError("Invalid image payload")
+            pending.append(data)
+            pending_bytes += len(data)
+            if pending_bytes >= settings.avatar_upload_chunk_bytes:
+                await anyio.to_thread.run_sync(spool.write, b"".join(pending))
+                pending.clear()
+                pending_bytes = 0
+        reader.finalize()
+        if not reader.found:
+            raise ValueError("Expected a multipart/form-data upload with a file field")
+        if received == 0:
+            raise ValueError("Empty file")
+        if sniff_image_format(head) is None:
+            raise ValueError("Invalid image payload")
+        if pending:
+            await anyio.to_thread.run_sync(spool.write, b"".join(pending))
+        await anyio.to_thread.run_sync(spool.close)
+    except BaseException:
+        spool.close()
+        os.unlink(spool.name)
+        raise
+    return spool.name
+
+
+async def save_avatar_file(headers: Mapping[str, str], body: AsyncIterator[bytes], max_bytes: int) -> ProcessedAvatar:
+    started = time.perf_counter()
+    source_path = await _spool_upload(headers, body, max_bytes)
+    spooled = time.perf_counter()
+    AVATAR_PROCESSING_DURATION.labels("spool").observe(spooled - started)
+    try:
+        processed = await avatar_pool.run(
+            process_avatar,
+            source_path,
+            tuple(settings.avatar_variant_sizes),
+            settings.avatar_max_pixels,
+        )
+    finally:
+        os.unlink(source_path)
+        AVATAR_PROCESSING_DURATION.labels("process").observe(time.perf_counter() - spooled)
+
+    stored = time.perf_counter()
+    await anyio.to_thread.run_sync(_store_objects, avatar_storage, processed.objects)
+    AVATAR_PROCESSING_DURATION.labels("store").observe(time.perf_counter() - stored)
+    return processed
+
+
+async def ensure_avatar_stored(processed: ProcessedAvatar) -> None:
+    """Write the avatar's objects again if they are missing. Call after its reference is committed.
+
+    An upload that found the files present skips writing them. If the last other reference
+    was released at that moment, `release_unreferenced_avatars` may remove the files before
+    this upload's reference lands; this puts them back.
+    """
+    await anyio.to_thread.run_sync(_store_objects, avatar_storage, processed.objects)
+
+
+async def add_avatar_reference(db: AsyncSession, avatar: StoredAvatar) -> None:
+    """Count one more user pointing at `avatar`. The caller commits."""
+    dialect = sqlite if db.get_bind().dialect.name == "sqlite" else postgresql
+    statement = dialect.insert(AvatarObject).values(
+        digest=avatar.digest,
+        extension=avatar.extension,
+        size_bytes=avatar.size_bytes,
+        refcount=1,
+    )
+    await db.execute(
+        statement.on_conflict_do_update(
+            index_elements=[AvatarObject.digest],
+            set_={"refcount": AvatarObject.refcount + 1},
+        )
+    )
+
+
+async def drop_avatar_reference(db: AsyncSession, avatar_url: str | None) -> None:
+    """Count one fewer user pointing at `avatar_url`. The caller commits."""
+    stored = parse_stored_avatar_url(avatar_url)
+    if stored is None:
         return
-    if avatar_path.exists() and avatar_path.is_file():
-        avatar_path.unlink()
+    await db.execute(
+        update(AvatarObject)
+        .where(AvatarObject.digest == stored[0], AvatarObject.refcount > 0)
+        .values(refcount=AvatarObject.refcount - 1)
+    )
+
+
+def _delete_objects(storage: AvatarStorage, keys: list[str]) -> tuple[int, int]:
+    removed = freed = 0
+    for key in keys:
+        size = storage.delete(key)
+        if size is not None:
+            removed += 1
+            freed += size
+    return removed, freed
+
+
+def _avatar_keys(avatar_url: str) -> list[str]:
+    variant_urls = (avatar_variant_urls(avatar_url) or {}).values()
+    return [storage_key(url) for url in (*variant_urls, avatar_url)]
+
+
+async def release_unreferenced_avatars(db: AsyncSession, batch_size: int = 100) -> AvatarGCReport:
+    """Delete avatar objects whose refcount dropped to zero, together with their files.
+
+    Each batch deletes its rows, removes the files, and only then commits. The deleted rows
+    stay locked meanwhile, so an upload that re-references one of them waits for the commit
+    and then rewrites the files in `ensure_avatar_stored`. If removing files fails, the
+    batch is rolled back and retried on the next run.
+    """
+    report = AvatarGCReport()
+    while True:
+        released_digests = (
+            select(AvatarObject.digest).where(AvatarObject.refcount <= 0).limit(batch_size).scalar_subquery()
+        )
+        released = (
+            await db.execute(
+                delete(AvatarObject)
+                .where(AvatarObject.digest.in_(released_digests), AvatarObject.refcount <= 0)
+                .returning(AvatarObject.digest, AvatarObject.extension, AvatarObject.size_bytes)
+                .execution_options(synchronize_session=False)
+            )
+        ).all()
+        try:
+            for row in released:
+                keys = _avatar_keys(StoredAvatar(*row).url)
+                removed, freed = await anyio.to_thread.run_sync(_delete_objects, avatar_storage, keys)
+                report.objects_removed += 1
+                report.files_removed += removed
+                report.bytes_freed += freed
+        except BaseException:
+            await db.rollback()
+            raise
+        await db.commit()
+        if len(released) < batch_size:
+            return report
+
+
+async def release_avatars_periodically(interval_seconds: float) -> None:
+    async def release(db: AsyncSession) -> None:
+        report = await release_unreferenced_avatars(db)
+        if report.objects_removed:
+            logger.info("released %d unreferenced avatars", report.objects_removed)
+
+    await run_periodically(interval_seconds, release, "avatar release")
+
+
+async def _referenced_avatar_urls(db: AsyncSession) -> Counter[str]:
+    result = await db.stream(
+        select(User.avatar_url).where(User.avatar_url.startswith(AVATAR_URL_PREFIX)).execution_options(yield_per=1000)
+    )
+    return Counter([url async for url in result.scalars()])
+
+
+async def collect_avatar_garbage(
+    db: AsyncSession,
+    grace_seconds: float = 3600,
+    recount: bool = False,
+) -> AvatarGCReport:
+    """Sweep avatar objects and files that no user references.
+
+    Releases objects whose refcount dropped to zero, then removes any stored file under `avatars/`
+    that is not backed by an object (content-addressed layout) or by a user's `avatar_url` (old
+    per-user layout), plus stray temporary files. Files younger than `grace_seconds` are
+    skipped so uploads that have not committed yet survive. With `recount`, refcounts are
+    first rebuilt from `users.avatar_url`.
+    """
+    report = AvatarGCReport()
+    referenced = await _referenced_avatar_urls(db)
+
+    if recount:
+        objects = (await db.execute(select(AvatarObject))).scalars().all()
+        for avatar in objects:
+            count = referenced[StoredAvatar(avatar.digest, avatar.extension, avatar.size_bytes).url]
+            if avatar.refcount != count:
+                avatar.refcount = count
+                report.recounted += 1
+        await db.commit()
+
+    released = await release_unreferenced_avatars(db)
+    report.objects_removed = released.objects_removed
+    report.files_removed = released.files_removed
+    report.bytes_freed = released.bytes_freed
+
+    live_digests = set((await db.execute(select(AvatarObject.digest))).scalars())
+    referenced_stems = {url.rpartition(".")[0] for url in referenced}
+    cutoff = time.time() - grace_seconds
+    stored_objects = await anyio.to_thread.run_sync(lambda: list(avatar_storage.list("avatars/")))
+    orphans = []
+    for stored in stored_objects:
+        if stored.modified_at > cutoff:
+            continue
+        directory, _, name = stored.key.removeprefix("avatars/").rpartition("/")
+        match = _STORED_FILE.match(name)
+        if name.startswith(".") and name.endswith(".tmp"):
+            orphaned = True
+        elif match and directory == match.group(1)[:2]:
+            orphaned = match.group(1) not in live_digests
+        else:
+            url = f"/uploads/{stored.key}"
+            orphaned = url not in referenced and _VARIANT_SUFFIX.sub("", url) not in referenced_stems
+        if orphaned:
+            orphans.append(stored.key)
+    removed, freed = await anyio.to_thread.run_sync(_delete_objects, avatar_storage, orphans)
+    report.files_removed += removed
+    report.bytes_freed += freed
+    return report
@@ -0,0 +1,275 @@
+import os
+import shutil
+import uuid
+from abc import ABC, abstractmethod
+from collections.abc import Iterator
+from dataclasses import dataclass
+from io import BytesIO
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+from starlette.responses import PlainTextResponse, RedirectResponse
+from starlette.types import ASGIApp, Receive, Scope, Send
+
+from app.core.cache import ByteLRUCache, TTLCache
+from app.core.static_files import IMMUTABLE_CACHE_CONTROL, UploadsStaticFiles
+
+if TYPE_CHECKING:
+    from botocore.client import BaseClient
+
+
+@dataclass(frozen=True)
+class StoredObject:
+    key: str
+    size_bytes: int
+    modified_at: float
+
+
+class AvatarStorage(ABC):
+    """Object store for avatar files, addressed by keys such as `avatars/ab/<sha256>.png`.
+
+    Methods block and are called from worker threads. `asgi_app` serves `/uploads/<key>`.
+    """
+
+    name: str
+    asgi_app: ASGIApp
+
+    @abstractmethod
+    def exists(self, key: str) -> bool: ...
+
+    @abstractmethod
+    def put(self, key: str, data: bytes, content_type: str) -> None: ...
+
+    @abstractmethod
+    def delete(self, key: str) -> int | None:
+        """Remove `key`; return the bytes freed, or None if it did not exist."""
+
+    @abstractmethod
+    def list(self, prefix: str) -> Iterator[StoredObject]: ...
+
+    def stats(self) -> dict:
+        return {"backend": self.name}
+
+    @abstractmethod
+    def health(self, min_free_bytes: int) -> dict:
+        """Check the store can take writes; the result has an `ok` flag plus details."""
+
+
+class FilesystemAvatarStorage(AvatarStorage):
+    """Files under a local directory, served by `UploadsStaticFiles`."""
+
+    name = "filesystem"
+
+    def __init__(self, root: str, max_age_seconds: int, memory_cache: ByteLRUCache[str]) -> None:
+        self.root = Path(root)
+        self.asgi_app = self.files = UploadsStaticFiles(
+            directory=root,
+            check_dir=False,
+            max_age_seconds=max_age_seconds,
+            memory_cache=memory_cache,
+        )
+
+    def _path(self, key: str) -> Path | None:
+        base_dir = self.root.resolve()
+        path = (base_dir / key).resolve()
+        return path if base_dir in path.parents else None
+
+    def exists(self, key: str) -> bool:
+        path = self._path(key)
+        return path is not None and path.is_file()
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        destination = self._path(key)
+        if destination is None:
+            raise ValueError(f"Invalid storage key: {key}")
+        destination.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary name and rename, so readers never see a partial file.
+        temporary = destination.with_name(f".{destination.name}.{uuid.uuid4().hex}.tmp")
+        try:
+            temporary.write_bytes(data)
+            os.replace(temporary, destination)
+        except BaseException:
+            temporary.unlink(missing_ok=True)
+            raise
+
+    def delete(self, key: str) -> int | None:
+        path = self._path(key)
+        if path is None or not path.is_file():
+            return None
+        size = path.stat().st_size
+        path.unlink(missing_ok=True)
+        return size
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        directory = self._path(prefix.rstrip("/"))
+        if directory is None or not directory.is_dir():
+            return
+        for path in directory.rglob("*"):
+            if path.is_file():
+                stat = path.stat()
+                key = path.relative_to(self.root.resolve()).as_posix()
+                yield StoredObject(key, stat.st_size, stat.st_mtime)
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "memory_cache": self.files.memory_cache.stats()}
+
+    def health(self, min_free_bytes: int) -> dict:
+        try:
+            self.root.mkdir(parents=True, exist_ok=True)
+            probe = self.root / f".health-{uuid.uuid4().hex}.tmp"
+            probe.write_bytes(b"ok")
+            probe.unlink()
+            free_bytes = shutil.disk_usage(self.root).free
+        except OSError as exc:
+            return {"ok": False, "backend": self.name, "error": f"not writable: {exc.strerror or exc}"}
+        return {
+            "ok": free_bytes >= min_free_bytes,
+            "backend": self.name,
+            "free_bytes": free_bytes,
+            "min_free_bytes": min_free_bytes,
+        }
+
+
+class PresignedRedirect:
+    """ASGI app answering `GET /uploads/<key>` with a redirect to a presigned object URL.
+
+    Presigned URLs are reused for half their lifetime, and the redirect may be cached for
+    the same period, so clients fetch the same URL and keep hitting their HTTP cache.
+    """
+
+    def __init__(self, storage: "S3AvatarStorage") -> None:
+        self.storage = storage
+        self.max_age_seconds = max(1, storage.presign_expiry_seconds // 2)
+        self.urls: TTLCache[str, str] = TTLCache(max_entries=10_000, ttl_seconds=self.max_age_seconds)
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        key = scope["path"].removeprefix(scope.get("root_path", "")).lstrip("/")
+        if scope["method"] not in ("GET", "HEAD"):
+            response = PlainTextResponse("Method Not Allowed", status_code=405, headers={"Allow": "GET, HEAD"})
+        elif not key.startswith("avatars/") or ".." in key.split("/"):
+            response = PlainTextResponse("Not Found", status_code=404)
+        else:
+            url = self.urls.get(key)
+            if url is None:
+                url = self.storage.presigned_url(key)
+                self.urls.set(key, url)
+            response = RedirectResponse(
+                url,
+                status_code=307,
+                headers={"Cache-Control": f"private, max-age={self.max_age_seconds}"},
+            )
+        await response(scope, receive, send)
+
+
+class S3AvatarStorage(AvatarStorage):
+    """Objects in an S3-compatible bucket (AWS S3, MinIO, Ceph, moto).
+
+    Uploads go through boto3's managed transfer, which switches to multipart uploads for
+    large bodies. Clients are redirected to presigned GET URLs and download straight from
+    the bucket.
+    """
+
+    name = "s3"
+
+    def __init__(self, client: "BaseClient", bucket: str, key_prefix: str = "", presign_expiry_seconds: int = 3600) -> None:
+        self.client = client
+        self.bucket = bucket
+        self.key_prefix = key_prefix
+        self.presign_expiry_seconds = presign_expiry_seconds
+        self.asgi_app = self.redirect = PresignedRedirect(self)
+
+    @classmethod
+    def from_settings(
+        cls,
+        bucket: str | None,
+        endpoint_url: str | None,
+        region: str | None,
+        key_prefix: str,
+        presign_expiry_seconds: int,
+    ) -> "S3AvatarStorage":
+        try:
+            import boto3
+        except ImportError as exc:
+            raise RuntimeError("AVATAR_STORAGE_BACKEND=s3 requires the 's3' extra: pip install -e .[s3]") from exc
+        if not bucket:
+            raise RuntimeError("AVATAR_STORAGE_BACKEND=s3 requires AVATAR_S3_BUCKET")
+        client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        return cls(client, bucket, key_prefix, presign_expiry_seconds)
+
+    def _object_key(self, key: str) -> str:
+        return f"{self.key_prefix}{key}"
+
+    def _head(self, key: str) -> dict[str, Any] | None:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._object_key(key))
+        except ClientError as exc:
+            if exc.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def put(self, key: str, data: bytes, content_type: str) -> None:
+        self.client.upload_fileobj(
+            BytesIO(data),
+            self.bucket,
+            self._object_key(key),
+            ExtraArgs={"ContentType": content_type, "CacheControl": IMMUTABLE_CACHE_CONTROL},
+        )
+
+    def delete(self, key: str) -> int | None:
+        head = self._head(key)
+        if head is None:
+            return None
+        self.client.delete_object(Bucket=self.bucket, Key=self._object_key(key))
+        return int(head.get("ContentLength", 0))
+
+    def list(self, prefix: str) -> Iterator[StoredObject]:
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._object_key(prefix)):
+            for item in page.get("Contents", []):
+                yield StoredObject(
+                    item["Key"].removeprefix(self.key_prefix),
+                    item["Size"],
+                    item["LastModified"].timestamp(),
+                )
+
+    def presigned_url(self, key: str) -> str:
+        return self.client.generate_presigned_url(
+            "get_object",
+            Params={"Bucket": self.bucket, "Key": self._object_key(key)},
+            ExpiresIn=self.presign_expiry_seconds,
+        )
+
+    def stats(self) -> dict:
+        return {"backend": self.name, "bucket": self.bucket, "presigned_url_cache": self.redirect.urls.stats()}
+
+    def health(self, min_free_bytes: int) -> dict:
+        from botocore.exceptions import BotoCoreError, ClientError
+
+        try:
+            self.client.head_bucket(Bucket=self.bucket)
+        except (BotoCoreError, ClientError) as exc:
+            return {"ok": False, "backend": self.name, "bucket": self.bucket, "error": str(exc)}
+        return {"ok": True, "backend": self.name, "bucket": self.bucket}
+
+
+def create_avatar_storage(
+    kind: str,
+    uploads_dir: str,
+    max_age_seconds: int,
+    memory_cache: ByteLRUCache[str],
+    s3_bucket: str | None = None,
+    s3_endpoint_url: str | None = None,
+    s3_region: str | None = None,
+    s3_key_prefix: str = "",
+    s3_presign_expiry_seconds: int = 3600,
+) -> AvatarStorage:
+    if kind == "s3":
+        return S3AvatarStorage.from_settings(
+            s3_bucket, s3_endpoint_url, s3_region, s3_key_prefix, s3_presign_expiry_seconds
+        )
+    return FilesystemAvatarStorage(uploads_dir, max_age_seconds, memory_cache)
@@ -0,0 +1,32 @@
+"""Avatar URL helpers with no image, storage or worker dependencies, for use by the schemas."""
+
+import re
+
+from app.core.config import settings
+
+VARIANT_EXTENSION = ".webp"
+AVATAR_URL_PREFIX = "/uploads/avatars/"
+
+# Content-addressed objects live at avatars/<first two hex chars>/<sha256><ext>, with
+# variants stored next to them as <sha256>_<size>.webp.
+_STORED_URL = re.compile(r"^/uploads/avatars/([0-9a-f]{2})/([0-9a-f]{64})(\.(?:jpg|png|webp))$")
+
+
+def parse_stored_avatar_url(avatar_url: str | None) -> tuple[str, str] | None:
+    """Return `(digest, extension)` for a content-addressed avatar URL, else None."""
+    match = _STORED_URL.match(avatar_url or "")
+    if not match or not match.group(2).startswith(match.group(1)):
+        return None
+    return match.group(2), match.group(3)
+
+
+def variant_url(avatar_url: str, size: int) -> str:
+    stem, _, _ = avatar_url.rpartition(".")
+    return f"{stem}_{size}{VARIANT_EXTENSION}"
+
+
+def avatar_variant_urls(avatar_url: str | None) -> dict[str, str] | None:
+    """Variant URLs of a content-addressed avatar. Older per-user avatars have no variants."""
+    if parse_stored_avatar_url(avatar_url) is None:
+        return None
+    return {str(size): variant_url(avatar_url, size) for size in settings.avatar_variant_sizes}
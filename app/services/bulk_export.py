@@ -0,0 +1,60 @@
+import csv
+import io
+import json
+from collections.abc import AsyncIterator
+from typing import Literal
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.user import User
+from app.schemas.user import UserOut
+
+ExportFormat = Literal["ndjson", "csv"]
+
+EXPORT_FIELDS = tuple(UserOut.model_fields)
+EXPORT_COLUMNS = [getattr(User, field) for field in EXPORT_FIELDS]
+
+
+async def iter_namespace_users(
+    db: AsyncSession,
+    namespace: str,
+    after: str | None = None,
+    batch_size: int = 1000,
+) -> AsyncIterator[dict]:
+    """Yield `UserOut` fields for every user in `namespace`, ordered by id.
+
+    Rows are read through a server-side cursor in `batch_size` chunks, so memory stays
+    flat regardless of namespace size. Pass the last exported id as `after` to resume.
+    """
+    statement = select(*EXPORT_COLUMNS).where(User.namespace == namespace).order_by(User.id)
+    if after is not None:
+        statement = statement.where(User.id > after)
+
+    result = await db.stream(statement.execution_options(yield_per=batch_size))
+    async for row in result:
+        yield dict(row._mapping)
+
+
+async def render_ndjson(rows: AsyncIterator[dict]) -> AsyncIterator[str]:
+    async for row in rows:
+        yield json.dumps(row, separators=(",", ":")) + "\n"
+
+
+async def render_csv(rows: AsyncIterator[dict]) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    async for row in rows:
+        if row["extra"] is not None:
+            row["extra"] = json.dumps(row["extra"], separators=(",", ":"))
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def render_export(rows: AsyncIterator[dict], export_format: ExportFormat) -> AsyncIterator[str]:
+    return render_csv(rows) if export_format == "csv" else render_ndjson(rows)
@@ -0,0 +1,199 @@
+import codecs
+import csv
+import json
+import uuid
+from collections.abc import AsyncIterator, Iterable, Iterator
+from typing import BinaryIO, Literal
+
+from pydantic import ValidationError
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.user import User
+from app.schemas.user import UserImportResult, UserImportRow
+from app.services.hasher import PasswordHasher
+from app.services.security import is_supported_password_hash
+
+ImportFormat = Literal["ndjson", "csv"]
+
+# A parsed input record, or the reason it could not be parsed.
+ParsedRecord = tuple[int, dict | str]
+
+CSV_FIELDS = ("username", "password", "password_hash", "email", "full_name", "extra")
+
+
+def parse_ndjson(stream: BinaryIO) -> Iterator[ParsedRecord]:
+    for line_number, raw_line in enumerate(stream, start=1):
+        line = raw_line.strip()
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except (UnicodeDecodeError, json.JSONDecodeError):
+            yield line_number, "Invalid JSON"
+            continue
+        yield line_number, record if isinstance(record, dict) else "Expected a JSON object"
+
+
+def parse_csv(stream: BinaryIO) -> Iterator[ParsedRecord]:
+    reader = csv.DictReader(codecs.iterdecode(stream, "utf-8"))
+    for record in reader:
+        line_number = reader.line_num
+        row = {key: value for key, value in record.items() if key in CSV_FIELDS and value not in (None, "")}
+        if "extra" in row:
+            try:
+                row["extra"] = json.loads(row["extra"])
+            except json.JSONDecodeError:
+                yield line_number, "Invalid JSON in extra column"
+                continue
+        yield line_number, row
+
+
+def parse_import_stream(stream: BinaryIO, import_format: ImportFormat) -> Iterator[ParsedRecord]:
+    return parse_csv(stream) if import_format == "csv" else parse_ndjson(stream)
+
+
+def _validation_message(exc: ValidationError) -> str:
+    error = exc.errors()[0]
+    location = ".".join(str(part) for part in error["loc"])
+    return f"{location}: {error['msg']}" if location else error["msg"]
+
+
+def _error(line: int, message: str, username: str | None = None) -> UserImportResult:
+    return UserImportResult(line=line, username=username, status="error", error=message)
+
+
+async def _insert_rows(db: AsyncSession, values: list[dict]) -> set[str]:
+    """Insert `values` in one executemany; on a constraint race, retry row by row.
+
+    Returns the ids of rows that could not be inserted.
+    """
+    try:
+        await db.execute(insert(User), values)
+        await db.commit()
+        return set()
+    except IntegrityError:
+        await db.rollback()
+
+    rejected: set[str] = set()
+    for value in values:
+        try:
+            await db.execute(insert(User), [value])
+            await db.commit()
+        except IntegrityError:
+            await db.rollback()
+            rejected.add(value["id"])
+    return rejected
+
+
+async def _import_batch(
+    db: AsyncSession,
+    namespace: str,
+    batch: list[ParsedRecord],
+    hasher: PasswordHasher,
+) -> list[UserImportResult]:
+    results: dict[int, UserImportResult] = {}
+    candidates: list[tuple[int, UserImportRow]] = []
+    batch_usernames: set[str] = set()
+    batch_emails: set[str] = set()
+
+    for line, record in batch:
+        if isinstance(record, str):
+            results[line] = _error(line, record)
+            continue
+        try:
+            row = UserImportRow.model_validate(record)
+        except ValidationError as exc:
+            username = record.get("username")
+            results[line] = _error(line, _validation_message(exc), username if isinstance(username, str) else None)
+            continue
+        if row.password_hash is not None and not is_supported_password_hash(row.password_hash):
+            schemes = ", ".join(settings.password_hash_schemes)
+            results[line] = _error(line, f"password_hash: not a valid hash for the configured schemes ({schemes})", row.username)
+            continue
+        if row.username in batch_usernames:
+            results[line] = _error(line, "Duplicate username in import", row.username)
+            continue
+        if row.email and row.email in batch_emails:
+            results[line] = _error(line, "Duplicate email in import", row.username)
+            continue
+        batch_usernames.add(row.username)
+        if row.email:
+            batch_emails.add(row.email)
+        candidates.append((line, row))
+
+    if candidates:
+        conflicts = await db.execute(
+            select(User.username, User.email).where(
+                User.namespace == namespace,
+                or_(User.username.in_(batch_usernames), User.email.in_(batch_emails)),
+            )
+        )
+        existing_usernames: set[str] = set()
+        existing_emails: set[str] = set()
+        for username, email in conflicts:
+            existing_usernames.add(username)
+            if email:
+                existing_emails.add(email)
+
+        accepted: list[tuple[int, UserImportRow]] = []
+        for line, row in candidates:
+            if row.username in existing_usernames:
+                results[line] = _error(line, "Username already exists in namespace", row.username)
+            elif row.email and row.email in existing_emails:
+                results[line] = _error(line, "Email already exists in namespace", row.username)
+            else:
+                accepted.append((line, row))
+
+        plain_passwords = [row.password for _, row in accepted if row.password is not None]
+        hashed = iter(await hasher.hash_many(plain_passwords))
+        values_by_line: dict[int, dict] = {}
+        for line, row in accepted:
+            values_by_line[line] = {
+                "id": str(uuid.uuid4()),
+                "namespace": namespace,
+                "username": row.username,
+                "password_hash": row.password_hash if row.password_hash is not None else next(hashed),
+                "token_version": 0,
+                "email": row.email,
+                "full_name": row.full_name,
+                "extra": row.extra,
+                "is_active": True,
+            }
+
+        rejected_ids = await _insert_rows(db, list(values_by_line.values())) if values_by_line else set()
+        for line, row in accepted:
+            user_id = values_by_line[line]["id"]
+            if user_id in rejected_ids:
+                results[line] = _error(line, "Username or email already exists in namespace", row.username)
+            else:
+                results[line] = UserImportResult(line=line, username=row.username, status="created", id=user_id)
+
+    return [results[line] for line in sorted(results)]
+
+
+async def import_users(
+    db: AsyncSession,
+    namespace: str,
+    records: Iterable[ParsedRecord],
+    hasher: PasswordHasher,
+    batch_size: int = 1000,
+) -> AsyncIterator[UserImportResult]:
+    """Import users into `namespace` in batches, yielding one result per input record.
+
+    Each batch costs one conflict SELECT and one executemany INSERT; plain passwords
+    are hashed concurrently on `hasher`, and rows may carry a `password_hash` in one of
+    PASSWORD_HASH_SCHEMES instead. Rows that fail validation or conflict are reported and skipped.
+    """
+    batch: list[ParsedRecord] = []
+    for record in records:
+        batch.append(record)
+        if len(batch) >= batch_size:
+            for result in await _import_batch(db, namespace, batch, hasher):
+                yield result
+            batch = []
+    if batch:
+        for result in await _import_batch(db, namespace, batch, hasher):
+            yield result
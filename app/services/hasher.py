@@ -0,0 +1,55 @@
+import asyncio
+import time
+
+from app.core.config import settings
+from app.core.metrics import PASSWORD_HASH_DURATION
+from app.core.workers import WorkerPool
+from app.services import security
+
+
+class PasswordHasher:
+    """Runs bcrypt hashing and verification on a bounded worker pool."""
+
+    def __init__(self, pool: WorkerPool) -> None:
+        self.pool = pool
+
+    async def hash(self, password: str) -> str:
+        started = time.perf_counter()
+        try:
+            return await self.pool.run(security.hash_password, password)
+        finally:
+            PASSWORD_HASH_DURATION.labels("hash").observe(time.perf_counter() - started)
+
+    async def hash_many(self, passwords: list[str]) -> list[str]:
+        """Hash a batch, keeping at most `max_workers` jobs in the pool so bulk work never overfills its queue."""
+        semaphore = asyncio.Semaphore(self.pool.max_workers)
+
+        async def _hash(password: str) -> str:
+            async with semaphore:
+                return await self.hash(password)
+
+        return list(await asyncio.gather(*(_hash(password) for password in passwords)))
+
+    async def verify(self, plain_password: str, password_hash: str) -> bool:
+        started = time.perf_counter()
+        try:
+            return await self.pool.run(security.verify_password, plain_password, password_hash)
+        finally:
+            PASSWORD_HASH_DURATION.labels("verify").observe(time.perf_counter() - started)
+
+    def stats(self) -> dict:
+        return self.pool.stats()
+
+    def shutdown(self) -> None:
+        self.pool.shutdown()
+
+
+password_hasher = PasswordHasher(
+    WorkerPool(
+        name="password_hasher",
+        max_workers=settings.password_hash_workers,
+        max_queue=settings.password_hash_max_queue,
+        kind=settings.password_hash_pool_kind,
+        retry_after_seconds=settings.password_hash_retry_after_seconds,
+    )
+)
@@ -0,0 +1,87 @@
+import asyncio
+import time
+
+import anyio
+from sqlalchemy import text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import app.services.avatar as avatar_service
+from app.core.config import settings
+from app.db.pool import pool_stats
+from app.services.hasher import PasswordHasher
+
+
+async def check_database(db: AsyncSession) -> dict:
+    started = time.perf_counter()
+    try:
+        await asyncio.wait_for(db.execute(text("SELECT 1")), timeout=settings.health_db_timeout_seconds)
+    except TimeoutError:
+        return {"ok": False, "error": f"no reply within {settings.health_db_timeout_seconds}s"}
+    except Exception as exc:
+        return {"ok": False, "error": type(exc).__name__}
+    return {"ok": True, "rtt_ms": round((time.perf_counter() - started) * 1000, 3)}
+
+
+def check_db_pool(db: AsyncSession) -> dict:
+    stats = pool_stats(db.get_bind().pool)
+    if "size" not in stats:
+        return {"ok": True, "pool_class": stats["pool_class"]}
+    capacity = stats["size"] + stats["max_overflow"]
+    utilization = stats["checked_out"] / capacity if capacity else 0.0
+    return {
+        "ok": utilization < settings.health_db_pool_max_utilization,
+        "checked_out": stats["checked_out"],
+        "capacity": capacity,
+        "utilization": round(utilization, 3),
+    }
+
+
+def check_password_hasher(hasher: PasswordHasher) -> dict:
+    pool = hasher.pool
+    ratio = pool.queue_depth / pool.max_queue if pool.max_queue else 0.0
+    return {
+        "ok": ratio < settings.health_hasher_max_queue_ratio,
+        "queue_depth": pool.queue_depth,
+        "max_queue": pool.max_queue,
+        "in_flight": pool.in_flight,
+    }
+
+
+class ReadinessProbe:
+    """Runs the readiness checks at most once per `ttl_seconds`, however often it is polled.
+
+    Concurrent callers during a refresh wait for the one in-flight check instead of
+    starting their own, so load-balancer probes never add load to the database.
+    """
+
+    def __init__(self, ttl_seconds: float) -> None:
+        self.ttl_seconds = ttl_seconds
+        self._result: dict | None = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
+
+    async def check(self, db: AsyncSession, hasher: PasswordHasher) -> tuple[dict, bool]:
+        """Return the readiness report and whether it came from the cache."""
+        if self._result is not None and time.monotonic() < self._expires_at:
+            return self._result, True
+        async with self._lock:
+            if self._result is not None and time.monotonic() < self._expires_at:
+                return self._result, True
+            checks = {
+                "database": await check_database(db),
+                "db_pool": check_db_pool(db),
+                "storage": await anyio.to_thread.run_sync(
+                    avatar_service.avatar_storage.health, settings.health_uploads_min_free_bytes
+                ),
+                "password_hasher": check_password_hasher(hasher),
+            }
+            self._result = {"status": "ok" if all(check["ok"] for check in checks.values()) else "fail", "checks": checks}
+            self._expires_at = time.monotonic() + self.ttl_seconds
+            return self._result, False
+
+    def reset(self) -> None:
+        self._result = None
+        self._expires_at = 0.0
+
+
+readiness_probe = ReadinessProbe(ttl_seconds=settings.health_cache_seconds)
@@ -0,0 +1,91 @@
+import asyncio
+import secrets
+import time
+from collections import defaultdict
+
+from app.core.config import settings
+from app.services.hasher import PasswordHasher, password_hasher
+
+
+class LoginFailurePolicy:
+    """Makes a login for an unknown username cost about as much wall time as a wrong password.
+
+    With `dummy_hash`, the password is verified against a precomputed hash on the same
+    hasher pool as real logins, so latency and queueing look the same to the caller.
+    At most `max_concurrent_per_namespace` dummy verifications run at once per namespace.
+    Beyond that, the request sleeps for the recent average verify time without using a
+    worker, so a flood of junk usernames cannot take the hashing capacity real users need.
+    `skip` answers immediately, which is cheapest but reveals which usernames exist.
+    """
+
+    # Weight of the newest sample in the moving average of verify time.
+    SMOOTHING = 0.1
+
+    def __init__(self, hasher: PasswordHasher, mode: str, max_concurrent_per_namespace: int) -> None:
+        self.hasher = hasher
+        self.mode = mode
+        self.max_concurrent_per_namespace = max_concurrent_per_namespace
+        self.verified = 0
+        self.delayed = 0
+        self._active: defaultdict[str, int] = defaultdict(int)
+        self._dummy_hash: str | None = None
+        self._dummy_hash_lock = asyncio.Lock()
+        self._verify_seconds = 0.0
+
+    def observe_verify(self, seconds: float) -> None:
+        """Feed the duration of a real password verification into the moving average."""
+        if self._verify_seconds == 0.0:
+            self._verify_seconds = seconds
+        else:
+            self._verify_seconds += self.SMOOTHING * (seconds - self._verify_seconds)
+
+    async def _get_dummy_hash(self) -> str:
+        if self._dummy_hash is None:
+            async with self._dummy_hash_lock:
+                if self._dummy_hash is None:
+                    started = time.perf_counter()
+                    self._dummy_hash = await self.hasher.hash(secrets.token_urlsafe(16))
+                    # Hashing and verifying cost the same work factor; seed the average with it.
+                    if self._verify_seconds == 0.0:
+                        self._verify_seconds = time.perf_counter() - started
+        return self._dummy_hash
+
+    async def unknown_user(self, namespace: str, password: str) -> str:
+        """Spend the failure budget for a login whose username does not exist; return the outcome label."""
+        if self.mode == "skip":
+            return "unknown_user_skipped"
+        if self._active[namespace] >= self.max_concurrent_per_namespace:
+            self.delayed += 1
+            await asyncio.sleep(self._verify_seconds)
+            return "unknown_user_delayed"
+
+        self._active[namespace] += 1
+        try:
+            await self.hasher.verify(password, await self._get_dummy_hash())
+        finally:
+            self._active[namespace] -= 1
+            if not self._active[namespace]:
+                del self._active[namespace]
+        self.verified += 1
+        return "unknown_user"
+
+    def reset(self) -> None:
+        self._dummy_hash = None
+        self._verify_seconds = 0.0
+
+    def stats(self) -> dict:
+        return {
+            "mode": self.mode,
+            "max_concurrent_per_namespace": self.max_concurrent_per_namespace,
+            "active_namespaces": len(self._active),
+            "dummy_verifications": self.verified,
+            "delayed": self.delayed,
+            "verify_seconds_average": round(self._verify_seconds, 6),
+        }
+
+
+login_failure_policy = LoginFailurePolicy(
+    password_hasher,
+    mode=settings.login_unknown_user_policy,
+    max_concurrent_per_namespace=settings.login_dummy_verify_max_per_namespace,
+)
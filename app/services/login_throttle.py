@@ -0,0 +1,82 @@
+import hashlib
+
+from app.core.cache_backend import CacheBackend, create_cache_backend
+from app.core.config import settings
+from app.core.rate_limit import SlidingWindowLimiter
+
+
+class LoginThrottle:
+    """Brute-force throttling for `/auth/login`, checked before any database or bcrypt work.
+
+    - per client IP, every attempt counts
+    - per `(namespace, username)`, only failed attempts count. Users who know their
+      password are not throttled by their own logins, and password spraying spread over
+      many IPs still stops after a few failures per account.
+
+    Each attempt reserves an account failure before the password is verified and gives it
+    back if the login succeeds, so concurrent guesses cannot all slip in under the limit.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        enabled: bool,
+        ip_attempts: int,
+        ip_window_seconds: float,
+        account_failures: int,
+        account_window_seconds: float,
+        key_prefix: str,
+    ) -> None:
+        self.enabled = enabled
+        self.ip_limiter = SlidingWindowLimiter("login_ip", backend, ip_attempts, ip_window_seconds, key_prefix)
+        self.account_limiter = SlidingWindowLimiter(
+            "login_account", backend, account_failures, account_window_seconds, key_prefix
+        )
+
+    @property
+    def backend(self) -> CacheBackend:
+        return self.ip_limiter.backend
+
+    @backend.setter
+    def backend(self, backend: CacheBackend) -> None:
+        self.ip_limiter.backend = backend
+        self.account_limiter.backend = backend
+
+    @staticmethod
+    def _account_key(namespace: str, username: str) -> str:
+        # Hashed so usernames never appear in the shared store and separators cannot collide.
+        return hashlib.sha256(f"{namespace}\0{username}".encode()).hexdigest()[:32]
+
+    async def check(self, client_ip: str, namespace: str, username: str) -> str | None:
+        """Raise `RateLimitedError` if this attempt must be rejected.
+
+        Otherwise the attempt counts as an account failure until the returned reservation
+        is passed to `release`.
+        """
+        if not self.enabled:
+            return None
+        await self.ip_limiter.hit(client_ip)
+        return await self.account_limiter.acquire(self._account_key(namespace, username))
+
+    async def release(self, reservation: str | None) -> None:
+        """Un-count an attempt that did not fail on its password."""
+        await self.account_limiter.release(reservation)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": type(self.backend).__name__,
+            "ip": self.ip_limiter.stats(),
+            "account": self.account_limiter.stats(),
+        }
+
+
+login_throttle = LoginThrottle(
+    backend=create_cache_backend(settings.rate_limit_backend, settings.redis_url, settings.rate_limit_max_keys),
+    enabled=settings.login_rate_limit_enabled,
+    ip_attempts=settings.login_rate_limit_ip_attempts,
+    ip_window_seconds=settings.login_rate_limit_ip_window_seconds,
+    account_failures=settings.login_rate_limit_account_failures,
+    account_window_seconds=settings.login_rate_limit_account_window_seconds,
+    key_prefix=settings.cache_key_prefix,
+)
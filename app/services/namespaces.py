@@ -0,0 +1,129 @@
+import logging
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+from app.core.periodic import run_in_session, run_periodically
+from app.models.userspace import UserSpace
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class NamespaceConfig:
+    """Read-only copy of a `UserSpace` row. A `None` setting means the service-wide default applies."""
+
+    namespace: str
+    name: str
+    description: str | None
+    registration_open: bool
+    access_token_expire_minutes: int | None
+    refresh_token_expire_days: int | None
+    avatar_max_bytes: int | None
+    updated_at: datetime
+
+    @classmethod
+    def from_userspace(cls, userspace: UserSpace) -> "NamespaceConfig":
+        return cls(
+            namespace=userspace.namespace,
+            name=userspace.name,
+            description=userspace.description,
+            registration_open=userspace.registration_open,
+            access_token_expire_minutes=userspace.access_token_expire_minutes,
+            refresh_token_expire_days=userspace.refresh_token_expire_days,
+            avatar_max_bytes=userspace.avatar_max_bytes,
+            updated_at=userspace.updated_at,
+        )
+
+    @property
+    def effective_access_token_expire_minutes(self) -> int:
+        if self.access_token_expire_minutes is None:
+            return settings.access_token_expire_minutes
+        return self.access_token_expire_minutes
+
+    @property
+    def effective_refresh_token_expire_days(self) -> int:
+        if self.refresh_token_expire_days is None:
+            return settings.refresh_token_expire_days
+        return self.refresh_token_expire_days
+
+    @property
+    def effective_avatar_max_bytes(self) -> int:
+        return settings.avatar_max_bytes if self.avatar_max_bytes is None else self.avatar_max_bytes
+
+
+class NamespaceRegistry:
+    """Per-process cache of namespaces and their settings, so request paths skip the `userspaces` table.
+
+    It is loaded at startup and then refreshed incrementally. Each refresh reads only rows
+    whose `updated_at` is at or after the newest one seen, so changes made through another
+    worker show up within one interval. Writes through this worker update it at once.
+    Namespaces are never deleted. A lookup for an unknown namespace reads its row by
+    primary key, and misses are not cached, so a namespace created on another worker is
+    found on the next lookup.
+    """
+
+    # Re-read rows slightly older than the watermark, to catch transactions that committed late.
+    REFRESH_OVERLAP = timedelta(seconds=5)
+
+    def __init__(self, max_entries: int) -> None:
+        self.entries: TTLCache[str, NamespaceConfig] = TTLCache(max_entries=max_entries, ttl_seconds=None)
+        self.watermark: datetime | None = None
+        self.refreshes = 0
+        self.rows_refreshed = 0
+
+    def put(self, userspace: UserSpace) -> NamespaceConfig:
+        config = NamespaceConfig.from_userspace(userspace)
+        self.entries.set(config.namespace, config)
+        return config
+
+    async def get(self, db: AsyncSession, namespace: str) -> NamespaceConfig | None:
+        config = self.entries.get(namespace)
+        if config is not None:
+            return config
+        userspace = await db.get(UserSpace, namespace)
+        return self.put(userspace) if userspace is not None else None
+
+    async def refresh(self, db: AsyncSession) -> int:
+        """Load rows changed since the last refresh (all rows the first time); return how many."""
+        statement = select(UserSpace).order_by(UserSpace.updated_at)
+        if self.watermark is not None:
+            statement = statement.where(UserSpace.updated_at >= self.watermark - self.REFRESH_OVERLAP)
+        count = 0
+        for userspace in await db.scalars(statement):
+            self.put(userspace)
+            if self.watermark is None or userspace.updated_at > self.watermark:
+                self.watermark = userspace.updated_at
+            count += 1
+        self.refreshes += 1
+        self.rows_refreshed += count
+        return count
+
+    async def load(self) -> None:
+        """Refresh from a fresh session. On failure, keep serving the current entries and log."""
+        await run_in_session(self.refresh, "namespace registry refresh")
+
+    async def refresh_periodically(self, interval_seconds: float) -> None:
+        await run_periodically(interval_seconds, self.refresh, "namespace registry refresh")
+
+    def clear(self) -> None:
+        self.entries.clear()
+        self.watermark = None
+
+    def stats(self) -> dict:
+        return {
+            **self.entries.stats(),
+            "refreshes": self.refreshes,
+            "rows_refreshed": self.rows_refreshed,
+        }
+
+
+namespace_registry = NamespaceRegistry(max_entries=settings.namespace_registry_max_entries)
+
+
+async def namespace_exists(db: AsyncSession, namespace: str) -> bool:
+    return await namespace_registry.get(db, namespace) is not None
@@ -0,0 +1,84 @@
+import re
+import statistics
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.models.user import User
+from app.services import security
+
+BCRYPT_PATTERN = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+ARGON2_PATTERN = re.compile(r"^\$argon2(?:id|i|d)\$v=\d+\$m=(\d+),t=(\d+),p=(\d+)\$")
+
+# Costs tried by `calibrate`: bcrypt log2 rounds, argon2 time_cost (passes over memory).
+COST_RANGES = {"bcrypt": range(4, 21), "argon2": range(1, 21)}
+
+
+def describe_hash(password_hash: str) -> tuple[str, str]:
+    """(scheme, cost parameters) of a stored hash, e.g. ("bcrypt", "rounds=12")."""
+    if match := BCRYPT_PATTERN.match(password_hash):
+        return "bcrypt", f"rounds={int(match.group(1))}"
+    if match := ARGON2_PATTERN.match(password_hash):
+        memory_kib, time_cost, parallelism = match.groups()
+        return "argon2", f"m={memory_kib},t={time_cost},p={parallelism}"
+    return "unknown", ""
+
+
+async def password_hash_report(db: AsyncSession, namespace: str | None = None, batch_size: int = 5000) -> dict:
+    """Count users per hash scheme and cost, and how many will be re-hashed on their next login."""
+    statement = select(User.password_hash).execution_options(yield_per=batch_size)
+    if namespace is not None:
+        statement = statement.where(User.namespace == namespace)
+
+    schemes: defaultdict[str, Counter[str]] = defaultdict(Counter)
+    total = needs_update = 0
+    async for password_hash in await db.stream_scalars(statement):
+        scheme, parameters = describe_hash(password_hash)
+        schemes[scheme][parameters] += 1
+        total += 1
+        needs_update += security.password_needs_rehash(password_hash)
+    return {
+        "total": total,
+        "needs_update": needs_update,
+        "configured_schemes": list(settings.password_hash_schemes),
+        "schemes": {scheme: dict(counts) for scheme, counts in sorted(schemes.items())},
+    }
+
+
+@dataclass(frozen=True)
+class CalibrationSample:
+    cost: int
+    verify_ms: float
+
+
+def calibrate(scheme: str, target_ms: float, samples: int = 5) -> tuple[int, list[CalibrationSample]]:
+    """Largest cost whose median verify time on this machine stays within `target_ms`.
+
+    Costs are tried from cheapest upwards and the search stops at the first one over the
+    target. If even the cheapest is over, it is returned anyway.
+    """
+    measured: list[CalibrationSample] = []
+    best = COST_RANGES[scheme][0]
+    for cost in COST_RANGES[scheme]:
+        context = security.build_password_context(
+            [scheme],
+            bcrypt_rounds=cost if scheme == "bcrypt" else settings.password_bcrypt_rounds,
+            argon2_time_cost=cost if scheme == "argon2" else settings.password_argon2_time_cost,
+            argon2_memory_kib=settings.password_argon2_memory_kib,
+        )
+        password_hash = context.hash("calibration-password")
+        timings = []
+        for _ in range(samples):
+            started = time.perf_counter()
+            context.verify("calibration-password", password_hash)
+            timings.append((time.perf_counter() - started) * 1000)
+        sample = CalibrationSample(cost, round(statistics.median(timings), 2))
+        measured.append(sample)
+        if sample.verify_ms > target_ms:
+            break
+        best = cost
+    return best, measured
@@ -0,0 +1,316 @@
+import hashlib
+import logging
+import secrets
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.core.config import settings
+from app.core.metrics import REFRESH_TOKEN_EVENTS
+from app.core.periodic import run_periodically
+from app.models.refresh_session import RefreshSession
+from app.models.user import User
+from app.schemas.auth import TokenPair
+from app.services.namespaces import NamespaceConfig, namespace_registry
+from app.services.security import create_access_token, create_refresh_token
+from app.services.user_cache import UserSnapshot, user_cache
+
+logger = logging.getLogger(__name__)
+
+# Sessions exchanged for a pre-session refresh token get an id derived from that token,
+# so a second exchange of the same token collides on the primary key.
+_LEGACY_SESSION_NAMESPACE = uuid.UUID("6f1d2c8e-4b7a-4f0e-9c3d-2a5b8e7f1c04")
+
+
+class RefreshTokenError(ValueError):
+    pass
+
+
+class RefreshTokenReuseError(RefreshTokenError):
+    def __init__(self) -> None:
+        super().__init__("Refresh token reuse detected")
+
+
+def hash_token_id(token_id: str) -> str:
+    # Token ids are 256-bit random values, so a plain SHA-256 cannot be brute-forced.
+    return hashlib.sha256(token_id.encode()).hexdigest()
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _refresh_days(namespace: NamespaceConfig | None) -> int:
+    return namespace.effective_refresh_token_expire_days if namespace else settings.refresh_token_expire_days
+
+
+async def _revoke_legacy_token(db: AsyncSession, user_id: str) -> None:
+    """Bump `token_version` after deleting a session started from a pre-session refresh token.
+
+    Nothing else stops that token from being exchanged again once its session is gone.
+    This also ends the user's other access tokens. The caller commits, then invalidates
+    the user cache.
+    """
+    await db.execute(update(User).where(User.id == user_id).values(token_version=User.token_version + 1))
+
+
+async def _revoke_access(session_ids: list[str], namespace: NamespaceConfig | None) -> None:
+    """Stop accepting access tokens of deleted sessions; call after the delete is committed."""
+    minutes = namespace.effective_access_token_expire_minutes if namespace else settings.access_token_expire_minutes
+    for session_id in session_ids:
+        await user_cache.revoke_session(session_id, minutes * 60)
+
+
+def _token_pair(user: User, namespace: NamespaceConfig | None, session_id: str, token_id: str) -> TokenPair:
+    access_minutes = namespace.effective_access_token_expire_minutes if namespace else None
+    return TokenPair(
+        access_token=create_access_token(user.id, user.token_version, session_id, access_minutes),
+        refresh_token=create_refresh_token(
+            user.id, user.token_version, session_id, token_id, expire_days=_refresh_days(namespace)
+        ),
+    )
+
+
+async def start_session(
+    db: AsyncSession,
+    user: User,
+    device: str | None,
+    session_id: str | None = None,
+    trim: bool = True,
+    legacy: bool = False,
+) -> TokenPair:
+    """Record a new signed-in device for `user` and return its first token pair.
+
+    Token lifetimes come from the user's namespace settings. With `trim`, the user's
+    least recently used sessions beyond `REFRESH_SESSION_MAX_PER_USER` are revoked;
+    a brand-new user has none, so registration skips that statement.
+    """
+    namespace = await namespace_registry.get(db, user.namespace)
+    session_id = session_id or str(uuid.uuid4())
+    token_id = secrets.token_urlsafe(32)
+    now = _utcnow()
+    await db.execute(
+        insert(RefreshSession).values(
+            id=session_id,
+            user_id=user.id,
+            token_hash=hash_token_id(token_id),
+            device=device[:120] if device else None,
+            legacy=legacy,
+            created_at=now,
+            last_used_at=now,
+            expires_at=now + timedelta(days=_refresh_days(namespace)),
+        )
+    )
+    trimmed: list[str] = []
+    trimmed_legacy = False
+    if trim and settings.refresh_session_max_per_user > 0:
+        trimmed, trimmed_legacy = await _trim_sessions(db, user.id, settings.refresh_session_max_per_user)
+    if trimmed_legacy:
+        await _revoke_legacy_token(db, user.id)
+    await db.commit()
+    if trimmed_legacy:
+        await user_cache.invalidate(user.id)
+    await _revoke_access(trimmed, namespace)
+    REFRESH_TOKEN_EVENTS.labels("issued").inc()
+    return _token_pair(user, namespace, session_id, token_id)
+
+
+async def _trim_sessions(db: AsyncSession, user_id: str, keep: int) -> tuple[list[str], bool]:
+    """Delete the user's sessions beyond the `keep` most recently used; return their ids and whether any was legacy."""
+    stale_ids = (
+        select(RefreshSession.id)
+        .where(RefreshSession.user_id == user_id)
+        .order_by(RefreshSession.last_used_at.desc(), RefreshSession.id)
+        .offset(keep)
+        .scalar_subquery()
+    )
+    trimmed = (
+        await db.execute(
+            delete(RefreshSession)
+            .where(RefreshSession.id.in_(stale_ids))
+            .returning(RefreshSession.id, RefreshSession.legacy)
+            .execution_options(synchronize_session=False)
+        )
+    ).all()
+    REFRESH_TOKEN_EVENTS.labels("revoked").inc(len(trimmed))
+    return [row.id for row in trimmed], any(row.legacy for row in trimmed)
+
+
+def legacy_tokens_accepted(now: datetime | None = None) -> bool:
+    """Whether pre-session refresh tokens may still be exchanged (`LEGACY_REFRESH_TOKENS_UNTIL`, UTC if naive)."""
+    cutoff = settings.legacy_refresh_tokens_until
+    if cutoff is None:
+        return True
+    if cutoff.tzinfo is None:
+        cutoff = cutoff.replace(tzinfo=timezone.utc)
+    return (now or _utcnow()) < cutoff
+
+
+async def exchange_legacy_token(db: AsyncSession, user: User, refresh_token: str, device: str | None) -> TokenPair:
+    """Move a device holding a pre-session refresh token onto a session, once per token.
+
+    The session id is derived from the token. Presenting the token again while that
+    session exists is treated like reusing a rotated token: the session is revoked.
+    Revoking a legacy session in any way bumps `token_version`, so the token is refused
+    afterwards even though its session row is gone.
+    """
+    session_id = str(uuid.uuid5(_LEGACY_SESSION_NAMESPACE, hash_token_id(refresh_token)))
+    user_id, namespace = user.id, user.namespace  # the rollback below expires `user`
+    try:
+        return await start_session(db, user, device, session_id=session_id, legacy=True)
+    except IntegrityError:
+        await db.rollback()
+    await db.execute(delete(RefreshSession).where(RefreshSession.id == session_id))
+    await _revoke_legacy_token(db, user_id)
+    await db.commit()
+    await user_cache.invalidate(user_id)
+    await _revoke_access([session_id], await namespace_registry.get(db, namespace))
+    REFRESH_TOKEN_EVENTS.labels("reuse_detected").inc()
+    logger.warning("legacy refresh token reuse detected; revoked session %s", session_id)
+    raise RefreshTokenReuseError()
+
+
+async def rotate_session(db: AsyncSession, user_id: str, session_id: str, token_id: str) -> TokenPair:
+    """Swap the session's current token for a new one, by primary key.
+
+    The swap is a compare-and-set on the stored hash, so of two concurrent refreshes with
+    the same token only one succeeds. A token that does not match the stored hash has
+    already been used; the whole session is then revoked, because either the legitimate
+    client or an attacker holds a stolen copy. The token's user is loaded first, so the
+    new expiry follows the namespace's lifetime in that single UPDATE.
+    """
+    user = await db.get(User, user_id)
+    if not user or not user.is_active:
+        raise RefreshTokenError("User not found or inactive")
+    namespace = await namespace_registry.get(db, user.namespace)
+    now = _utcnow()
+    new_token_id = secrets.token_urlsafe(32)
+    rotated = await db.scalar(
+        update(RefreshSession)
+        .where(
+            RefreshSession.id == session_id,
+            RefreshSession.user_id == user.id,
+            RefreshSession.token_hash == hash_token_id(token_id),
+            RefreshSession.expires_at > now,
+        )
+        .values(
+            token_hash=hash_token_id(new_token_id),
+            generation=RefreshSession.generation + 1,
+            last_used_at=now,
+            expires_at=now + timedelta(days=_refresh_days(namespace)),
+        )
+        .returning(RefreshSession.id)
+    )
+    if rotated is None:
+        await db.rollback()
+        await _reject(db, session_id, token_id)
+    await db.commit()
+    REFRESH_TOKEN_EVENTS.labels("rotated").inc()
+    return _token_pair(user, namespace, session_id, new_token_id)
+
+
+async def _reject(db: AsyncSession, session_id: str, token_id: str) -> None:
+    revoked = (
+        await db.execute(
+            delete(RefreshSession)
+            .where(RefreshSession.id == session_id)
+            .returning(RefreshSession.token_hash, RefreshSession.user_id, RefreshSession.legacy)
+        )
+    ).first()
+    if revoked is not None and revoked.legacy:
+        await _revoke_legacy_token(db, revoked.user_id)
+    await db.commit()
+    if revoked is not None and revoked.legacy:
+        await user_cache.invalidate(revoked.user_id)
+    if revoked is not None and revoked.token_hash != hash_token_id(token_id):
+        user = await db.get(User, revoked.user_id)
+        await _revoke_access([session_id], await namespace_registry.get(db, user.namespace) if user else None)
+        REFRESH_TOKEN_EVENTS.labels("reuse_detected").inc()
+        logger.warning("refresh token reuse detected; revoked session %s", session_id)
+        raise RefreshTokenReuseError()
+    REFRESH_TOKEN_EVENTS.labels("rejected").inc()
+    raise RefreshTokenError("Refresh token is no longer valid")
+
+
+async def list_sessions(db: AsyncSession, user_id: str) -> list[RefreshSession]:
+    result = await db.scalars(
+        select(RefreshSession)
+        .where(RefreshSession.user_id == user_id, RefreshSession.expires_at > _utcnow())
+        .order_by(RefreshSession.last_used_at.desc())
+    )
+    return list(result)
+
+
+async def revoke_session(db: AsyncSession, user: User | UserSnapshot, session_id: str) -> bool:
+    """Delete one of the user's sessions and reject its outstanding access tokens; commits.
+
+    Other sessions of the user, and their access tokens, are unaffected, unless the
+    session was started from a pre-session refresh token (see `_revoke_legacy_token`).
+    """
+    legacy = await db.scalar(
+        delete(RefreshSession)
+        .where(RefreshSession.id == session_id, RefreshSession.user_id == user.id)
+        .returning(RefreshSession.legacy)
+    )
+    if legacy:
+        await _revoke_legacy_token(db, user.id)
+    await db.commit()
+    if legacy is None:
+        return False
+    if legacy:
+        await user_cache.invalidate(user.id)
+    REFRESH_TOKEN_EVENTS.labels("revoked").inc()
+    await _revoke_access([session_id], await namespace_registry.get(db, user.namespace))
+    return True
+
+
+async def revoke_all_sessions(db: AsyncSession, user_id: str) -> int:
+    """Delete every session of the user; the caller commits."""
+    result = await db.execute(delete(RefreshSession).where(RefreshSession.user_id == user_id))
+    REFRESH_TOKEN_EVENTS.labels("revoked").inc(result.rowcount)
+    return result.rowcount
+
+
+async def sweep_expired_sessions(db: AsyncSession, batch_size: int = 1000, now: datetime | None = None) -> int:
+    """Delete expired sessions in batches along the `expires_at` index; return how many were removed.
+
+    Each batch is its own short transaction, so sweeping a large backlog never holds long locks.
+    """
+    cutoff = now or _utcnow()
+    removed = 0
+    while True:
+        expired_ids = (
+            select(RefreshSession.id).where(RefreshSession.expires_at <= cutoff).limit(batch_size).scalar_subquery()
+        )
+        swept = (
+            await db.execute(
+                delete(RefreshSession)
+                .where(RefreshSession.id.in_(expired_ids))
+                .returning(RefreshSession.user_id, RefreshSession.legacy)
+                .execution_options(synchronize_session=False)
+            )
+        ).all()
+        # A legacy token may outlive its session when the namespace's refresh lifetime is short.
+        legacy_user_ids = {row.user_id for row in swept if row.legacy}
+        for user_id in legacy_user_ids:
+            await _revoke_legacy_token(db, user_id)
+        await db.commit()
+        for user_id in legacy_user_ids:
+            await user_cache.invalidate(user_id)
+        removed += len(swept)
+        if len(swept) < batch_size:
+            break
+    REFRESH_TOKEN_EVENTS.labels("expired").inc(removed)
+    return removed
+
+
+async def sweep_sessions_periodically(interval_seconds: float, batch_size: int) -> None:
+    async def sweep(db: AsyncSession) -> None:
+        removed = await sweep_expired_sessions(db, batch_size)
+        if removed:
+            logger.info("swept %d expired refresh sessions", removed)
+
+    await run_periodically(interval_seconds, sweep, "refresh session sweep")
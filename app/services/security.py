@@ -1,11 +1,58 @@
+import hashlib
+import logging
+import time
 from datetime import datetime, timedelta, timezone
 
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.core.metrics import JWT_DECODE_DURATION
+from app.services.signing_keys import KeyRing, load_keyring
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+logger = logging.getLogger(__name__)
+
+
+def build_password_context(
+    schemes: list[str],
+    bcrypt_rounds: int,
+    argon2_time_cost: int,
+    argon2_memory_kib: int,
+) -> CryptContext:
+    """`schemes[0]` hashes new passwords; the rest are accepted for verification only.
+
+    A hash needs an update when it uses a non-default scheme or a cost other than the
+    configured one, in either direction, so lowering the cost also migrates users.
+    """
+    context = CryptContext(
+        schemes=schemes,
+        deprecated="auto",
+        bcrypt__default_rounds=bcrypt_rounds,
+        bcrypt__min_rounds=bcrypt_rounds,
+        bcrypt__max_rounds=bcrypt_rounds,
+        argon2__time_cost=argon2_time_cost,
+        argon2__memory_cost=argon2_memory_kib,
+    )
+    if "argon2" in schemes and not context.handler("argon2").has_backend():
+        raise RuntimeError("PASSWORD_HASH_SCHEMES with argon2 requires the 'argon2' extra: pip install -e .[argon2]")
+    return context
+
+
+pwd_context = build_password_context(
+    settings.password_hash_schemes,
+    settings.password_bcrypt_rounds,
+    settings.password_argon2_time_cost,
+    settings.password_argon2_memory_kib,
+)
+
+# Verified claims keyed by SHA-256 of the token string; entries never outlive the token's `exp`.
+token_cache: TTLCache[bytes, dict] = TTLCache(
+    max_entries=settings.token_cache_max_entries,
+    ttl_seconds=None,
+)
+_keyring: KeyRing | None = None
+_keyring_config: tuple[str, str, str | None, str | None] | None = None
 
 
 def hash_password(password: str) -> str:
@@ -13,10 +60,75 @@ def hash_password(password: str) -> str:
 
 
 def verify_password(plain_password: str, password_hash: str) -> bool:
-    return pwd_context.verify(plain_password, password_hash)
+    """False, rather than an error, for a hash that is malformed or not in PASSWORD_HASH_SCHEMES."""
+    try:
+        return pwd_context.verify(plain_password, password_hash)
+    except ValueError:
+        logger.warning("stored password hash is not in a configured scheme", exc_info=True)
+        return False
+
+
+def is_supported_password_hash(password_hash: str) -> bool:
+    """True if `password_hash` is a well-formed hash in one of PASSWORD_HASH_SCHEMES."""
+    scheme = pwd_context.identify(password_hash, required=False)
+    if scheme is None:
+        return False
+    try:
+        pwd_context.handler(scheme).from_string(password_hash)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
+def password_needs_rehash(password_hash: str) -> bool:
+    """True if the hash uses a deprecated scheme or cost. Unrecognised formats are left alone."""
+    try:
+        return pwd_context.needs_update(password_hash)
+    except ValueError:
+        return False
+
 
+def _keyring_settings() -> tuple[str, str, str | None, str | None]:
+    return (
+        settings.jwt_algorithm,
+        settings.jwt_secret_key,
+        settings.jwt_private_keys_dir,
+        settings.jwt_active_kid,
+    )
 
-def _create_token(subject: str, token_type: str, token_version: int, expires_delta: timedelta) -> str:
+
+def reload_signing_keys() -> KeyRing:
+    """Reload signing keys from settings; cached claims are dropped if the key set changed."""
+    global _keyring, _keyring_config
+    config = _keyring_settings()
+    keyring = load_keyring(*config)
+    if _keyring is None or keyring.fingerprint != _keyring.fingerprint:
+        token_cache.clear()
+    _keyring = keyring
+    _keyring_config = config
+    return keyring
+
+
+def get_keyring() -> KeyRing:
+    keyring = _keyring
+    if keyring is None or _keyring_config != _keyring_settings():
+        return reload_signing_keys()
+    if not keyring.is_symmetric and time.monotonic() - keyring.loaded_at >= settings.jwt_keys_reload_seconds:
+        try:
+            return reload_signing_keys()
+        except (OSError, ValueError):
+            logger.exception("signing key reload failed; keeping the previous key set")
+            keyring.loaded_at = time.monotonic()
+    return keyring
+
+
+def _create_token(
+    subject: str,
+    token_type: str,
+    token_version: int,
+    expires_delta: timedelta,
+    extra_claims: dict[str, str] | None = None,
+) -> str:
     now = datetime.now(timezone.utc)
     payload = {
         "sub": subject,
@@ -24,20 +136,83 @@ def _create_token(subject: str, token_type: str, token_version: int, expires_del
         "ver": token_version,
         "iat": int(now.timestamp()),
         "exp": int((now + expires_delta).timestamp()),
+        **(extra_claims or {}),
     }
-    return jwt.encode(payload, settings.jwt_secret_key, algorithm=settings.jwt_algorithm)
+    keyring = get_keyring()
+    if keyring.is_symmetric:
+        return jwt.encode(payload, keyring.secret, algorithm=keyring.algorithm)
+    key = keyring.active_key
+    return jwt.encode(payload, key.private_pem, algorithm=key.algorithm, headers={"kid": key.kid})
+
+
+def create_access_token(
+    subject: str,
+    token_version: int,
+    session_id: str | None = None,
+    expire_minutes: int | None = None,
+) -> str:
+    return _create_token(
+        subject,
+        "access",
+        token_version,
+        timedelta(minutes=settings.access_token_expire_minutes if expire_minutes is None else expire_minutes),
+        {"sid": session_id} if session_id else None,
+    )
 
 
-def create_access_token(subject: str, token_version: int) -> str:
-    return _create_token(subject, "access", token_version, timedelta(minutes=settings.access_token_expire_minutes))
+def create_refresh_token(
+    subject: str,
+    token_version: int,
+    session_id: str | None = None,
+    token_id: str | None = None,
+    expire_days: int | None = None,
+) -> str:
+    """Refresh token JWT. `sid`/`jti` tie it to a `RefreshSession`; tokens without them predate sessions."""
+    claims = {"sid": session_id, "jti": token_id} if session_id and token_id else None
+    days = settings.refresh_token_expire_days if expire_days is None else expire_days
+    return _create_token(subject, "refresh", token_version, timedelta(days=days), claims)
 
 
-def create_refresh_token(subject: str, token_version: int) -> str:
-    return _create_token(subject, "refresh", token_version, timedelta(days=settings.refresh_token_expire_days))
+def clear_token_cache() -> None:
+    token_cache.clear()
 
 
-def decode_token(token: str) -> dict:
+def _verify_token(token: str, keyring: KeyRing) -> dict:
+    if keyring.is_symmetric:
+        return jwt.decode(token, keyring.secret, algorithms=[keyring.algorithm])
+
+    kid = jwt.get_unverified_header(token).get("kid")
+    key = keyring.keys.get(kid)
+    if key is None:
+        raise JWTError("Unknown signing key")
+    return jwt.decode(token, key.public_jwk, algorithms=[key.algorithm])
+
+
+def decode_token(token: str, now: float | None = None) -> dict:
+    """Verified claims of `token`. `now` (Unix time, default the current time) is checked against a cached `exp`."""
+    started = time.perf_counter()
+    cache_result = "miss"
     try:
-        return jwt.decode(token, settings.jwt_secret_key, algorithms=[settings.jwt_algorithm])
-    except JWTError as exc:
-        raise ValueError("Invalid token") from exc
+        keyring = get_keyring()
+        digest = hashlib.sha256(token.encode()).digest()
+        now = time.time() if now is None else now
+
+        cached = token_cache.get(digest)
+        if cached is not None:
+            cache_result = "hit"
+            if cached["exp"] <= now:
+                token_cache.delete(digest)
+                raise ValueError("Invalid token")
+            return dict(cached)
+
+        try:
+            claims = _verify_token(token, keyring)
+        except JWTError as exc:
+            raise ValueError("Invalid token") from exc
+
+        expires_at = claims.get("exp")
+        if isinstance(expires_at, int | float):
+            token_cache.set(digest, dict(claims), expires_at - now)
+        return claims
+    finally:
+        JWT_DECODE_DURATION.labels(cache_result).observe(time.perf_counter() - started)
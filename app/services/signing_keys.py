@@ -0,0 +1,83 @@
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+
+from jose import jwk
+
+SYMMETRIC_ALGORITHMS = {"HS256", "HS384", "HS512"}
+ASYMMETRIC_ALGORITHMS = {"ES256", "ES384", "ES512", "RS256", "RS384", "RS512"}
+
+
+@dataclass(frozen=True)
+class SigningKey:
+    kid: str
+    algorithm: str
+    private_pem: str
+    public_jwk: dict
+
+
+@dataclass
+class KeyRing:
+    """Keys that can verify tokens, and the one used to sign new tokens.
+
+    Symmetric (HS*) rings hold the shared secret and publish nothing. Asymmetric rings
+    load every `<kid>.pem` private key from a directory; all of them verify, the
+    active one signs, and their public halves are published as a JWKS.
+    """
+
+    algorithm: str
+    secret: str | None = None
+    keys: dict[str, SigningKey] = field(default_factory=dict)
+    active_kid: str | None = None
+    loaded_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def is_symmetric(self) -> bool:
+        return self.algorithm in SYMMETRIC_ALGORITHMS
+
+    @property
+    def active_key(self) -> SigningKey:
+        if self.active_kid is None:
+            raise ValueError("No active signing key")
+        return self.keys[self.active_kid]
+
+    @property
+    def fingerprint(self) -> str:
+        digest = hashlib.sha256(self.algorithm.encode())
+        digest.update((self.secret or "").encode())
+        digest.update((self.active_kid or "").encode())
+        for kid in sorted(self.keys):
+            digest.update(kid.encode())
+            digest.update(json.dumps(self.keys[kid].public_jwk, sort_keys=True).encode())
+        return digest.hexdigest()
+
+    def jwks(self) -> dict:
+        return {"keys": [self.keys[kid].public_jwk for kid in sorted(self.keys)]}
+
+
+def _load_private_key(path: Path, algorithm: str) -> SigningKey:
+    kid = path.stem
+    private_pem = path.read_text()
+    public_jwk = jwk.construct(private_pem, algorithm).public_key().to_dict()
+    public_jwk.update({"kid": kid, "alg": algorithm, "use": "sig"})
+    return SigningKey(kid=kid, algorithm=algorithm, private_pem=private_pem, public_jwk=public_jwk)
+
+
+def load_keyring(algorithm: str, secret: str, keys_dir: str | None, active_kid: str | None) -> KeyRing:
+    if algorithm in SYMMETRIC_ALGORITHMS:
+        return KeyRing(algorithm=algorithm, secret=secret)
+    if algorithm not in ASYMMETRIC_ALGORITHMS:
+        raise ValueError(f"Unsupported JWT algorithm '{algorithm}'")
+    if not keys_dir:
+        raise ValueError(f"JWT_PRIVATE_KEYS_DIR is required for {algorithm}")
+
+    keys = {key.kid: key for key in (_load_private_key(path, algorithm) for path in sorted(Path(keys_dir).glob("*.pem")))}
+    if not keys:
+        raise ValueError(f"No *.pem signing keys found in {keys_dir}")
+
+    selected_kid = active_kid or max(keys)
+    if selected_kid not in keys:
+        raise ValueError(f"Active signing key '{selected_kid}' not found in {keys_dir}")
+    return KeyRing(algorithm=algorithm, keys=keys, active_kid=selected_kid)
@@ -0,0 +1,274 @@
+import asyncio
+import json
+import logging
+import time
+import uuid
+from dataclasses import asdict, dataclass
+
+from app.core.cache import TTLCache
+from app.core.cache_backend import CacheBackend, create_cache_backend
+from app.core.config import settings
+from app.models.user import User
+
+logger = logging.getLogger(__name__)
+
+# Messages on the invalidation channel besides plain user ids.
+_REVOKED_SESSION_MESSAGE = "revoked-session:"
+_SYNC_MESSAGE = "sync:"
+# Slack for clock differences between the worker that issued a token and this one.
+REVOCATION_CLOCK_SKEW_SECONDS = 5.0
+
+
+@dataclass(frozen=True)
+class UserSnapshot:
+    """Read-only copy of the user columns needed to authorize a request and render `UserOut`."""
+
+    id: str
+    namespace: str
+    username: str
+    token_version: int
+    email: str | None
+    full_name: str | None
+    avatar_url: str | None
+    extra: dict[str, str] | None
+    is_active: bool
+
+    @classmethod
+    def from_user(cls, user: User) -> "UserSnapshot":
+        return cls(
+            id=user.id,
+            namespace=user.namespace,
+            username=user.username,
+            token_version=user.token_version,
+            email=user.email,
+            full_name=user.full_name,
+            avatar_url=user.avatar_url,
+            extra=dict(user.extra) if user.extra is not None else None,
+            is_active=user.is_active,
+        )
+
+
+class UserCache:
+    """Two-tier user snapshot cache: a per-process LRU in front of a shared `CacheBackend`.
+
+    `invalidate` deletes the shared entry and publishes the user id so every worker
+    drops its local copy. The local TTL bounds staleness if a message is missed.
+
+    `invalidate` also bumps a per-user generation in the backend. A reader takes the
+    generation before loading the user from the database and passes it to `set`, which
+    removes its own entry again if the generation moved meanwhile. A snapshot read
+    before a concurrent update therefore cannot outlive that update's invalidation.
+    """
+
+    def __init__(
+        self,
+        backend: CacheBackend,
+        max_entries: int,
+        ttl_seconds: float,
+        key_prefix: str,
+        max_revoked_sessions: int = 100_000,
+    ) -> None:
+        self.backend = backend
+        self.local: TTLCache[str, UserSnapshot] = TTLCache(max_entries=max_entries, ttl_seconds=ttl_seconds)
+        # Generations only need to outlive a database read; expiry just causes a needless eviction.
+        self.generation_ttl_seconds = max(ttl_seconds, 60.0)
+        self.key_prefix = key_prefix
+        self.channel = f"{key_prefix}user-invalidations"
+        self.shared_hits = 0
+        self.shared_misses = 0
+        self.backend_errors = 0
+        self.stale_writes = 0
+        # Revoked session ids, pushed to every worker over the invalidation channel.
+        self.revoked_sessions: TTLCache[str, bool] = TTLCache(max_entries=max_revoked_sessions, ttl_seconds=None)
+        # Since when `revoked_sessions` is known to hold every revocation; None while not subscribed.
+        self.revocations_synced_at: float | None = None
+        self.revocation_backend_checks = 0
+
+    def _key(self, user_id: str) -> str:
+        return f"{self.key_prefix}user:{user_id}"
+
+    def _generation_key(self, user_id: str) -> str:
+        return f"{self.key_prefix}user-generation:{user_id}"
+
+    def _revoked_session_key(self, session_id: str) -> str:
+        return f"{self.key_prefix}revoked-session:{session_id}"
+
+    async def get(self, user_id: str) -> UserSnapshot | None:
+        snapshot = self.local.get(user_id)
+        if snapshot is not None or not self.local.enabled:
+            return snapshot
+
+        try:
+            payload = await self.backend.get(self._key(user_id))
+        except Exception:
+            self.backend_errors += 1
+            logger.warning("user cache backend read failed", exc_info=True)
+            return None
+        if payload is None:
+            self.shared_misses += 1
+            return None
+
+        self.shared_hits += 1
+        snapshot = UserSnapshot(**json.loads(payload))
+        self.local.set(user_id, snapshot)
+        return snapshot
+
+    async def generation(self, user_id: str) -> int | None:
+        """Read before loading `user_id` from the database, and pass to `set`. None if unknown."""
+        if not self.local.enabled:
+            return None
+        try:
+            return int(await self.backend.get(self._generation_key(user_id)) or 0)
+        except Exception:
+            self.backend_errors += 1
+            logger.warning("user cache backend read failed", exc_info=True)
+            return None
+
+    async def set(self, user: User, generation: int | None) -> UserSnapshot:
+        """Cache `user`, which was loaded after `generation` was read.
+
+        If the generation is unknown only the local tier is filled, as when the backend is down.
+        """
+        snapshot = UserSnapshot.from_user(user)
+        if not self.local.enabled:
+            return snapshot
+        self.local.set(user.id, snapshot)
+        if generation is None:
+            return snapshot
+        try:
+            await self.backend.set(
+                self._key(user.id),
+                json.dumps(asdict(snapshot)).encode(),
+                self.local.ttl_seconds,
+            )
+            # Checked after the write: an `invalidate` that ran before this point is seen
+            # here, and one that runs after it deletes the entry itself.
+            if await self.generation(user.id) != generation:
+                self.stale_writes += 1
+                self.local.delete(user.id)
+                await self.backend.delete(self._key(user.id))
+        except Exception:
+            self.backend_errors += 1
+            logger.warning("user cache backend write failed", exc_info=True)
+        return snapshot
+
+    async def invalidate(self, user_id: str) -> None:
+        self.local.delete(user_id)
+        try:
+            await self.backend.incr(self._generation_key(user_id), self.generation_ttl_seconds)
+            await self.backend.delete(self._key(user_id))
+            await self.backend.publish(self.channel, user_id)
+        except Exception:
+            self.backend_errors += 1
+            logger.error("user cache invalidation for %s was not propagated", user_id, exc_info=True)
+
+    def _remember_revoked_session(self, session_id: str, ttl_seconds: float) -> None:
+        evictions = self.revoked_sessions.evictions
+        self.revoked_sessions.set(session_id, True, ttl_seconds)
+        if self.revoked_sessions.evictions != evictions and self.revocations_synced_at is not None:
+            # An older revocation was dropped; tokens issued before now must ask the backend again.
+            self.revocations_synced_at = time.time()
+
+    async def revoke_session(self, session_id: str, ttl_seconds: float) -> None:
+        """Reject access tokens issued for one refresh session for the next `ttl_seconds`.
+
+        Signing one device out must not touch `token_version`, which every device's
+        tokens share. Set `ttl_seconds` to the access-token lifetime. The marker is stored
+        in the backend and published to every worker's local set.
+        """
+        self._remember_revoked_session(session_id, ttl_seconds)
+        try:
+            await self.backend.set(self._revoked_session_key(session_id), b"1", ttl_seconds)
+            await self.backend.publish(self.channel, f"{_REVOKED_SESSION_MESSAGE}{session_id}:{ttl_seconds}")
+        except Exception:
+            self.backend_errors += 1
+            logger.error("revocation of session %s was not recorded", session_id, exc_info=True)
+
+    async def is_session_revoked(self, session_id: str, issued_at: float) -> bool:
+        """Whether access tokens of `session_id` issued at `issued_at` (Unix time) are revoked.
+
+        Once the listener is subscribed, every later revocation reaches the local set, so
+        tokens issued after that answer without a backend round-trip. Older tokens may
+        have been revoked before this worker subscribed and are checked in the backend.
+        A backend error fails open: the token is accepted and the error counted, as for
+        other cache reads. A revocation then takes effect at most one access-token
+        lifetime late, while logout-all and password changes still apply via
+        `token_version`.
+        """
+        if self.revoked_sessions.get(session_id):
+            return True
+        synced_at = self.revocations_synced_at
+        if synced_at is not None and issued_at >= synced_at + REVOCATION_CLOCK_SKEW_SECONDS:
+            return False
+        self.revocation_backend_checks += 1
+        try:
+            return await self.backend.get(self._revoked_session_key(session_id)) is not None
+        except Exception:
+            self.backend_errors += 1
+            logger.warning("session revocation check failed", exc_info=True)
+            return False
+
+    def _handle_message(self, message: str, sync_message: str) -> None:
+        if message == sync_message:
+            if self.revocations_synced_at is None:
+                self.revocations_synced_at = time.time()
+        elif message.startswith(_REVOKED_SESSION_MESSAGE):
+            session_id, _, ttl_seconds = message.removeprefix(_REVOKED_SESSION_MESSAGE).rpartition(":")
+            self._remember_revoked_session(session_id, float(ttl_seconds))
+        elif not message.startswith(_SYNC_MESSAGE):
+            self.local.delete(message)
+
+    async def _announce_subscription(self, sync_message: str) -> None:
+        # Receiving our own message proves the subscription is live; repeat until it arrives.
+        while self.revocations_synced_at is None:
+            try:
+                await self.backend.publish(self.channel, sync_message)
+            except Exception:
+                self.backend_errors += 1
+                logger.warning("user cache subscription check failed", exc_info=True)
+            await asyncio.sleep(0.5)
+
+    async def listen_for_invalidations(self) -> None:
+        """Apply invalidations and session revocations from the channel; runs for the life of the worker."""
+        while True:
+            self.revocations_synced_at = None
+            sync_message = f"{_SYNC_MESSAGE}{uuid.uuid4().hex}"
+            announcer = asyncio.create_task(self._announce_subscription(sync_message))
+            try:
+                async for message in self.backend.subscribe(self.channel):
+                    self._handle_message(message, sync_message)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.backend_errors += 1
+                logger.warning("user cache invalidation listener disconnected; retrying", exc_info=True)
+                # Messages may have been missed while disconnected.
+                self.local.clear()
+                self.revocations_synced_at = None
+                await asyncio.sleep(1)
+            finally:
+                announcer.cancel()
+
+    def clear(self) -> None:
+        self.local.clear()
+
+    def stats(self) -> dict:
+        return {
+            **self.local.stats(),
+            "backend": type(self.backend).__name__,
+            "shared_hits": self.shared_hits,
+            "shared_misses": self.shared_misses,
+            "backend_errors": self.backend_errors,
+            "stale_writes": self.stale_writes,
+            "revoked_sessions": len(self.revoked_sessions),
+            "revocations_synced": self.revocations_synced_at is not None,
+            "revocation_backend_checks": self.revocation_backend_checks,
+        }
+
+
+user_cache = UserCache(
+    backend=create_cache_backend(settings.cache_backend, settings.redis_url),
+    max_entries=settings.user_cache_max_entries,
+    ttl_seconds=settings.user_cache_ttl_seconds,
+    key_prefix=settings.cache_key_prefix,
+)
@@ -0,0 +1,121 @@
+import base64
+import binascii
+import json
+import sys
+from dataclasses import dataclass
+
+from sqlalchemy import ColumnElement, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import InstrumentedAttribute
+
+from app.models.user import User
+from app.schemas.user import UserOut
+
+LISTABLE_FIELDS = tuple(UserOut.model_fields)
+
+
+class InvalidListingQuery(ValueError):
+    pass
+
+
+@dataclass(frozen=True)
+class UserListingFilters:
+    username_prefix: str | None = None
+    email_prefix: str | None = None
+    is_active: bool | None = None
+
+
+def _prefix_upper_bound(prefix: str) -> str | None:
+    """Smallest string greater, in code point order, than every string starting with `prefix`.
+
+    Returns None when there is none (the prefix is all U+10FFFF). Surrogates are skipped,
+    since they cannot be stored.
+    """
+    stripped = prefix.rstrip(chr(sys.maxunicode))
+    if not stripped:
+        return None
+    following = ord(stripped[-1]) + 1
+    if 0xD800 <= following <= 0xDFFF:
+        following = 0xE000
+    return stripped[:-1] + chr(following)
+
+
+def _in_code_point_order(db: AsyncSession, column: InstrumentedAttribute) -> ColumnElement:
+    # A prefix is a contiguous range only in code point order. SQLite compares text that
+    # way already; on PostgreSQL the column is compared under COLLATE "C", which the
+    # (namespace, username/email COLLATE "C") indexes serve whatever the database collation.
+    if column is User.id or db.get_bind().dialect.name != "postgresql":
+        return column
+    return column.collate("C")
+
+
+def _sort_column(filters: UserListingFilters) -> InstrumentedAttribute:
+    # Page along the unique index that also serves the prefix filter, so each page is a
+    # bounded range scan: (namespace, username), (namespace, email) or (namespace, id).
+    if filters.username_prefix:
+        return User.username
+    if filters.email_prefix:
+        return User.email
+    return User.id
+
+
+def encode_cursor(sort_key: str, value: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps([sort_key, value]).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str, expected_sort_key: str) -> str:
+    try:
+        sort_key, value = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError) as exc:
+        raise InvalidListingQuery("Invalid cursor") from exc
+    if sort_key != expected_sort_key or not isinstance(value, str):
+        raise InvalidListingQuery("Cursor does not match the requested filters")
+    return value
+
+
+def parse_fields(fields: str | None) -> tuple[str, ...]:
+    if not fields:
+        return LISTABLE_FIELDS
+    requested = tuple(dict.fromkeys(field.strip() for field in fields.split(",") if field.strip()))
+    unknown = [field for field in requested if field not in LISTABLE_FIELDS]
+    if unknown:
+        raise InvalidListingQuery(f"Unknown fields: {', '.join(unknown)}")
+    return requested
+
+
+async def list_namespace_users(
+    db: AsyncSession,
+    namespace: str,
+    filters: UserListingFilters,
+    fields: tuple[str, ...],
+    limit: int,
+    cursor: str | None = None,
+) -> tuple[list[dict], str | None]:
+    """Return one keyset page of users plus the cursor for the next page (None on the last page)."""
+    sort_column = _sort_column(filters)
+    sort_key = sort_column.key
+    ordered = _in_code_point_order(db, sort_column)
+    selected = list(dict.fromkeys([sort_key, *fields]))
+    statement = select(*(getattr(User, field) for field in selected)).where(User.namespace == namespace)
+
+    for column, prefix in ((User.username, filters.username_prefix), (User.email, filters.email_prefix)):
+        if prefix:
+            compared = _in_code_point_order(db, column)
+            statement = statement.where(compared >= prefix, column.startswith(prefix, autoescape=True))
+            upper_bound = _prefix_upper_bound(prefix)
+            if upper_bound is not None:
+                statement = statement.where(compared < upper_bound)
+    if filters.is_active is not None:
+        statement = statement.where(User.is_active.is_(filters.is_active))
+    if cursor:
+        statement = statement.where(ordered > decode_cursor(cursor, sort_key))
+
+    result = await db.execute(statement.order_by(ordered).limit(limit + 1))
+    rows = [dict(row._mapping) for row in result]
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(sort_key, rows[-1][sort_key])
+    items = [{field: row[field] for field in fields} for row in rows]
+    return items, next_cursor
@@ -0,0 +1,51 @@
+"""Compare `decode_token` throughput with and without the verified-claims cache.
+
+Usage:
+    python benchmarks/bench_jwt_decode.py --iterations 20000
+"""
+
+import argparse
+import json
+import time
+
+from app.services.security import clear_token_cache, create_access_token, decode_token
+
+
+def _run(token: str, iterations: int, cached: bool) -> dict:
+    clear_token_cache()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if not cached:
+            clear_token_cache()
+        decode_token(token)
+    elapsed = time.perf_counter() - started
+    return {
+        "iterations": iterations,
+        "seconds": round(elapsed, 4),
+        "decodes_per_second": round(iterations / elapsed, 1),
+        "mean_microseconds": round(elapsed / iterations * 1_000_000, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=20_000)
+    args = parser.parse_args()
+
+    token = create_access_token("benchmark-user", 0)
+    uncached = _run(token, args.iterations, cached=False)
+    cached = _run(token, args.iterations, cached=True)
+    print(
+        json.dumps(
+            {
+                "uncached": uncached,
+                "cached": cached,
+                "speedup": round(cached["decodes_per_second"] / uncached["decodes_per_second"], 1),
+            },
+            indent=2,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
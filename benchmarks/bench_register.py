@@ -0,0 +1,116 @@
+"""Compare queries per registration and throughput: legacy pre-check flow vs insert-first.
+
+Usage:
+    python benchmarks/bench_register.py --users 2000
+    python benchmarks/bench_register.py --users 200 --real-hash
+
+The legacy flow reproduces the old `/auth/register` handler: namespace SELECT, username
+SELECT, email SELECT, INSERT, then a refresh SELECT. The insert-first flow is the
+current one: cached namespace check and a single `INSERT ... RETURNING`.
+Password hashing is stubbed unless `--real-hash` is given, so the numbers isolate DB cost.
+"""
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from sqlalchemy import event, select
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+
+import app.services.security as security
+from app.db.base import Base
+from app.models.user import User
+from app.models.userspace import UserSpace
+from app.schemas.user import UserCreate
+from app.services.auth import create_user
+from app.services.hasher import password_hasher
+from app.services.namespaces import namespace_exists, namespace_registry
+
+NAMESPACE = "bench"
+
+
+async def _legacy_register(db: AsyncSession, payload: UserCreate) -> User:
+    if not await db.scalar(select(UserSpace).where(UserSpace.namespace == payload.namespace)):
+        raise LookupError("Namespace not found")
+    if await db.scalar(select(User).where(User.namespace == payload.namespace, User.username == payload.username)):
+        raise ValueError("Username already exists in namespace")
+    if payload.email and await db.scalar(
+        select(User).where(User.namespace == payload.namespace, User.email == payload.email)
+    ):
+        raise ValueError("Email already exists in namespace")
+    user = User(
+        namespace=payload.namespace,
+        username=payload.username,
+        password_hash=await password_hasher.hash(payload.password),
+        email=payload.email,
+    )
+    db.add(user)
+    await db.commit()
+    await db.refresh(user)
+    return user
+
+
+async def _insert_first_register(db: AsyncSession, payload: UserCreate) -> User:
+    if not await namespace_exists(db, payload.namespace):
+        raise LookupError("Namespace not found")
+    return await create_user(db, payload)
+
+
+async def _run(flow, users: int, db_path: Path, label: str) -> dict:
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    sessions = async_sessionmaker(engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
+    async with sessions() as db:
+        db.add(UserSpace(namespace=NAMESPACE, name="Benchmark"))
+        await db.commit()
+
+    statements = 0
+
+    def _count(*_args) -> None:
+        nonlocal statements
+        statements += 1
+
+    event.listen(engine.sync_engine, "before_cursor_execute", _count)
+    namespace_registry.clear()
+    started = time.perf_counter()
+    async with sessions() as db:
+        for index in range(users):
+            payload = UserCreate(
+                namespace=NAMESPACE,
+                username=f"{label}-{index}",
+                password="supersecret123",
+                email=f"{label}-{index}@example.com",
+            )
+            await flow(db, payload)
+    elapsed = time.perf_counter() - started
+    await engine.dispose()
+    return {
+        "users": users,
+        "seconds": round(elapsed, 3),
+        "registrations_per_second": round(users / elapsed, 1),
+        "queries_per_registration": round(statements / users, 2),
+    }
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--real-hash", action="store_true")
+    args = parser.parse_args()
+
+    if not args.real_hash:
+        security.hash_password = lambda password: f"bench::{password}"
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = await _run(_legacy_register, args.users, Path(tmp) / "legacy.db", "legacy")
+        insert_first = await _run(_insert_first_register, args.users, Path(tmp) / "insert_first.db", "insert")
+    password_hasher.shutdown()
+    print(json.dumps({"legacy": legacy, "insert_first": insert_first, "real_hash": args.real_hash}, indent=2))
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
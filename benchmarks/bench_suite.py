@@ -0,0 +1,424 @@
+"""Load-test the auth and profile hot paths in-process or against a local uvicorn.
+
+Usage:
+    python benchmarks/bench_suite.py --requests 500 --concurrency 16
+    python benchmarks/bench_suite.py --target uvicorn --workers 4 --seed-users 200000
+    python benchmarks/bench_suite.py --scenarios login,me --output results.json --save-baseline baseline.json
+    python benchmarks/bench_suite.py --baseline baseline.json --max-regression 0.15 --fail-on-regression
+
+Scenarios: register, login, refresh, me (GET /users/me), update_me (PATCH /users/me), avatar.
+Each runs `--requests` requests from `--concurrency` concurrent clients and reports throughput
+and latency percentiles as JSON. `--seed-users N` bulk-inserts N synthetic users into the
+benchmark namespace first, so runs at different N show how the hot paths scale with table size.
+
+`--target inprocess` drives the ASGI app through httpx without a network hop; password hashing
+is stubbed unless `--real-hash` is given. `--target uvicorn` starts `uvicorn app.main:app` on a
+free port (always with real bcrypt). Both use a throwaway SQLite database unless
+`--database-url` points somewhere else; that database's schema must already be migrated.
+
+With `--baseline`, each scenario's p95 latency and throughput are compared against the stored
+run; changes worse than `--max-regression` (a fraction) are reported as regressions.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from io import BytesIO
+from pathlib import Path
+
+import httpx
+from PIL import Image
+
+SCENARIOS = ("register", "login", "refresh", "me", "update_me", "avatar")
+NAMESPACE = "bench"
+PASSWORD = "supersecret123"
+ADMIN_API_KEY = "bench-admin-key"
+
+
+@dataclass
+class Account:
+    username: str
+    access_token: str
+    refresh_token: str
+
+
+Operation = Callable[[httpx.AsyncClient, Account, int], Awaitable[httpx.Response]]
+
+
+def _environment(args: argparse.Namespace, workdir: Path) -> dict[str, str]:
+    return {
+        "DATABASE_URL": args.database_url or f"sqlite:///{workdir / 'bench.db'}",
+        "UPLOADS_DIR": str(workdir / "uploads"),
+        "ADMIN_API_KEY": ADMIN_API_KEY,
+        # Every simulated client shares one IP and logs in repeatedly; throttling would skew the numbers.
+        "LOGIN_RATE_LIMIT_ENABLED": "false",
+        # The login scenario starts many sessions per account; trimming them would revoke the
+        # registration session whose access token the later scenarios use.
+        "REFRESH_SESSION_MAX_PER_USER": "0",
+    }
+
+
+def _prepare_database(seed_users: int, batch_size: int, fake_hash: bool) -> None:
+    """Create the schema, the benchmark namespace and `seed_users` synthetic users."""
+    import uuid
+
+    from sqlalchemy import insert, select
+
+    from app.db.base import Base
+    from app.db.session import SessionLocal, engine
+    from app.models.avatar import AvatarObject
+    from app.models.refresh_session import RefreshSession
+    from app.models.user import User
+    from app.models.userspace import UserSpace
+    from app.services import security
+
+    if engine.dialect.name == "sqlite":
+        Base.metadata.create_all(engine, tables=[UserSpace.__table__, User.__table__, AvatarObject.__table__, RefreshSession.__table__])
+    password_hash = f"bench::{PASSWORD}" if fake_hash else security.hash_password(PASSWORD)
+    with SessionLocal() as db:
+        if db.get(UserSpace, NAMESPACE) is None:
+            db.add(UserSpace(namespace=NAMESPACE, name="Benchmark"))
+            db.commit()
+        existing = db.scalar(select(User.id).where(User.namespace == NAMESPACE).limit(1))
+        if seed_users and existing is None:
+            for start in range(0, seed_users, batch_size):
+                rows = [
+                    {
+                        "id": str(uuid.uuid4()),
+                        "namespace": NAMESPACE,
+                        "username": f"seed-{index:09d}",
+                        "email": f"seed-{index:09d}@example.com",
+                        "password_hash": password_hash,
+                        "token_version": 0,
+                        "is_active": True,
+                    }
+                    for index in range(start, min(start + batch_size, seed_users))
+                ]
+                db.execute(insert(User), rows)
+                db.commit()
+    engine.dispose()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def _wait_until_live(base_url: str, process: subprocess.Popen, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {process.returncode}")
+            try:
+                if (await client.get("/health/live")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not become live in time")
+
+
+def _avatar_payloads(count: int) -> list[bytes]:
+    """Distinct noise images, so uploads exercise processing instead of deduplication."""
+    rng = random.Random(1234)
+    payloads = []
+    for _ in range(count):
+        buffer = BytesIO()
+        Image.frombytes("RGB", (256, 256), rng.randbytes(256 * 256 * 3)).save(buffer, format="PNG")
+        payloads.append(buffer.getvalue())
+    return payloads
+
+
+def _auth(account: Account) -> dict[str, str]:
+    return {"Authorization": f"Bearer {account.access_token}"}
+
+
+def _operations(run_id: str, avatars: list[bytes]) -> dict[str, Operation]:
+    # Shared across warmup and timed passes, so every registration uses a fresh username.
+    registrations = itertools.count()
+
+    async def register(client: httpx.AsyncClient, account: Account, index: int) -> httpx.Response:
+        return await client.post(
+            "/auth/register",
+            json={"namespace": NAMESPACE, "username": f"reg-{run_id}-{next(registrations)}", "password": PASSWORD},
+        )
+
+    async def login(client: httpx.AsyncClient, account: Account, index: int) -> httpx.Response:
+        return await client.post(
+            "/auth/login",
+            json={"namespace": NAMESPACE, "username": account.username, "password": PASSWORD},
+        )
+
+    async def refresh(client: httpx.AsyncClient, account: Account, index: int) -> httpx.Response:
+        response = await client.post("/auth/refresh", json={"refresh_token": account.refresh_token})
+        if response.status_code == 200:
+            # Follow rotation, so the next refresh presents the newest token.
+            account.refresh_token = response.json()["refresh_token"]
+        return response
+
+    async def me(client: httpx.AsyncClient, account: Account, index: int) -> httpx.Response:
+        return await client.get("/users/me", headers=_auth(account))
+
+    async def update_me(client: httpx.AsyncClient, account: Account, index: int) -> httpx.Response:
+        return await client.patch("/users/me", headers=_auth(account), json={"full_name": f"Bench User {index}"})
+
+    async def avatar(client: httpx.AsyncClient, account: Account, index: int) -> httpx.Response:
+        payload = avatars[index % len(avatars)]
+        return await client.post(
+            "/users/me/avatar",
+            headers=_auth(account),
+            files={"file": ("avatar.png", payload, "image/png")},
+        )
+
+    return {
+        "register": register,
+        "login": login,
+        "refresh": refresh,
+        "me": me,
+        "update_me": update_me,
+        "avatar": avatar,
+    }
+
+
+async def _create_accounts(client: httpx.AsyncClient, run_id: str, count: int) -> list[Account]:
+    accounts = []
+    for index in range(count):
+        username = f"bench-{run_id}-{index}"
+        response = await client.post(
+            "/auth/register",
+            json={"namespace": NAMESPACE, "username": username, "password": PASSWORD},
+        )
+        response.raise_for_status()
+        tokens = response.json()
+        accounts.append(Account(username, tokens["access_token"], tokens["refresh_token"]))
+    return accounts
+
+
+def percentile(sorted_values: list[float], fraction: float) -> float:
+    """Nearest-rank percentile of an ascending list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, round(fraction * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+async def run_scenario(
+    client: httpx.AsyncClient,
+    operation: Operation,
+    accounts: list[Account],
+    requests: int,
+) -> dict:
+    latencies: list[float] = []
+    statuses: Counter[int] = Counter()
+    errors = 0
+    indexes = itertools.count()
+
+    async def worker(account: Account) -> None:
+        nonlocal errors
+        while (index := next(indexes)) < requests:
+            started = time.perf_counter()
+            try:
+                response = await operation(client, account, index)
+            except httpx.TransportError:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - started)
+            statuses[response.status_code] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(account) for account in accounts))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    completed = len(latencies)
+    non_2xx = sum(count for status, count in statuses.items() if not 200 <= status < 300)
+    return {
+        # Every scenario expects only 2xx; failed requests usually take a faster path and
+        # would make the latencies look better than they are.
+        "valid": errors == 0 and non_2xx == 0,
+        "requests": completed,
+        "transport_errors": errors,
+        "non_2xx": non_2xx,
+        "status_counts": {str(status): count for status, count in sorted(statuses.items())},
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(completed / elapsed, 1) if elapsed else 0.0,
+        "latency_ms": {
+            "mean": round(sum(latencies) / completed * 1000, 3) if completed else 0.0,
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p90": round(percentile(latencies, 0.90) * 1000, 3),
+            "p95": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+            "max": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        },
+    }
+
+
+def compare_to_baseline(results: dict, baseline: dict, max_regression: float) -> dict:
+    """Per-scenario p95 and throughput change vs `baseline`; flags changes worse than `max_regression`.
+
+    Scenarios that are invalid in either run are left out.
+    """
+    comparison = {}
+    for name, current in results["scenarios"].items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None or not current["valid"] or not previous.get("valid", True):
+            continue
+        p95_change = current["latency_ms"]["p95"] / previous["latency_ms"]["p95"] - 1 if previous["latency_ms"]["p95"] else 0.0
+        rps_change = current["throughput_rps"] / previous["throughput_rps"] - 1 if previous["throughput_rps"] else 0.0
+        comparison[name] = {
+            "p95_ms": [previous["latency_ms"]["p95"], current["latency_ms"]["p95"]],
+            "p95_change": round(p95_change, 3),
+            "throughput_rps": [previous["throughput_rps"], current["throughput_rps"]],
+            "throughput_change": round(rps_change, 3),
+            "regression": p95_change > max_regression or -rps_change > max_regression,
+        }
+    return comparison
+
+
+async def _run_all(args: argparse.Namespace, client: httpx.AsyncClient) -> dict:
+    run_id = f"{int(time.time())}-{os.getpid()}"
+    needs_accounts = [name for name in args.scenarios if name != "register"]
+    accounts = await _create_accounts(client, run_id, args.concurrency) if needs_accounts else []
+    workers = accounts or [Account("", "", "")] * args.concurrency
+    operations = _operations(run_id, _avatar_payloads(args.avatar_images) if "avatar" in args.scenarios else [])
+
+    scenarios = {}
+    for name in args.scenarios:
+        if args.warmup:
+            await run_scenario(client, operations[name], workers, args.warmup)
+        scenarios[name] = await run_scenario(client, operations[name], workers, args.requests)
+        print(f"{name}: {scenarios[name]['throughput_rps']} req/s, p95 {scenarios[name]['latency_ms']['p95']} ms", file=sys.stderr)
+        if not scenarios[name]["valid"]:
+            print(f"{name}: INVALID, status counts {scenarios[name]['status_counts']}", file=sys.stderr)
+    return scenarios
+
+
+async def _inprocess(args: argparse.Namespace) -> dict:
+    from app.services import security
+
+    if not args.real_hash:
+        security.hash_password = lambda password: f"bench::{password}"
+        security.verify_password = lambda plain_password, password_hash: password_hash == f"bench::{plain_password}"
+
+    from app.main import app
+    from app.services.avatar import avatar_pool
+    from app.services.hasher import password_hasher
+
+    Path(os.environ["UPLOADS_DIR"]).mkdir(parents=True, exist_ok=True)
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+            return await _run_all(args, client)
+    finally:
+        password_hasher.shutdown()
+        avatar_pool.shutdown()
+
+
+async def _uvicorn(args: argparse.Namespace, env: dict[str, str]) -> dict:
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    command = [
+        sys.executable, "-m", "uvicorn", "app.main:app",
+        "--host", "127.0.0.1", "--port", str(port),
+        "--workers", str(args.workers), "--log-level", "warning", "--no-access-log",
+    ]  # fmt: skip
+    process = subprocess.Popen(command, env={**os.environ, **env})
+    try:
+        await _wait_until_live(base_url, process)
+        limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+        async with httpx.AsyncClient(base_url=base_url, timeout=60, limits=limits) as client:
+            return await _run_all(args, client)
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--target", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--warmup", type=int, default=20, help="untimed requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--seed-users", type=int, default=0)
+    parser.add_argument("--seed-batch-size", type=int, default=5000)
+    parser.add_argument("--avatar-images", type=int, default=32)
+    parser.add_argument("--real-hash", action="store_true", help="use bcrypt in-process (uvicorn always does)")
+    parser.add_argument("--database-url", default=None)
+    parser.add_argument("--output", type=Path, default=None)
+    parser.add_argument("--baseline", type=Path, default=None)
+    parser.add_argument("--save-baseline", type=Path, default=None)
+    parser.add_argument("--max-regression", type=float, default=0.10)
+    parser.add_argument("--fail-on-regression", action="store_true")
+    args = parser.parse_args()
+    args.scenarios = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    with tempfile.TemporaryDirectory(prefix="user-service-bench-") as tmp:
+        env = _environment(args, Path(tmp))
+        os.environ.update(env)
+        fake_hash = args.target == "inprocess" and not args.real_hash
+        seed_started = time.perf_counter()
+        _prepare_database(args.seed_users, args.seed_batch_size, fake_hash)
+        seed_seconds = time.perf_counter() - seed_started
+        if args.target == "uvicorn":
+            scenarios = asyncio.run(_uvicorn(args, env))
+        else:
+            scenarios = asyncio.run(_inprocess(args))
+
+    results = {
+        "meta": {
+            "target": args.target,
+            "workers": args.workers if args.target == "uvicorn" else None,
+            "concurrency": args.concurrency,
+            "requests_per_scenario": args.requests,
+            "seed_users": args.seed_users,
+            "seed_seconds": round(seed_seconds, 3),
+            "real_hash": not fake_hash,
+            "database": "sqlite (temporary)" if not args.database_url else args.database_url.split("://", 1)[0],
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "started_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        },
+        "scenarios": scenarios,
+    }
+    regressions = []
+    if args.baseline:
+        results["comparison"] = compare_to_baseline(results, json.loads(args.baseline.read_text()), args.max_regression)
+        regressions = [name for name, change in results["comparison"].items() if change["regression"]]
+
+    rendered = json.dumps(results, indent=2)
+    if args.output:
+        args.output.write_text(rendered + "\n")
+    if args.save_baseline:
+        args.save_baseline.write_text(rendered + "\n")
+    print(rendered)
+    invalid = [name for name, scenario in scenarios.items() if not scenario["valid"]]
+    if invalid:
+        print(f"invalid scenarios (non-2xx responses or transport errors): {', '.join(invalid)}", file=sys.stderr)
+    if regressions:
+        print(f"regressions beyond {args.max_regression:.0%}: {', '.join(regressions)}", file=sys.stderr)
+    if invalid or (regressions and args.fail_on_regression):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Stream a namespace's users to NDJSON or CSV.
+
+Usage:
+    python scripts/export_users.py --namespace app-x > users.ndjson
+    python scripts/export_users.py --namespace app-x --format csv --output users.csv
+    python scripts/export_users.py --namespace app-x --after <last-exported-id> >> users.ndjson
+
+Rows are ordered by user id; pass the last exported id as `--after` to resume an interrupted export.
+"""
+
+import argparse
+import asyncio
+import sys
+from pathlib import Path
+
+from app.db.session import AsyncSessionLocal, async_engine
+from app.models.userspace import UserSpace
+from app.services.bulk_export import iter_namespace_users, render_export
+
+
+async def run(args: argparse.Namespace) -> int:
+    output = args.output.open("w", newline="") if args.output else sys.stdout
+    try:
+        async with AsyncSessionLocal() as db:
+            if not await db.get(UserSpace, args.namespace):
+                print(f"Namespace not found: {args.namespace}", file=sys.stderr)
+                return 1
+            rows = iter_namespace_users(db, args.namespace, after=args.after, batch_size=args.batch_size)
+            async for chunk in render_export(rows, args.format):
+                output.write(chunk)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        await async_engine.dispose()
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Export a namespace's users.")
+    parser.add_argument("--namespace", required=True)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default="ndjson")
+    parser.add_argument("--after", default=None)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--output", type=Path, default=None)
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Remove avatar files that no user references any more.
+
+Usage:
+    python scripts/gc_avatars.py
+    python scripts/gc_avatars.py --grace-seconds 600 --recount
+
+Files younger than `--grace-seconds` are kept so in-flight uploads are not swept.
+`--recount` first rebuilds every avatar refcount from `users.avatar_url`; run it after
+restoring a backup or editing `avatar_url` by hand.
+"""
+
+import argparse
+import asyncio
+import sys
+
+from app.db.session import AsyncSessionLocal, async_engine
+from app.services.avatar import collect_avatar_garbage
+
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        async with AsyncSessionLocal() as db:
+            report = await collect_avatar_garbage(
+                db,
+                grace_seconds=args.grace_seconds,
+                recount=args.recount,
+            )
+    finally:
+        await async_engine.dispose()
+    print(
+        f"recounted={report.recounted} objects_removed={report.objects_removed} "
+        f"files_removed={report.files_removed} bytes_freed={report.bytes_freed}"
+    )
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Sweep unreferenced avatar files.")
+    parser.add_argument("--grace-seconds", type=float, default=3600)
+    parser.add_argument("--recount", action="store_true")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
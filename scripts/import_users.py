@@ -0,0 +1,61 @@
+"""Bulk-import users into a namespace from an NDJSON or CSV file.
+
+Usage:
+    python scripts/import_users.py --namespace app-x users.ndjson > results.ndjson
+    python scripts/import_users.py --namespace app-x --format csv --workers 8 users.csv
+
+Writes one NDJSON result per input row to stdout and a summary to stderr.
+Rows may carry a plain `password` (hashed here on a process pool) or a `password_hash` in any
+scheme listed in PASSWORD_HASH_SCHEMES.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+from pathlib import Path
+
+from app.core.workers import WorkerPool
+from app.db.session import AsyncSessionLocal, async_engine
+from app.models.userspace import UserSpace
+from app.services.bulk_import import import_users, parse_import_stream
+from app.services.hasher import PasswordHasher
+
+
+async def run(args: argparse.Namespace) -> int:
+    import_format = args.format or ("csv" if args.path.suffix.lower() == ".csv" else "ndjson")
+    hasher = PasswordHasher(
+        WorkerPool(name="import_hasher", max_workers=args.workers, max_queue=args.workers, kind="process")
+    )
+    counts = {"created": 0, "error": 0}
+    try:
+        async with AsyncSessionLocal() as db:
+            if not await db.get(UserSpace, args.namespace):
+                print(f"Namespace not found: {args.namespace}", file=sys.stderr)
+                return 1
+            with args.path.open("rb") as stream:
+                records = parse_import_stream(stream, import_format)
+                async for result in import_users(db, args.namespace, records, hasher, args.batch_size):
+                    counts[result.status] += 1
+                    sys.stdout.write(result.model_dump_json(exclude_none=True) + "\n")
+    finally:
+        hasher.shutdown()
+        await async_engine.dispose()
+
+    print(json.dumps({"summary": counts}), file=sys.stderr)
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Bulk-import users into a namespace.")
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--namespace", required=True)
+    parser.add_argument("--format", choices=["ndjson", "csv"], default=None)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 4)
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
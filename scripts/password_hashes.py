@@ -0,0 +1,71 @@
+"""Tune the password-hash work factor and report which hashes are still in use.
+
+Usage:
+    python scripts/password_hashes.py calibrate --target-ms 250
+    python scripts/password_hashes.py calibrate --scheme argon2 --target-ms 100
+    python scripts/password_hashes.py report
+    python scripts/password_hashes.py report --namespace app-x
+
+`calibrate` times one verification per cost on this machine and prints the largest
+cost within the target, as a setting to put in `.env`. Run it on production hardware:
+each hasher worker handles about 1000 / verify_ms logins per second.
+`report` prints JSON with user counts per scheme and cost, plus how many hashes are
+re-hashed on the users' next login under the current settings.
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+
+from app.core.config import settings
+from app.db.session import AsyncSessionLocal, async_engine
+from app.services.password_hashes import calibrate, password_hash_report
+
+COST_SETTINGS = {"bcrypt": "PASSWORD_BCRYPT_ROUNDS", "argon2": "PASSWORD_ARGON2_TIME_COST"}
+
+
+def run_calibrate(args: argparse.Namespace) -> int:
+    try:
+        cost, samples = calibrate(args.scheme, args.target_ms, args.samples)
+    except RuntimeError as exc:
+        print(exc, file=sys.stderr)
+        return 1
+    for sample in samples:
+        print(f"{args.scheme} cost={sample.cost}: verify {sample.verify_ms} ms", file=sys.stderr)
+    chosen = next(sample for sample in samples if sample.cost == cost)
+    if chosen.verify_ms > args.target_ms:
+        print(f"even the minimum cost exceeds {args.target_ms} ms", file=sys.stderr)
+    if args.scheme == "argon2":
+        print(f"# at PASSWORD_ARGON2_MEMORY_KIB={settings.password_argon2_memory_kib}")
+    print(f"{COST_SETTINGS[args.scheme]}={cost}")
+    return 0
+
+
+async def run_report(args: argparse.Namespace) -> int:
+    try:
+        async with AsyncSessionLocal() as db:
+            report = await password_hash_report(db, namespace=args.namespace)
+    finally:
+        await async_engine.dispose()
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Calibrate password hashing and report hash schemes in use.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    calibrate_parser = commands.add_parser("calibrate", help="pick a work factor for a target verify latency")
+    calibrate_parser.add_argument("--scheme", choices=sorted(COST_SETTINGS), default="bcrypt")
+    calibrate_parser.add_argument("--target-ms", type=float, default=250.0)
+    calibrate_parser.add_argument("--samples", type=int, default=5)
+    report_parser = commands.add_parser("report", help="count users per hash scheme and cost")
+    report_parser.add_argument("--namespace", default=None)
+    args = parser.parse_args()
+    if args.command == "calibrate":
+        sys.exit(run_calibrate(args))
+    sys.exit(asyncio.run(run_report(args)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+"""Delete expired refresh sessions.
+
+Usage:
+    python scripts/sweep_sessions.py
+    python scripts/sweep_sessions.py --batch-size 5000
+
+Workers already sweep every `REFRESH_SESSION_SWEEP_INTERVAL_SECONDS`; run this from cron
+instead when that is set to `0`, or to clear a large backlog once.
+"""
+
+import argparse
+import asyncio
+import sys
+
+from app.db.session import AsyncSessionLocal, async_engine
+from app.services.refresh_sessions import sweep_expired_sessions
+
+
+async def run(args: argparse.Namespace) -> int:
+    try:
+        async with AsyncSessionLocal() as db:
+            removed = await sweep_expired_sessions(db, batch_size=args.batch_size)
+    finally:
+        await async_engine.dispose()
+    print(f"sessions_removed={removed}")
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Delete expired refresh sessions.")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
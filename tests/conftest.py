@@ -1,16 +1,23 @@
-from collections.abc import Generator
+from collections.abc import AsyncGenerator
 
 import pytest
 from httpx import ASGITransport, AsyncClient
-from sqlalchemy import create_engine
-from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
-import app.api.routes_auth as routes_auth
-import app.services.auth as auth_service
+import app.services.avatar as avatar_service
+import app.services.security as security_service
+from app.core.cache import ByteLRUCache
 from app.core.config import settings
+from app.core.cache_backend import MemoryCacheBackend
 from app.db.base import Base
 from app.db.session import get_db
 from app.main import app
+from app.services.avatar_storage import FilesystemAvatarStorage
+from app.services.health import readiness_probe
+from app.services.login_policy import login_failure_policy
+from app.services.login_throttle import login_throttle
+from app.services.namespaces import namespace_registry
+from app.services.user_cache import user_cache
 
 
 @pytest.fixture()
@@ -19,25 +26,35 @@ def anyio_backend() -> str:
 
 
 @pytest.fixture()
-async def client(tmp_path) -> Generator[AsyncClient, None, None]:
+async def client(tmp_path) -> AsyncGenerator[AsyncClient, None]:
     db_path = tmp_path / "test.db"
     uploads_path = tmp_path / "uploads"
-    engine = create_engine(f"sqlite:///{db_path}", connect_args={"check_same_thread": False})
-    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    TestingSessionLocal = async_sessionmaker(engine, autoflush=False, expire_on_commit=False, class_=AsyncSession)
     original_uploads_dir = settings.uploads_dir
+    original_admin_api_key = settings.admin_api_key
     settings.uploads_dir = str(uploads_path)
+    settings.admin_api_key = "test-admin-key"
     uploads_path.mkdir(parents=True, exist_ok=True)
+    original_avatar_storage = avatar_service.avatar_storage
+    avatar_service.avatar_storage = FilesystemAvatarStorage(
+        str(uploads_path),
+        max_age_seconds=settings.uploads_cache_max_age_seconds,
+        memory_cache=ByteLRUCache(max_bytes=1024 * 1024, max_item_bytes=64 * 1024),
+    )
 
-    Base.metadata.create_all(bind=engine)
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.create_all)
 
-    async def override_get_db() -> Generator[Session, None, None]:
-        db = TestingSessionLocal()
-        try:
+    async def override_get_db() -> AsyncGenerator[AsyncSession, None]:
+        async with TestingSessionLocal() as db:
             yield db
-        finally:
-            db.close()
 
     app.dependency_overrides[get_db] = override_get_db
+    original_cache_backend = user_cache.backend
+    user_cache.backend = MemoryCacheBackend()
+    original_throttle_backend = login_throttle.backend
+    login_throttle.backend = MemoryCacheBackend()
 
     def _fast_hash(password: str) -> str:
         return f"test-hash::{password}"
@@ -45,15 +62,27 @@ async def client(tmp_path) -> Generator[AsyncClient, None, None]:
     def _fast_verify(plain_password: str, password_hash: str) -> bool:
         return password_hash == _fast_hash(plain_password)
 
-    auth_service.hash_password = _fast_hash
-    auth_service.verify_password = _fast_verify
-    routes_auth.hash_password = _fast_hash
-    routes_auth.verify_password = _fast_verify
+    original_hash_password = security_service.hash_password
+    original_verify_password = security_service.verify_password
+    security_service.hash_password = _fast_hash
+    security_service.verify_password = _fast_verify
 
     transport = ASGITransport(app=app)
     async with AsyncClient(transport=transport, base_url="http://test") as async_client:
         yield async_client
 
     settings.uploads_dir = original_uploads_dir
+    avatar_service.avatar_storage = original_avatar_storage
+    settings.admin_api_key = original_admin_api_key
+    security_service.hash_password = original_hash_password
+    security_service.verify_password = original_verify_password
     app.dependency_overrides.clear()
-    Base.metadata.drop_all(bind=engine)
+    user_cache.clear()
+    namespace_registry.clear()
+    readiness_probe.reset()
+    login_failure_policy.reset()
+    user_cache.backend = original_cache_backend
+    login_throttle.backend = original_throttle_backend
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
@@ -1,13 +1,51 @@
+import asyncio
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
 from pathlib import Path
 
+import boto3
+import fakeredis
 import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
 from httpx import AsyncClient
-
+from jose import jwt
+from moto import mock_aws
+from passlib.hash import bcrypt
+from PIL import Image
+from sqlalchemy import exc as sa_exc
+from sqlalchemy import update
+from sqlalchemy.ext.asyncio import create_async_engine
+
+import app.services.avatar as avatar_service
+import app.services.security as security_service
+from app.core.cache_backend import MemoryCacheBackend, RedisCacheBackend
 from app.core.config import settings
+from app.core.rate_limit import RateLimitedError, SlidingWindowLimiter
+from app.core.workers import WorkerPool
+from app.db.pool import InstrumentedAsyncQueuePool, pool_metrics
 from app.db.session import get_db
 from app.main import app
+from app.models.refresh_session import RefreshSession
 from app.models.user import User
-from app.services.security import create_access_token, create_refresh_token
+from app.models.userspace import UserSpace
+from app.services.avatar import collect_avatar_garbage, release_unreferenced_avatars
+from app.services.avatar_storage import S3AvatarStorage
+from app.services.hasher import password_hasher
+from app.services.health import readiness_probe
+from app.services.login_policy import login_failure_policy
+from app.services.login_throttle import login_throttle
+from app.services.namespaces import namespace_registry
+from app.services.password_hashes import calibrate, describe_hash, password_hash_report
+from app.services.refresh_sessions import hash_token_id, sweep_expired_sessions
+from app.services.security import create_access_token, create_refresh_token, decode_token, token_cache, verify_password
+from app.services.user_cache import UserCache, user_cache
 
 
 ASSETS_DIR = Path(__file__).parent / "assets"
@@ -58,27 +96,72 @@ def auth_header(access_token: str) -> dict[str, str]:
     return {"Authorization": f"Bearer {access_token}"}
 
 
+def jpeg_with_exif(size: tuple[int, int] = (300, 200)) -> bytes:
+    exif = Image.Exif()
+    exif[0x010F] = "TestCamera"
+    buffer = BytesIO()
+    Image.new("RGB", size, color=(200, 40, 40)).save(buffer, format="JPEG", exif=exif)
+    return buffer.getvalue()
+
+
+def admin_header() -> dict[str, str]:
+    return {"X-Admin-Key": settings.admin_api_key}
+
+
 def upload_avatar_file() -> tuple[str, bytes, str]:
     file_name = "avatar.png"
     payload = (ASSETS_DIR / file_name).read_bytes()
     return (file_name, payload, "image/png")
 
 
+def query_count(response) -> int:
+    match = re.search(r'db;dur=[\d.]+;desc="(\d+) queries"', response.headers["server-timing"])
+    assert match, response.headers["server-timing"]
+    return int(match.group(1))
+
+
+def assert_max_queries(response, max_queries: int) -> None:
+    count = query_count(response)
+    request = f"{response.request.method} {response.request.url.path}"
+    assert count <= max_queries, f"{request} ran {count} SQL statements, budget is {max_queries}"
+
+
+def write_ec_signing_key(keys_dir: Path, kid: str) -> None:
+    private_key = ec.generate_private_key(ec.SECP256R1())
+    pem = private_key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    (keys_dir / f"{kid}.pem").write_bytes(pem)
+
+
 def avatar_disk_path(avatar_url: str) -> Path:
     relative = avatar_url.removeprefix("/uploads/")
     return Path(settings.uploads_dir) / relative
 
 
+async def release_avatars() -> None:
+    override_get_db = app.dependency_overrides[get_db]
+    db_generator = override_get_db()
+    db = await db_generator.__anext__()
+    try:
+        await release_unreferenced_avatars(db)
+    finally:
+        await db_generator.aclose()
+
+
 async def set_user_active_flag(user_id: str, is_active: bool) -> None:
     override_get_db = app.dependency_overrides[get_db]
     db_generator = override_get_db()
     db = await db_generator.__anext__()
     try:
-        user = db.query(User).filter(User.id == user_id).first()
+        user = await db.get(User, user_id)
         assert user is not None
         user.is_active = is_active
         db.add(user)
-        db.commit()
+        await db.commit()
+        await user_cache.invalidate(user_id)
     finally:
         await db_generator.aclose()
 
@@ -228,14 +311,16 @@ async def test_us_012_change_avatar_replaces_file(client: AsyncClient):
     second = await client.post(
         "/users/me/avatar",
         headers=auth_header(tokens["access_token"]),
-        files={"file": upload_avatar_file()},
+        files={"file": ("photo.jpg", jpeg_with_exif(), "image/jpeg")},
     )
     assert second.status_code == 200
     second_avatar_url = second.json()["avatar_url"]
     second_avatar_path = avatar_disk_path(second_avatar_url)
     assert second_avatar_url != first_avatar_url
     assert second_avatar_path.exists()
+    await release_avatars()
     assert not first_avatar_path.exists()
+    assert second_avatar_path.exists()
 
 
 @pytest.mark.anyio
@@ -258,6 +343,7 @@ async def test_us_013_delete_avatar(client: AsyncClient):
         headers=auth_header(tokens["access_token"]),
     )
     assert delete.status_code == 204
+    await release_avatars()
     assert not avatar_path.exists()
 
     me = await client.get("/users/me", headers=auth_header(tokens["access_token"]))
@@ -462,3 +548,1262 @@ async def test_us_026_reject_access_for_inactive_user(client: AsyncClient):
     response = await client.get("/users/me", headers=auth_header(tokens["access_token"]))
     assert response.status_code == 401
     assert response.json()["detail"] == "User not found or inactive"
+
+
+@pytest.mark.anyio
+async def test_us_027_reject_login_with_503_when_password_hasher_is_saturated(client: AsyncClient):
+    await create_userspace(client)
+    await register_user(client)
+
+    original_pool = password_hasher.pool
+    password_hasher.pool = WorkerPool(name="test_hasher", max_workers=1, max_queue=0, retry_after_seconds=3)
+    release = threading.Event()
+    busy = asyncio.create_task(password_hasher.pool.run(release.wait))
+    try:
+        await asyncio.sleep(0)
+        response = await login_user(client)
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+        assert password_hasher.stats()["rejected"] == 1
+    finally:
+        release.set()
+        await busy
+        password_hasher.pool.shutdown()
+        password_hasher.pool = original_pool
+
+    response = await login_user(client)
+    assert response.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_us_028_internal_stats_report_pool_and_hasher_saturation(client: AsyncClient):
+    unauthenticated = await client.get("/internal/stats")
+    assert unauthenticated.status_code == 401
+
+    response = await client.get("/internal/stats", headers=admin_header())
+    assert response.status_code == 200
+    body = response.json()
+    for key in ["checked_out", "overflow", "timeouts", "wait_seconds"]:
+        assert key in body["db_pool"]
+    for key in ["in_flight", "queue_depth", "rejected", "latency_seconds"]:
+        assert key in body["password_hasher"]
+
+
+@pytest.mark.anyio
+async def test_us_029_db_pool_timeouts_are_counted(tmp_path):
+    engine = create_async_engine(
+        f"sqlite+aiosqlite:///{tmp_path / 'pool.db'}",
+        poolclass=InstrumentedAsyncQueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_timeout=0.05,
+    )
+    timeouts_before = pool_metrics.timeouts
+    try:
+        async with engine.connect():
+            with pytest.raises(sa_exc.TimeoutError):
+                async with engine.connect():
+                    pass
+    finally:
+        await engine.dispose()
+
+    assert pool_metrics.timeouts == timeouts_before + 1
+    assert pool_metrics.wait.snapshot()["count"] >= 2
+
+
+@pytest.mark.anyio
+async def test_us_030_repeat_profile_reads_are_served_from_user_cache(client: AsyncClient):
+    await create_userspace(client)
+    tokens = await register_user(client)
+    headers = auth_header(tokens["access_token"])
+
+    first = await client.get("/users/me", headers=headers)
+    assert first.status_code == 200
+    hits_before = user_cache.local.hits
+
+    second = await client.get("/users/me", headers=headers)
+    assert second.status_code == 200
+    assert second.json() == first.json()
+    assert user_cache.local.hits == hits_before + 1
+
+    update = await client.patch("/users/me", headers=headers, json={"full_name": "Alice Example"})
+    assert update.status_code == 200
+
+    after_update = await client.get("/users/me", headers=headers)
+    assert after_update.status_code == 200
+    assert after_update.json()["full_name"] == "Alice Example"
+
+
+@pytest.mark.anyio
+async def test_us_031_invalidation_on_one_worker_evicts_cached_user_on_every_worker():
+    server = fakeredis.FakeServer()
+    workers = [
+        UserCache(
+            backend=RedisCacheBackend(fakeredis.FakeAsyncRedis(server=server)),
+            max_entries=100,
+            ttl_seconds=60,
+            key_prefix="test:",
+        )
+        for _ in range(2)
+    ]
+    listeners = [asyncio.create_task(worker.listen_for_invalidations()) for worker in workers]
+    user = User(
+        id="user-1",
+        namespace="app-x",
+        username="alice",
+        password_hash="x",
+        token_version=0,
+        is_active=True,
+    )
+    try:
+        await asyncio.sleep(0.05)
+        await workers[0].set(user, await workers[0].generation("user-1"))
+
+        cached_elsewhere = await workers[1].get("user-1")
+        assert cached_elsewhere is not None
+        assert workers[1].shared_hits == 1
+        assert workers[1].local.get("user-1") is not None
+
+        await workers[0].invalidate("user-1")
+        for _ in range(50):
+            if workers[1].local.get("user-1") is None:
+                break
+            await asyncio.sleep(0.01)
+
+        assert workers[1].local.get("user-1") is None
+        assert await workers[1].get("user-1") is None
+
+        # Worker 1 loads the user, then worker 0 commits an update and invalidates before
+        # worker 1 caches what it read: the stale snapshot must not stay cached.
+        generation = await workers[1].generation("user-1")
+        await workers[0].invalidate("user-1")
+        await workers[1].set(user, generation)
+        assert workers[1].stale_writes == 1
+        assert workers[1].local.get("user-1") is None
+        assert await workers[0].get("user-1") is None
+
+        # Session revocations reach every worker's local set, so checking a token issued
+        # after the listener subscribed costs no backend round-trip.
+        for _ in range(50):
+            if all(worker.revocations_synced_at is not None for worker in workers):
+                break
+            await asyncio.sleep(0.01)
+        await workers[0].revoke_session("session-1", 60)
+        for _ in range(50):
+            if workers[1].revoked_sessions.get("session-1"):
+                break
+            await asyncio.sleep(0.01)
+        issued_now = time.time() + 10  # beyond REVOCATION_CLOCK_SKEW_SECONDS
+        assert await workers[1].is_session_revoked("session-1", issued_now) is True
+        assert await workers[1].is_session_revoked("session-2", issued_now) is False
+        assert workers[1].revocation_backend_checks == 0
+        # A token older than the subscription may have been revoked before it; the backend is asked.
+        await workers[0].backend.set("test:revoked-session:session-3", b"1", 60)
+        assert await workers[1].is_session_revoked("session-3", 0) is True
+        assert workers[1].revocation_backend_checks == 1
+    finally:
+        for listener in listeners:
+            listener.cancel()
+        await asyncio.gather(*listeners, return_exceptions=True)
+        for worker in workers:
+            await worker.backend.close()
+
+
+@pytest.mark.anyio
+async def test_us_032_cached_token_claims_still_honour_expiry_and_key_rotation(monkeypatch):
+    token = create_access_token("user-1", 0)
+    claims = decode_token(token)
+    hits_before = token_cache.hits
+    assert decode_token(token) == claims
+    assert token_cache.hits == hits_before + 1
+
+    with pytest.raises(ValueError):
+        decode_token(token, now=claims["exp"] + 1)
+
+    decode_token(token)
+    monkeypatch.setattr(settings, "jwt_secret_key", "rotated-secret")
+    with pytest.raises(ValueError):
+        decode_token(token)
+
+
+@pytest.mark.anyio
+async def test_us_033_asymmetric_tokens_verify_offline_against_jwks(client: AsyncClient, tmp_path, monkeypatch):
+    keys_dir = tmp_path / "keys"
+    keys_dir.mkdir()
+    write_ec_signing_key(keys_dir, "2026-01")
+    monkeypatch.setattr(settings, "jwt_algorithm", "ES256")
+    monkeypatch.setattr(settings, "jwt_private_keys_dir", str(keys_dir))
+
+    await create_userspace(client)
+    tokens = await register_user(client)
+    assert jwt.get_unverified_header(tokens["access_token"])["kid"] == "2026-01"
+
+    jwks = await client.get("/.well-known/jwks.json")
+    assert jwks.status_code == 200
+    assert "max-age=" in jwks.headers["Cache-Control"]
+    [public_key] = jwks.json()["keys"]
+    assert public_key["kid"] == "2026-01"
+    assert "d" not in public_key
+    claims = jwt.decode(tokens["access_token"], public_key, algorithms=["ES256"])
+    assert claims["type"] == "access"
+
+    write_ec_signing_key(keys_dir, "2026-02")
+    monkeypatch.setattr(settings, "jwt_active_kid", "2026-02")
+
+    me = await client.get("/users/me", headers=auth_header(tokens["access_token"]))
+    assert me.status_code == 200
+    login = await login_user(client)
+    assert jwt.get_unverified_header(login.json()["access_token"])["kid"] == "2026-02"
+
+    rotated = await client.get("/.well-known/jwks.json")
+    assert [key["kid"] for key in rotated.json()["keys"]] == ["2026-01", "2026-02"]
+    not_modified = await client.get("/.well-known/jwks.json", headers={"If-None-Match": rotated.headers["ETag"]})
+    assert not_modified.status_code == 304
+
+
+@pytest.mark.anyio
+async def test_us_034_bulk_import_users_from_ndjson(client: AsyncClient, monkeypatch):
+    await create_userspace(client)
+    await register_user(client, username="alice")
+
+    bcrypt_hash = bcrypt.using(rounds=4).hash("carol-secret-1")
+    argon2_hash = "$argon2id$v=19$m=65536,t=3,p=4$c2FsdA$aGFzaA"
+    rows = [
+        {"username": "bob", "password": "supersecret123", "email": "bob@example.com"},
+        {"username": "carol", "password_hash": bcrypt_hash, "extra": {"role": "admin"}},
+        {"username": "bob", "password": "supersecret123"},
+        {"username": "alice", "password": "supersecret123"},
+        {"username": "dave", "password": "supersecret123", "email": "alice@example.com"},
+        {"username": "x"},
+        {"username": "erin", "password_hash": argon2_hash},
+        {"username": "frank", "password_hash": "$2b$12$truncated"},
+    ]
+    body = "\n".join(json.dumps(row) for row in rows) + "\nnot-json\n"
+
+    forbidden = await client.post("/userspaces/app-x/users/import", content=body)
+    assert forbidden.status_code == 401
+
+    response = await client.post(
+        "/userspaces/app-x/users/import?batch_size=4",
+        content=body,
+        headers={**admin_header(), "Content-Type": "application/x-ndjson"},
+    )
+    assert response.status_code == 200
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    results, summary = lines[:-1], lines[-1]
+
+    assert [(result["line"], result["status"]) for result in results] == [
+        (1, "created"),
+        (2, "created"),
+        (3, "error"),
+        (4, "error"),
+        (5, "error"),
+        (6, "error"),
+        (7, "error"),
+        (8, "error"),
+        (9, "error"),
+    ]
+    assert results[2]["error"] == "Duplicate username in import"
+    assert results[3]["error"] == "Username already exists in namespace"
+    assert results[4]["error"] == "Email already exists in namespace"
+    unsupported_hash = f"password_hash: not a valid hash for the configured schemes ({', '.join(settings.password_hash_schemes)})"
+    assert results[6]["error"] == unsupported_hash
+    assert results[7]["error"] == unsupported_hash
+    assert results[8]["error"] == "Invalid JSON"
+    assert summary == {"summary": {"created": 2, "error": 7}}
+
+    login = await login_user(client, username="bob")
+    assert login.status_code == 200
+    # conftest swaps in a fast fake verifier; imported hashes need the real one.
+    monkeypatch.setattr(security_service, "verify_password", verify_password)
+    assert (await login_user(client, username="carol", password="carol-secret-1")).status_code == 200
+    # A stored hash outside the configured schemes fails verification instead of raising.
+    assert verify_password("supersecret123", argon2_hash) is False
+
+
+@pytest.mark.anyio
+async def test_us_035_bulk_import_users_from_csv(client: AsyncClient):
+    await create_userspace(client)
+
+    body = "username,password,email,extra\nerin,supersecret123,erin@example.com,\"{\"\"team\"\": \"\"ops\"\"}\"\n"
+    response = await client.post(
+        "/userspaces/app-x/users/import",
+        content=body,
+        headers={**admin_header(), "Content-Type": "text/csv"},
+    )
+    assert response.status_code == 200
+    result, summary = [json.loads(line) for line in response.text.splitlines()]
+    assert result["status"] == "created"
+    assert summary == {"summary": {"created": 1, "error": 0}}
+
+    login = await login_user(client, username="erin")
+    me = await client.get("/users/me", headers=auth_header(login.json()["access_token"]))
+    assert me.json()["extra"] == {"team": "ops"}
+
+
+@pytest.mark.anyio
+async def test_us_036_export_namespace_users_with_keyset_resume(client: AsyncClient):
+    await create_userspace(client)
+    await create_userspace(client, namespace="other")
+    for username in ["alice", "bob", "carol"]:
+        await register_user(client, username=username)
+    await register_user(client, namespace="other", username="mallory")
+
+    response = await client.get("/userspaces/app-x/users/export", headers=admin_header())
+    assert response.status_code == 200
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert sorted(row["username"] for row in rows) == ["alice", "bob", "carol"]
+    assert [row["id"] for row in rows] == sorted(row["id"] for row in rows)
+    assert "password_hash" not in rows[0]
+
+    resumed = await client.get(
+        "/userspaces/app-x/users/export",
+        params={"after": rows[0]["id"]},
+        headers=admin_header(),
+    )
+    assert [json.loads(line)["id"] for line in resumed.text.splitlines()] == [row["id"] for row in rows[1:]]
+
+    as_csv = await client.get("/userspaces/app-x/users/export", params={"format": "csv"}, headers=admin_header())
+    assert as_csv.headers["content-type"].startswith("text/csv")
+    header, *csv_rows = as_csv.text.splitlines()
+    assert header.startswith("id,namespace,username")
+    assert len(csv_rows) == 3
+
+
+@pytest.mark.anyio
+async def test_us_037_list_namespace_users_with_cursor_filters_and_sparse_fields(client: AsyncClient):
+    await create_userspace(client)
+    for username in ["alice", "alex", "bob", "carol"]:
+        await register_user(client, username=username)
+
+    first = await client.get("/userspaces/app-x/users", params={"limit": 3}, headers=admin_header())
+    assert first.status_code == 200
+    first_page = first.json()
+    assert len(first_page["items"]) == 3
+    assert first_page["next_cursor"]
+
+    second = await client.get(
+        "/userspaces/app-x/users",
+        params={"limit": 3, "cursor": first_page["next_cursor"]},
+        headers=admin_header(),
+    )
+    second_page = second.json()
+    assert len(second_page["items"]) == 1
+    assert second_page["next_cursor"] is None
+    all_ids = [item["id"] for item in first_page["items"] + second_page["items"]]
+    assert all_ids == sorted(all_ids)
+
+    by_prefix = await client.get(
+        "/userspaces/app-x/users",
+        params={"username_prefix": "al", "fields": "username,email", "limit": 1},
+        headers=admin_header(),
+    )
+    page = by_prefix.json()
+    assert page["items"] == [{"username": "alex", "email": "alex@example.com"}]
+    rest = await client.get(
+        "/userspaces/app-x/users",
+        params={"username_prefix": "al", "fields": "username,email", "cursor": page["next_cursor"]},
+        headers=admin_header(),
+    )
+    assert rest.json() == {"items": [{"username": "alice", "email": "alice@example.com"}], "next_cursor": None}
+
+    for prefix in ("al\U0010ffff", "al-"):
+        no_match = await client.get(
+            "/userspaces/app-x/users",
+            params={"username_prefix": prefix, "fields": "username"},
+            headers=admin_header(),
+        )
+        assert no_match.status_code == 200
+        assert no_match.json() == {"items": [], "next_cursor": None}
+
+    bob_id = next(item["id"] for item in first_page["items"] + second_page["items"] if item["username"] == "bob")
+    await set_user_active_flag(bob_id, False)
+    inactive = await client.get(
+        "/userspaces/app-x/users",
+        params={"is_active": "false", "fields": "username"},
+        headers=admin_header(),
+    )
+    assert inactive.json()["items"] == [{"username": "bob"}]
+
+    bad_fields = await client.get("/userspaces/app-x/users", params={"fields": "password_hash"}, headers=admin_header())
+    assert bad_fields.status_code == 400
+    assert bad_fields.json()["detail"] == "Unknown fields: password_hash"
+
+
+@pytest.mark.anyio
+async def test_us_038_reject_duplicate_email_in_same_namespace(client: AsyncClient):
+    await create_userspace(client)
+    await register_user(client, username="alice")
+
+    duplicate = await client.post(
+        "/auth/register",
+        json={
+            "namespace": "app-x",
+            "username": "alice-two",
+            "password": "supersecret123",
+            "email": "alice@example.com",
+        },
+    )
+    assert duplicate.status_code == 400
+    assert duplicate.json()["detail"] == "Email already exists in namespace"
+
+    retry = await client.post(
+        "/auth/register",
+        json={"namespace": "app-x", "username": "alice-two", "password": "supersecret123"},
+    )
+    assert retry.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_us_039_avatar_upload_produces_stripped_webp_variants(client: AsyncClient):
+    await create_userspace(client)
+    tokens = await register_user(client)
+
+    response = await client.post(
+        "/users/me/avatar",
+        headers=auth_header(tokens["access_token"]),
+        files={"file": ("photo.jpg", jpeg_with_exif(), "image/jpeg")},
+    )
+    assert response.status_code == 200
+    body = response.json()
+    assert set(body["avatar_variants"]) == {"64", "128", "256"}
+
+    with Image.open(avatar_disk_path(body["avatar_url"])) as original:
+        assert original.format == "JPEG"
+        assert original.size == (300, 200)
+        assert "exif" not in original.info
+    for size, url in body["avatar_variants"].items():
+        with Image.open(avatar_disk_path(url)) as variant:
+            assert variant.format == "WEBP"
+            assert variant.size == (int(size), int(size))
+
+    me = await client.get("/users/me", headers=auth_header(tokens["access_token"]))
+    assert me.json()["avatar_variants"] == body["avatar_variants"]
+
+    delete = await client.delete("/users/me/avatar", headers=auth_header(tokens["access_token"]))
+    assert delete.status_code == 204
+    await release_avatars()
+    for url in [body["avatar_url"], *body["avatar_variants"].values()]:
+        assert not avatar_disk_path(url).exists()
+
+    # Avatars stored before content addressing have no variants on disk.
+    legacy_url = "/uploads/avatars/0d6c3f2e-4f6a-4b8e-9c1d-2a7b5e8f9b1f/9b1f.png"
+    me = await client.get("/users/me", headers=auth_header(tokens["access_token"]))
+    override_get_db = app.dependency_overrides[get_db]
+    db_generator = override_get_db()
+    db = await db_generator.__anext__()
+    try:
+        await db.execute(update(User).where(User.id == me.json()["id"]).values(avatar_url=legacy_url))
+        await db.commit()
+        await user_cache.invalidate(me.json()["id"])
+    finally:
+        await db_generator.aclose()
+    me = await client.get("/users/me", headers=auth_header(tokens["access_token"]))
+    assert me.json()["avatar_url"] == legacy_url
+    assert me.json()["avatar_variants"] is None
+
+
+@pytest.mark.anyio
+async def test_us_040_identical_avatars_share_one_file(client: AsyncClient):
+    await create_userspace(client)
+    alice = await register_user(client, username="alice")
+    bob = await register_user(client, username="bob")
+
+    urls = []
+    for tokens in (alice, bob):
+        response = await client.post(
+            "/users/me/avatar",
+            headers=auth_header(tokens["access_token"]),
+            files={"file": upload_avatar_file()},
+        )
+        assert response.status_code == 200
+        urls.append(response.json()["avatar_url"])
+    assert urls[0] == urls[1]
+    avatar_path = avatar_disk_path(urls[0])
+    assert avatar_path.parent.name == avatar_path.stem[:2]
+
+    again = await client.post(
+        "/users/me/avatar",
+        headers=auth_header(alice["access_token"]),
+        files={"file": upload_avatar_file()},
+    )
+    assert again.json()["avatar_url"] == urls[0]
+    assert avatar_path.exists()
+
+    # Only an upload sets avatar_url, so nobody can take a reference to someone else's file.
+    carol = await client.post(
+        "/auth/register",
+        json={"namespace": "app-x", "username": "carol", "password": "supersecret123", "avatar_url": urls[0]},
+    )
+    carol_headers = auth_header(carol.json()["access_token"])
+    patched = await client.patch("/users/me", headers=carol_headers, json={"avatar_url": urls[0]})
+    assert patched.json()["avatar_url"] is None
+    assert (await client.delete("/users/me/avatar", headers=carol_headers)).status_code == 204
+
+    await client.delete("/users/me/avatar", headers=auth_header(alice["access_token"]))
+    await release_avatars()
+    assert avatar_path.exists()
+
+    await client.delete("/users/me/avatar", headers=auth_header(bob["access_token"]))
+    assert avatar_path.exists()
+    await release_avatars()
+    assert not avatar_path.exists()
+
+
+@pytest.mark.anyio
+async def test_us_041_avatar_gc_sweeps_orphaned_files(client: AsyncClient):
+    await create_userspace(client)
+    tokens = await register_user(client)
+    upload = await client.post(
+        "/users/me/avatar",
+        headers=auth_header(tokens["access_token"]),
+        files={"file": upload_avatar_file()},
+    )
+    kept_path = avatar_disk_path(upload.json()["avatar_url"])
+
+    avatars_dir = Path(settings.uploads_dir) / "avatars"
+    orphan = avatars_dir / "ab" / f"{'ab' * 32}.png"
+    legacy = avatars_dir / "some-user-id" / "old.png"
+    fresh = avatars_dir / "cd" / f"{'cd' * 32}.png"
+    for path in (orphan, legacy, fresh):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b"stale")
+    for path in (orphan, legacy, kept_path):
+        os.utime(path, (0, 0))
+
+    override_get_db = app.dependency_overrides[get_db]
+    db_generator = override_get_db()
+    db = await db_generator.__anext__()
+    try:
+        report = await collect_avatar_garbage(db, grace_seconds=60, recount=True)
+    finally:
+        await db_generator.aclose()
+
+    assert report.files_removed == 2
+    assert not orphan.exists()
+    assert not legacy.exists()
+    assert fresh.exists()
+    assert kept_path.exists()
+
+
+@pytest.mark.anyio
+async def test_us_042_avatar_files_are_served_with_immutable_cache_headers(client: AsyncClient):
+    await create_userspace(client)
+    tokens = await register_user(client)
+    upload = await client.post(
+        "/users/me/avatar",
+        headers=auth_header(tokens["access_token"]),
+        files={"file": upload_avatar_file()},
+    )
+    avatar_url = upload.json()["avatar_url"]
+    digest = Path(avatar_url).stem
+    on_disk = avatar_disk_path(avatar_url).read_bytes()
+
+    first = await client.get(avatar_url)
+    assert first.status_code == 200
+    assert first.content == on_disk
+    assert first.headers["etag"] == f'"{digest}"'
+    assert first.headers["cache-control"] == "public, max-age=31536000, immutable"
+
+    memory_cache = avatar_service.avatar_storage.files.memory_cache
+    hits_before = memory_cache.hits
+    second = await client.get(avatar_url)
+    assert second.content == on_disk
+    assert second.headers["etag"] == f'"{digest}"'
+    assert memory_cache.hits == hits_before + 1
+
+    not_modified = await client.get(avatar_url, headers={"If-None-Match": f'"{digest}"'})
+    assert not_modified.status_code == 304
+    assert not_modified.content == b""
+
+    partial = await client.get(avatar_url, headers={"Range": "bytes=0-9"})
+    assert partial.status_code == 206
+    assert partial.content == on_disk[:10]
+
+    variant = await client.get(upload.json()["avatar_variants"]["64"])
+    assert variant.headers["etag"] == f'"{digest}_64"'
+
+    await client.delete("/users/me/avatar", headers=auth_header(tokens["access_token"]))
+    await release_avatars()
+    assert (await client.get(avatar_url)).status_code == 404
+
+
+@pytest.mark.anyio
+async def test_us_043_avatars_in_s3_compatible_storage(client: AsyncClient, monkeypatch):
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    with mock_aws():
+        s3 = boto3.client("s3", region_name="us-east-1")
+        s3.create_bucket(Bucket="avatars")
+        monkeypatch.setattr(avatar_service, "avatar_storage", S3AvatarStorage(s3, "avatars", key_prefix="users/"))
+
+        await create_userspace(client)
+        tokens = await register_user(client)
+        upload = await client.post(
+            "/users/me/avatar",
+            headers=auth_header(tokens["access_token"]),
+            files={"file": upload_avatar_file()},
+        )
+        assert upload.status_code == 200
+        avatar_url = upload.json()["avatar_url"]
+        key = "users/" + avatar_url.removeprefix("/uploads/")
+        stored = s3.get_object(Bucket="avatars", Key=key)
+        assert stored["ContentType"] == "image/png"
+        assert stored["CacheControl"] == "public, max-age=31536000, immutable"
+        assert not avatar_disk_path(avatar_url).exists()
+
+        redirect = await client.get(avatar_url)
+        assert redirect.status_code == 307
+        assert f"/{key}?" in redirect.headers["location"]
+        assert "Signature" in redirect.headers["location"]
+        assert (await client.get(avatar_url)).headers["location"] == redirect.headers["location"]
+
+        delete = await client.delete("/users/me/avatar", headers=auth_header(tokens["access_token"]))
+        assert delete.status_code == 204
+        await release_avatars()
+        assert s3.list_objects_v2(Bucket="avatars").get("KeyCount") == 0
+
+
+@pytest.mark.anyio
+async def test_us_044_avatar_upload_is_validated_while_streaming(client: AsyncClient, tmp_path):
+    await create_userspace(client)
+    tokens = await register_user(client)
+    spool_dir = tmp_path / "spool"
+    spool_dir.mkdir()
+    original_spool_dir = settings.avatar_spool_dir
+    settings.avatar_spool_dir = str(spool_dir)
+    try:
+        bomb = BytesIO()
+        Image.new("1", (5000, 5000)).save(bomb, format="PNG")
+        assert len(bomb.getvalue()) < settings.avatar_max_bytes
+        response = await client.post(
+            "/users/me/avatar",
+            headers=auth_header(tokens["access_token"]),
+            files={"file": ("bomb.png", bomb.getvalue(), "image/png")},
+        )
+        assert response.status_code == 400
+        assert response.json()["detail"] == f"Image dimensions too large. Max is {settings.avatar_max_pixels} pixels"
+
+        disguised = await client.post(
+            "/users/me/avatar",
+            headers=auth_header(tokens["access_token"]),
+            files={"file": ("avatar.jpg", b"GIF89a" + b"\x00" * 1024, "image/jpeg")},
+        )
+        assert disguised.status_code == 400
+        assert disguised.json()["detail"] == "Invalid image payload"
+
+        sent = 0
+
+        async def endless_png():
+            nonlocal sent
+            parts = [
+                b'--b\r\nContent-Disposition: form-data; name="file"; filename="big.png"\r\n'
+                b"Content-Type: image/png\r\n\r\n\x89PNG\r\n\x1a\n"
+            ]
+            while True:
+                chunk = parts.pop() if parts else b"\x00" * 65536
+                sent += len(chunk)
+                yield chunk
+
+        multipart_header = {"Content-Type": "multipart/form-data; boundary=b"}
+        anonymous = await client.post("/users/me/avatar", headers=multipart_header, content=endless_png())
+        assert anonymous.status_code == 401
+        assert sent == 0
+
+        endless = await client.post(
+            "/users/me/avatar",
+            headers={**auth_header(tokens["access_token"]), **multipart_header},
+            content=endless_png(),
+        )
+        assert endless.status_code == 400
+        assert endless.json()["detail"] == f"File too large. Max size is {settings.avatar_max_bytes} bytes"
+        assert sent < settings.avatar_max_bytes + 2 * 65536
+
+        declared = await client.post(
+            "/users/me/avatar",
+            headers={
+                **auth_header(tokens["access_token"]),
+                **multipart_header,
+                "Content-Length": str(settings.avatar_max_bytes * 2),
+            },
+            content=b"--b--\r\n",
+        )
+        assert declared.status_code == 400
+        assert declared.json()["detail"] == f"File too large. Max size is {settings.avatar_max_bytes} bytes"
+
+        upload = await client.post(
+            "/users/me/avatar",
+            headers=auth_header(tokens["access_token"]),
+            files={"file": upload_avatar_file()},
+        )
+        assert upload.status_code == 200
+        assert list(spool_dir.iterdir()) == []
+    finally:
+        settings.avatar_spool_dir = original_spool_dir
+
+
+@pytest.mark.anyio
+async def test_us_045_prometheus_metrics(client: AsyncClient):
+    await create_userspace(client)
+    tokens = await register_user(client)
+    login = await client.post(
+        "/auth/login",
+        json={"namespace": "app-x", "username": "alice", "password": "supersecret123"},
+    )
+    assert login.status_code == 200
+    await client.get("/users/me", headers=auth_header(tokens["access_token"]))
+    await client.get("/uploads/avatars/00/missing.png")
+    await client.get("/no-such-route")
+
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    body = response.text
+    assert 'user_service_http_requests_total{method="POST",route="/auth/login",status="200"}' in body
+    assert 'user_service_http_request_duration_seconds_bucket{le="0.005",method="GET",route="/users/me"' in body
+    assert 'user_service_password_hash_duration_seconds_count{operation="verify"}' in body
+    assert 'user_service_worker_pool_run_seconds_count{pool="password_hasher"}' in body
+    assert 'user_service_jwt_decode_duration_seconds_count{cache="miss"}' in body
+    login_queries = next(
+        line for line in body.splitlines() if line.startswith('user_service_db_queries_per_request_sum{route="/auth/login"}')
+    )
+    assert float(login_queries.rsplit(" ", 1)[1]) >= 1
+    assert "user_service_http_requests_in_flight" in body
+    assert 'user_service_http_requests_total{method="GET",route="/uploads",status="404"}' in body
+    assert 'user_service_http_requests_total{method="GET",route="unmatched",status="404"}' in body
+
+
+@pytest.mark.anyio
+async def test_us_046_endpoints_stay_within_query_budgets(client: AsyncClient):
+    await create_userspace(client)
+    register = await client.post(
+        "/auth/register",
+        json={"namespace": "app-x", "username": "alice", "password": "supersecret123"},
+    )
+    assert_max_queries(register, 2)
+    headers = auth_header(register.json()["access_token"])
+
+    login = await client.post(
+        "/auth/login",
+        json={"namespace": "app-x", "username": "alice", "password": "supersecret123"},
+    )
+    # Login also trims the user's oldest sessions beyond REFRESH_SESSION_MAX_PER_USER.
+    assert_max_queries(login, 3)
+    assert_max_queries(await client.post("/auth/refresh", json={"refresh_token": login.json()["refresh_token"]}), 2)
+
+    await client.get("/users/me", headers=headers)
+    assert_max_queries(await client.get("/users/me", headers=headers), 0)
+    assert_max_queries(await client.patch("/users/me", headers=headers, json={"full_name": "Alice"}), 3)
+    assert_max_queries(
+        await client.post("/users/me/avatar", headers=headers, files={"file": upload_avatar_file()}),
+        4,
+    )
+    assert_max_queries(await client.get("/userspaces/app-x/users", headers=admin_header()), 2)
+
+
+@pytest.mark.anyio
+async def test_us_047_request_and_slow_query_logs(client: AsyncClient, caplog):
+    await create_userspace(client)
+    original_slow_query_ms = settings.db_slow_query_ms
+    original_repeated_threshold = settings.db_repeated_query_threshold
+    settings.db_slow_query_ms = 0
+    settings.db_repeated_query_threshold = 1
+    try:
+        with caplog.at_level(logging.INFO):
+            response = await client.post(
+                "/auth/register",
+                json={"namespace": "app-x", "username": "alice", "password": "supersecret123", "email": "alice@example.com"},
+            )
+        assert response.status_code == 200
+    finally:
+        settings.db_slow_query_ms = original_slow_query_ms
+        settings.db_repeated_query_threshold = original_repeated_threshold
+
+    request_logs = [record for record in caplog.records if record.name == "app.requests" and record.levelno == logging.INFO]
+    assert any(record.route == "/auth/register" and record.db_queries == 2 for record in request_logs)
+    slow_queries = [record for record in caplog.records if record.getMessage().startswith("slow query")]
+    assert slow_queries
+    assert any(record.getMessage().startswith("repeated query") for record in caplog.records)
+    for record in caplog.records:
+        assert "alice@example.com" not in record.getMessage()
+        assert "supersecret123" not in record.getMessage()
+
+
+@pytest.mark.anyio
+async def test_us_048_liveness_and_readiness_probes(client: AsyncClient, monkeypatch):
+    live = await client.get("/health/live")
+    assert live.status_code == 200
+    assert live.json() == {"status": "ok"}
+
+    ready = await client.get("/health/ready")
+    assert ready.status_code == 200
+    body = ready.json()
+    assert body["status"] == "ok"
+    assert body["cached"] is False
+    assert set(body["checks"]) == {"database", "db_pool", "storage", "password_hasher"}
+    assert body["checks"]["database"]["rtt_ms"] >= 0
+    assert body["checks"]["storage"]["free_bytes"] > 0
+
+    again = await client.get("/health/ready")
+    assert again.json()["cached"] is True
+
+    pool = password_hasher.pool
+    monkeypatch.setattr(pool, "_in_flight", pool.max_workers + pool.max_queue)
+    readiness_probe.reset()
+    saturated = await client.get("/health/ready")
+    assert saturated.status_code == 503
+    assert saturated.json()["status"] == "fail"
+    assert saturated.json()["checks"]["password_hasher"]["ok"] is False
+    monkeypatch.undo()
+
+    monkeypatch.setattr(settings, "health_uploads_min_free_bytes", 2**62)
+    readiness_probe.reset()
+    disk_full = await client.get("/health/ready")
+    assert disk_full.status_code == 503
+    assert disk_full.json()["checks"]["storage"]["ok"] is False
+
+
+@pytest.mark.anyio
+async def test_us_049_login_attempts_are_throttled_before_any_work(client: AsyncClient, monkeypatch):
+    await create_userspace(client)
+    await register_user(client)
+    await register_user(client, username="bob")
+    monkeypatch.setattr(login_throttle.account_limiter, "limit", 3)
+    monkeypatch.setattr(login_throttle.ip_limiter, "limit", 8)
+    verify_calls = 0
+    original_verify = security_service.verify_password
+
+    def counting_verify(plain_password: str, password_hash: str) -> bool:
+        nonlocal verify_calls
+        verify_calls += 1
+        return original_verify(plain_password, password_hash)
+
+    monkeypatch.setattr(security_service, "verify_password", counting_verify)
+
+    for _ in range(3):
+        assert (await login_user(client, password="wrong-password")).status_code == 401
+    throttled = await login_user(client)
+    assert throttled.status_code == 429
+    assert int(throttled.headers["retry-after"]) >= 1
+    assert query_count(throttled) == 0
+    assert verify_calls == 3
+
+    # Other accounts on the same IP are unaffected; successful logins do not count against them.
+    for _ in range(3):
+        assert (await login_user(client, username="bob")).status_code == 200
+    # The IP budget (8 attempts) is now spent, whichever account is targeted.
+    assert (await login_user(client, username="bob")).status_code == 200
+    assert (await login_user(client, username="bob")).status_code == 429
+
+    metrics = (await client.get("/metrics")).text
+    assert 'user_service_rate_limit_decisions_total{limiter="login_account",outcome="throttled"}' in metrics
+    assert 'user_service_rate_limit_decisions_total{limiter="login_ip",outcome="throttled"}' in metrics
+    stats = (await client.get("/internal/stats", headers={"X-Admin-Key": "test-admin-key"})).json()
+    assert stats["login_throttle"]["account"]["throttled"] >= 1
+
+    # Concurrent guesses reserve their failure before the slow verify, so no more than the
+    # account limit reach it.
+    await register_user(client, username="carol")
+    monkeypatch.setattr(login_throttle.ip_limiter, "limit", 100)
+    verify_calls = 0
+
+    def slow_verify(plain_password: str, password_hash: str) -> bool:
+        nonlocal verify_calls
+        verify_calls += 1
+        time.sleep(0.05)
+        return original_verify(plain_password, password_hash)
+
+    monkeypatch.setattr(security_service, "verify_password", slow_verify)
+    spray = await asyncio.gather(
+        *(login_user(client, username="carol", password=f"guess-{index}") for index in range(8))
+    )
+    assert sorted(response.status_code for response in spray) == [401] * 3 + [429] * 5
+    assert verify_calls == 3
+
+
+@pytest.mark.anyio
+async def test_us_050_rate_limits_slide_are_shared_across_workers_and_bounded():
+    now = 60.0 * 16_666  # start of a window
+
+    def clock() -> float:
+        return now
+
+    server = fakeredis.FakeServer()
+    workers = [
+        SlidingWindowLimiter("login_ip", RedisCacheBackend(fakeredis.FakeAsyncRedis(server=server)), 4, 60, clock=clock)
+        for _ in range(2)
+    ]
+    for index in range(4):
+        await workers[index % 2].hit("203.0.113.7")
+    with pytest.raises(RateLimitedError) as excinfo:
+        await workers[1].hit("203.0.113.7")
+    assert 1 <= excinfo.value.retry_after_seconds <= 120
+
+    # Halfway through the next window, half of the previous window's events still count.
+    now += 90
+    await workers[0].hit("203.0.113.7")
+    with pytest.raises(RateLimitedError):
+        await workers[0].hit("203.0.113.7")
+    now += 60
+    await workers[1].hit("203.0.113.7")
+
+    backend = MemoryCacheBackend(max_entries=10)
+    limiter = SlidingWindowLimiter("login_ip", backend, 1, 60, clock=clock)
+    for index in range(1000):
+        await limiter.hit(f"198.51.100.{index}")
+    assert len(backend._store) <= 10
+
+
+@pytest.mark.anyio
+async def test_us_051_unknown_usernames_cost_a_bounded_dummy_verification(client: AsyncClient, monkeypatch):
+    await create_userspace(client)
+    await register_user(client)
+    verified_passwords: list[str] = []
+    release = threading.Event()
+    original_verify = security_service.verify_password
+
+    def gated_verify(plain_password: str, password_hash: str) -> bool:
+        verified_passwords.append(plain_password)
+        if plain_password == "hold":
+            release.wait(timeout=5)
+        return original_verify(plain_password, password_hash)
+
+    monkeypatch.setattr(security_service, "verify_password", gated_verify)
+    monkeypatch.setattr(login_failure_policy, "max_concurrent_per_namespace", 1)
+
+    unknown = await login_user(client, username="nobody", password="guess-1")
+    assert unknown.status_code == 401
+    assert unknown.json() == (await login_user(client, password="guess-2")).json()
+    assert verified_passwords == ["guess-1", "guess-2"]
+
+    # With one dummy verification in flight, the next unknown-user login waits instead of verifying.
+    held = asyncio.create_task(login_user(client, username="nobody", password="hold"))
+    while "hold" not in verified_passwords:
+        await asyncio.sleep(0.01)
+    monkeypatch.setattr(login_failure_policy, "_verify_seconds", 0.01)
+    delayed = await login_user(client, username="ghost", password="guess-3")
+    assert delayed.status_code == 401
+    assert "guess-3" not in verified_passwords
+    release.set()
+    assert (await held).status_code == 401
+
+    monkeypatch.setattr(login_failure_policy, "mode", "skip")
+    await login_user(client, username="ghost", password="guess-4")
+    assert "guess-4" not in verified_passwords
+
+    metrics = (await client.get("/metrics")).text
+    for outcome in ("unknown_user", "unknown_user_delayed", "unknown_user_skipped", "wrong_password"):
+        assert f'user_service_login_duration_seconds_count{{outcome="{outcome}"}}' in metrics
+
+
+@pytest.mark.anyio
+async def test_us_052_password_hashes_are_upgraded_on_login(client: AsyncClient, monkeypatch):
+    def use_bcrypt_rounds(rounds: int) -> None:
+        monkeypatch.setattr(
+            security_service,
+            "pwd_context",
+            security_service.build_password_context(["bcrypt"], rounds, argon2_time_cost=3, argon2_memory_kib=65536),
+        )
+
+    monkeypatch.setattr(security_service, "hash_password", lambda password: security_service.pwd_context.hash(password))
+    monkeypatch.setattr(
+        security_service,
+        "verify_password",
+        lambda plain_password, password_hash: security_service.pwd_context.verify(plain_password, password_hash),
+    )
+    use_bcrypt_rounds(4)
+    await create_userspace(client)
+    await register_user(client)
+    await register_user(client, username="bob")
+
+    use_bcrypt_rounds(5)
+    override_get_db = app.dependency_overrides[get_db]
+
+    async def report() -> dict:
+        db_generator = override_get_db()
+        db = await db_generator.__anext__()
+        try:
+            return await password_hash_report(db, namespace="app-x")
+        finally:
+            await db_generator.aclose()
+
+    before = await report()
+    assert before["schemes"] == {"bcrypt": {"rounds=4": 2}}
+    assert before["needs_update"] == 2
+
+    assert (await login_user(client, password="wrong-password")).status_code == 401
+    assert (await report())["needs_update"] == 2
+    assert (await login_user(client)).status_code == 200
+    after = await report()
+    assert after["schemes"] == {"bcrypt": {"rounds=4": 1, "rounds=5": 1}}
+    assert after["needs_update"] == 1
+    # The upgraded hash still verifies, and is not upgraded again.
+    assert (await login_user(client)).status_code == 200
+    assert (await report())["needs_update"] == 1
+
+    metrics = (await client.get("/metrics")).text
+    assert 'user_service_password_rehashes_total{scheme="bcrypt"}' in metrics
+    assert describe_hash("$argon2id$v=19$m=65536,t=3,p=4$c2FsdA$aGFzaA") == ("argon2", "m=65536,t=3,p=4")
+    assert describe_hash("test-hash::x") == ("unknown", "")
+
+    cost, samples = calibrate("bcrypt", target_ms=0.0, samples=1)
+    assert cost == 4
+    assert [sample.cost for sample in samples] == [4]
+
+
+@pytest.mark.anyio
+async def test_us_053_refresh_tokens_rotate_per_device_and_reuse_revokes_the_session(client: AsyncClient):
+    await create_userspace(client)
+    phone = await register_user(client)
+    login = await client.post(
+        "/auth/login",
+        json={"namespace": "app-x", "username": "alice", "password": "supersecret123", "device_name": "laptop"},
+    )
+    laptop = login.json()
+
+    rotated = await client.post("/auth/refresh", json={"refresh_token": laptop["refresh_token"]})
+    assert rotated.status_code == 200
+    laptop_next = rotated.json()
+    assert laptop_next["refresh_token"] != laptop["refresh_token"]
+    claims = decode_token(laptop_next["refresh_token"])
+
+    override_get_db = app.dependency_overrides[get_db]
+    db_generator = override_get_db()
+    db = await db_generator.__anext__()
+    try:
+        stored = await db.get(RefreshSession, claims["sid"])
+        assert stored.token_hash == hash_token_id(claims["jti"])
+        assert stored.generation == 1
+        assert stored.device == "laptop"
+    finally:
+        await db_generator.aclose()
+
+    sessions = await client.get("/auth/sessions", headers=auth_header(laptop_next["access_token"]))
+    assert sessions.status_code == 200
+    by_device = {session["device"]: session for session in sessions.json()}
+    assert by_device["laptop"]["current"] is True
+    assert len(by_device) == 2
+
+    # Replaying the old laptop token revokes the laptop session, including its newest token.
+    reused = await client.post("/auth/refresh", json={"refresh_token": laptop["refresh_token"]})
+    assert reused.status_code == 401
+    assert reused.json()["detail"] == "Refresh token reuse detected"
+    revoked = await client.post("/auth/refresh", json={"refresh_token": laptop_next["refresh_token"]})
+    assert revoked.status_code == 401
+    assert revoked.json()["detail"] == "Refresh token is no longer valid"
+    assert (await client.get("/users/me", headers=auth_header(laptop_next["access_token"]))).status_code == 401
+
+    # Logging out the phone leaves other sessions, and their access tokens, usable.
+    tablet = (await login_user(client)).json()
+    assert (await client.post("/auth/logout", headers=auth_header(phone["access_token"]))).status_code == 204
+    assert (await client.get("/users/me", headers=auth_header(phone["access_token"]))).status_code == 401
+    assert (await client.get("/users/me", headers=auth_header(tablet["access_token"]))).status_code == 200
+    phone_refresh = await client.post("/auth/refresh", json={"refresh_token": phone["refresh_token"]})
+    assert phone_refresh.status_code == 401
+    tablet_refresh = await client.post("/auth/refresh", json={"refresh_token": tablet["refresh_token"]})
+    assert tablet_refresh.status_code == 200
+
+    # Stateless refresh tokens from before sessions existed are exchanged once for a session.
+    me = await client.get("/users/me", headers=auth_header(tablet_refresh.json()["access_token"]))
+    legacy = create_refresh_token(me.json()["id"], me.json()["token_version"])
+    migrated = await client.post("/auth/refresh", json={"refresh_token": legacy})
+    assert migrated.status_code == 200
+    assert decode_token(migrated.json()["refresh_token"])["sid"]
+
+    tablet_headers = auth_header(tablet_refresh.json()["access_token"])
+    tablet_session = decode_token(tablet_refresh.json()["access_token"])["sid"]
+    migrated_headers = auth_header(migrated.json()["access_token"])
+    assert (await client.delete(f"/auth/sessions/{tablet_session}", headers=migrated_headers)).status_code == 204
+    assert (await client.delete(f"/auth/sessions/{tablet_session}", headers=migrated_headers)).status_code == 404
+    assert (await client.get("/users/me", headers=tablet_headers)).status_code == 401
+
+    assert (await client.post("/auth/logout-all", headers=auth_header(migrated.json()["access_token"]))).status_code == 204
+    after_logout_all = await client.post("/auth/refresh", json={"refresh_token": migrated.json()["refresh_token"]})
+    assert after_logout_all.status_code == 401
+
+    metrics = (await client.get("/metrics")).text
+    assert 'user_service_refresh_token_events_total{event="reuse_detected"}' in metrics
+
+
+@pytest.mark.anyio
+async def test_us_054_expired_refresh_sessions_are_swept_in_batches(client: AsyncClient):
+    await create_userspace(client)
+    tokens = await register_user(client)
+    user_id = decode_token(tokens["access_token"])["sub"]
+    now = datetime.now(timezone.utc)
+
+    override_get_db = app.dependency_overrides[get_db]
+    db_generator = override_get_db()
+    db = await db_generator.__anext__()
+    try:
+        db.add_all(
+            RefreshSession(
+                id=f"expired-{index}",
+                user_id=user_id,
+                token_hash=hash_token_id(f"token-{index}"),
+                expires_at=now - timedelta(minutes=index + 1),
+            )
+            for index in range(7)
+        )
+        await db.commit()
+        assert await sweep_expired_sessions(db, batch_size=3) == 7
+        assert await sweep_expired_sessions(db, batch_size=3) == 0
+    finally:
+        await db_generator.aclose()
+
+    live = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert live.status_code == 200
+
+
+@pytest.mark.anyio
+async def test_us_055_namespace_settings_are_served_from_the_registry(client: AsyncClient):
+    await create_userspace(client)
+    await register_user(client)
+
+    cached = await client.get("/userspaces/app-x")
+    assert cached.status_code == 200
+    assert cached.json()["registration_open"] is True
+    assert cached.json()["access_token_expire_minutes"] is None
+    assert query_count(cached) == 0
+    assert (await client.get("/userspaces/missing-space")).status_code == 404
+
+    settings_update = {
+        "registration_open": False,
+        "access_token_expire_minutes": 5,
+        "refresh_token_expire_days": 2,
+        "avatar_max_bytes": 2048,
+    }
+    assert (await client.patch("/userspaces/app-x", json=settings_update)).status_code == 401
+    updated = await client.patch("/userspaces/app-x", headers=admin_header(), json=settings_update)
+    assert updated.status_code == 200
+    served = await client.get("/userspaces/app-x")
+    assert served.json() == updated.json()
+    assert query_count(served) == 0
+
+    closed = await client.post(
+        "/auth/register",
+        json={"namespace": "app-x", "username": "bob", "password": "supersecret123"},
+    )
+    assert closed.status_code == 403
+    assert closed.json()["detail"] == "Registration is closed for this namespace"
+
+    tokens = (await login_user(client)).json()
+    access = decode_token(tokens["access_token"])
+    assert access["exp"] - access["iat"] == 5 * 60
+    refresh_response = await client.post("/auth/refresh", json={"refresh_token": tokens["refresh_token"]})
+    assert query_count(refresh_response) == 2
+    refreshed = refresh_response.json()
+    refresh = decode_token(refreshed["refresh_token"])
+    assert refresh["exp"] - refresh["iat"] == 2 * 24 * 60 * 60
+
+    too_large = await client.post(
+        "/users/me/avatar",
+        headers=auth_header(refreshed["access_token"]),
+        files={"file": ("avatar.png", b"a" * 2049, "image/png")},
+    )
+    assert too_large.status_code == 400
+    assert too_large.json()["detail"] == "File too large. Max size is 2048 bytes"
+
+    reset = await client.patch("/userspaces/app-x", headers=admin_header(), json={"access_token_expire_minutes": None})
+    assert reset.json()["access_token_expire_minutes"] is None
+    assert reset.json()["registration_open"] is False
+
+    # Creating a namespace needs no admin key, so it cannot set overrides.
+    created = await client.post(
+        "/userspaces",
+        json={"namespace": "app-open", "name": "Open", **settings_update},
+    )
+    assert created.status_code == 201
+    assert created.json()["registration_open"] is True
+    assert created.json()["avatar_max_bytes"] is None
+
+
+@pytest.mark.anyio
+async def test_us_056_namespace_registry_refreshes_incrementally(client: AsyncClient):
+    await create_userspace(client, "app-x")
+    await create_userspace(client, "app-y")
+    now = datetime.now(timezone.utc)
+
+    override_get_db = app.dependency_overrides[get_db]
+    db_generator = override_get_db()
+    db = await db_generator.__anext__()
+    try:
+        await db.execute(
+            update(UserSpace).where(UserSpace.namespace == "app-x").values(updated_at=now - timedelta(hours=1))
+        )
+        await db.commit()
+        namespace_registry.clear()
+        assert await namespace_registry.refresh(db) == 2
+
+        # Another worker closes registration for app-y.
+        await db.execute(
+            update(UserSpace)
+            .where(UserSpace.namespace == "app-y")
+            .values(registration_open=False, updated_at=now + timedelta(minutes=1))
+        )
+        await db.commit()
+        assert await namespace_registry.refresh(db) == 1
+    finally:
+        await db_generator.aclose()
+
+    assert (await client.get("/userspaces/app-y")).json()["registration_open"] is False
+    register = await client.post(
+        "/auth/register",
+        json={"namespace": "app-y", "username": "alice", "password": "supersecret123"},
+    )
+    assert register.status_code == 403
+
+    stats = (await client.get("/internal/stats", headers=admin_header())).json()["namespace_registry"]
+    assert stats["refreshes"] >= 2
+
+
+@pytest.mark.anyio
+async def test_us_057_legacy_refresh_tokens_are_exchanged_once_and_sessions_are_capped(client: AsyncClient):
+    await create_userspace(client)
+    tokens = await register_user(client)
+    me = decode_token(tokens["access_token"])
+    legacy = create_refresh_token(me["sub"], me["ver"])
+
+    exchanged = await client.post("/auth/refresh", json={"refresh_token": legacy})
+    assert exchanged.status_code == 200
+    replayed = await client.post("/auth/refresh", json={"refresh_token": legacy})
+    assert replayed.status_code == 401
+    assert replayed.json()["detail"] == "Refresh token reuse detected"
+    rotated = await client.post("/auth/refresh", json={"refresh_token": exchanged.json()["refresh_token"]})
+    assert rotated.status_code == 401
+    # The session is gone, but the token must not be exchangeable again.
+    again = await client.post("/auth/refresh", json={"refresh_token": legacy})
+    assert again.status_code == 401
+    assert again.json()["detail"] == "Refresh token is no longer valid"
+
+    current = decode_token((await login_user(client)).json()["access_token"])
+    signed_out = create_refresh_token(current["sub"], current["ver"])
+    migrated = await client.post("/auth/refresh", json={"refresh_token": signed_out})
+    assert migrated.status_code == 200
+    logout = await client.post("/auth/logout", headers=auth_header(migrated.json()["access_token"]))
+    assert logout.status_code == 204
+    after_logout = await client.post("/auth/refresh", json={"refresh_token": signed_out})
+    assert after_logout.status_code == 401
+    assert after_logout.json()["detail"] == "Refresh token is no longer valid"
+
+    original_cutoff = settings.legacy_refresh_tokens_until
+    settings.legacy_refresh_tokens_until = datetime.now(timezone.utc) - timedelta(seconds=1)
+    try:
+        expired = await client.post("/auth/refresh", json={"refresh_token": legacy})
+        assert expired.status_code == 401
+        assert expired.json()["detail"] == "Refresh token is no longer valid"
+    finally:
+        settings.legacy_refresh_tokens_until = original_cutoff
+
+    original_max_sessions = settings.refresh_session_max_per_user
+    settings.refresh_session_max_per_user = 3
+    try:
+        logins = [(await login_user(client)).json() for _ in range(5)]
+    finally:
+        settings.refresh_session_max_per_user = original_max_sessions
+    sessions = (await client.get("/auth/sessions", headers=auth_header(logins[-1]["access_token"]))).json()
+    assert len(sessions) == 3
+    oldest = await client.post("/auth/refresh", json={"refresh_token": logins[0]["refresh_token"]})
+    assert oldest.status_code == 401
+    newest = await client.post("/auth/refresh", json={"refresh_token": logins[-1]["refresh_token"]})
+    assert newest.status_code == 200